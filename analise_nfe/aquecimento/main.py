@@ -0,0 +1,158 @@
+"""
+Aquecimento do servidor e medida da inicialização
+
+O aquecimento (NFE_AQUECER=1, executado pelo gunicorn.conf.py no processo principal do Gunicorn, antes de criar os workers)
+importa a análise e lê um DANFE de exemplo com o pypdf, então os workers já nascem com tudo carregado.
+O tabula não é usado aqui porque a JVM não sobrevive ao fork: com NFE_TABULA_WORKER=1 cada worker aquece o tabula-java
+ao importar o main.py (aquecer_tabula)
+
+Uso da medida (em um processo novo, como um worker recém-criado):
+    python -m analise_nfe.aquecimento.main
+    python -m analise_nfe.aquecimento.main --aquecer
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import resource
+import sys
+import time
+
+from analise_nfe.metricas.main import registrar_inicializacao
+from analise_nfe.pdfs.tabula_worker import pdf_exemplo
+
+# Módulos carregados sob demanda pelas rotas de análise
+MODULOS_ANALISE = (
+    "numpy",
+    "pandas",
+    "pypdf",
+    "analise_nfe.processamento.main",
+    "analise_nfe.resposta.main",
+    "analise_nfe.catalogo.main",
+    "analise_nfe.jobs.main",
+)
+
+PASTA_RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CSV_EXEMPLO = os.path.join(PASTA_RAIZ, "PlanilhaExemplo", "Planilha G Rollz - Main.csv")
+
+
+def aquecimento_ativo():
+    return os.getenv("NFE_AQUECER", "0") == "1"
+
+
+def aquecer(pdf=None):
+    """
+    Importa os módulos da análise e lê um DANFE de exemplo (pdf ou o primeiro de NFeExemplo) \n
+    Retorna {importacao_s, danfe_s, numero_nota}
+    """
+    inicio = time.perf_counter()
+    for modulo in MODULOS_ANALISE:
+        importlib.import_module(modulo)
+    importacao = time.perf_counter() - inicio
+
+    numero_nota = None
+    pdf = pdf or pdf_exemplo()
+    if pdf:
+        numero_nota = ler_danfe_exemplo(pdf)
+    total = time.perf_counter() - inicio
+
+    registrar_inicializacao("aquecimento", total, importacao_s=round(importacao, 4), numero_nota=numero_nota)
+    return {"importacao_s": round(importacao, 4), "danfe_s": round(total - importacao, 4), "numero_nota": numero_nota}
+
+
+def ler_danfe_exemplo(pdf):
+    """
+    Passa um DANFE pelas etapas do pypdf (tabela de produtos, DataFrame e numero da nota), sem o tabula e sem o cache
+    """
+    from analise_nfe.pdfs.documento import abrir_documento
+    from analise_nfe.pdfs.extrator_pypdf import extrair_tabelas_produtos_pypdf
+    from analise_nfe.pdfs.main import montar_df_tabela, recuperar_numero_nota
+
+    with abrir_documento(pdf) as documento:
+        for linhas in extrair_tabelas_produtos_pypdf(documento) or []:
+            montar_df_tabela(linhas)
+        return recuperar_numero_nota(documento)
+
+
+def medir_inicializacao(aquecer_antes=False):
+    """
+    Mede a inicialização neste processo: importação do main.py e a primeira e a segunda requisição \n
+    a /processar_arquivos (DANFE de exemplo com o pypdf e a planilha de exemplo, sem cache) e o pico de RSS \n
+    Deve rodar em um processo novo para que nada já esteja importado
+    """
+    os.environ.setdefault("NFE_CACHE_ATIVO", "0")
+    # As duas requisições enviam os mesmos arquivos, então a segunda viria do cache de respostas
+    os.environ["NFE_CACHE_RESPOSTAS"] = "0"
+    medidas = {}
+
+    if aquecer_antes:
+        medidas["aquecimento"] = aquecer()
+
+    inicio = time.perf_counter()
+    import main
+    medidas["importacao_main_s"] = round(time.perf_counter() - inicio, 4)
+    medidas["pandas_carregado"] = "pandas" in sys.modules
+
+    cliente = main.app.test_client()
+    for requisicao in ("primeira_requisicao_s", "segunda_requisicao_s"):
+        inicio = time.perf_counter()
+        resposta = enviar_exemplo(cliente)
+        medidas[requisicao] = round(time.perf_counter() - inicio, 4)
+        medidas["codigo"] = resposta.status_code
+
+    medidas["rss_pico_mb"] = pico_rss_mb()
+
+    return medidas
+
+
+def pico_rss_mb():
+    """
+    Pico de RSS deste processo em MB \n
+    No Linux vem do VmHWM de /proc/self/status, já que o ru_maxrss de um processo novo começa com o pico do processo pai
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for linha in status:
+                if linha.startswith("VmHWM:"):
+                    return round(int(linha.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+
+    # ru_maxrss é em KB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def reiniciar_pico_rss():
+    """
+    Zera o pico de RSS (VmHWM) deste processo para medir o pico de uma etapa \n
+    Só existe no Linux (/proc/self/clear_refs); retorna False quando não foi possível, e aí o pico segue acumulado
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def enviar_exemplo(cliente):
+    with open(pdf_exemplo(), "rb") as pdf, open(CSV_EXEMPLO, "rb") as csv:
+        return cliente.post("/processar_arquivos", data={
+            "csv": (io.BytesIO(csv.read()), "planilha.csv"),
+            "pdfs": [(io.BytesIO(pdf.read()), "nota.pdf")],
+            "motor": "pypdf",
+        }, content_type="multipart/form-data")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Mede a inicialização do servidor")
+    parser.add_argument("--aquecer", action="store_true", help="executa o aquecimento antes de importar o main.py")
+    argumentos = parser.parse_args(argumentos)
+
+    print(json.dumps(medir_inicializacao(argumentos.aquecer)))
+
+
+if __name__ == "__main__":
+    main()
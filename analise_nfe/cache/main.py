@@ -0,0 +1,311 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Muda quando a leitura dos pdfs mudar, invalidando o que já está salvo
+VERSAO_CACHE = "2"
+
+# Tamanho de cada leitura ao calcular o SHA-256 ou copiar um arquivo
+TAMANHO_BLOCO = 1024 * 1024
+
+# Pasta do nivel em disco quando NFE_CACHE_DIR não é informado
+PASTA_CACHE_PADRAO = os.path.join(tempfile.gettempdir(), "nfe_cache")
+
+
+class CacheNFe:
+    """
+    Cache dos dados de nfe lidos de um pdf, identificado pelo SHA-256 dos bytes do pdf e pelo motor de leitura \n
+    Nivel em memória (LRU) e nivel em disco (sobrevive a reinicios), os dois limitados por tamanho \n
+    Os arquivos do disco e o total de bytes ficam em memória (lidos da pasta uma única vez, ao criar o cache), \n
+    então salvar não percorre a pasta; com vários workers cada um limita os arquivos que conhece \n
+    Cada entrada é o mesmo dicionario de get_dados_nfe_by_pdf {itens, codigo_nfe}
+    """
+
+    def __init__(self, pasta=None, max_bytes_memoria=64 * 1024 * 1024, max_bytes_disco=512 * 1024 * 1024):
+        self.pasta = pasta
+        self.max_bytes_memoria = max_bytes_memoria
+        self.max_bytes_disco = max_bytes_disco
+
+        self.memoria = OrderedDict()
+        self.bytes_memoria = 0
+        self.lock = threading.Lock()
+
+        # Arquivos do nivel em disco {chave: tamanho}, do usado há mais tempo para o mais recente
+        self.disco = OrderedDict()
+        self.bytes_disco = 0
+
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+
+        if self.pasta:
+            os.makedirs(self.pasta, exist_ok=True)
+            for chave, tamanho in self._arquivos_disco():
+                self.disco[chave] = tamanho
+                self.bytes_disco += tamanho
+
+    def recuperar(self, chave):
+        """
+        Recupera uma nfe do cache \n
+        Retorna None caso a chave não esteja em nenhum dos niveis
+        """
+        with self.lock:
+            if chave in self.memoria:
+                self.memoria.move_to_end(chave)
+                self.acertos_memoria += 1
+                return copiar_nfe(self.memoria[chave][0])
+
+        nfe = self._ler_disco(chave)
+
+        with self.lock:
+            if nfe is None:
+                self.falhas += 1
+                return None
+
+            self.acertos_disco += 1
+            self._guardar_memoria(chave, nfe)
+
+        return copiar_nfe(nfe)
+
+    def salvar(self, chave, nfe):
+        """
+        Salva uma nfe nos dois niveis do cache
+        """
+        nfe = copiar_nfe(nfe)
+
+        with self.lock:
+            self._guardar_memoria(chave, nfe)
+
+        self._gravar_disco(chave, nfe)
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de acertos e falhas e a ocupação de cada nivel
+        """
+        with self.lock:
+            return {
+                "acertos_memoria": self.acertos_memoria,
+                "acertos_disco": self.acertos_disco,
+                "falhas": self.falhas,
+                "itens_memoria": len(self.memoria),
+                "bytes_memoria": self.bytes_memoria,
+                "bytes_disco": self.bytes_disco,
+            }
+
+    def limpar(self):
+        """
+        Remove todas as entradas dos dois niveis
+        """
+        with self.lock:
+            self.memoria.clear()
+            self.bytes_memoria = 0
+            self.disco.clear()
+            self.bytes_disco = 0
+
+        for chave, _ in self._arquivos_disco():
+            remover_arquivo(self._caminho(chave))
+
+    def _guardar_memoria(self, chave, nfe):
+        tamanho = tamanho_nfe(nfe)
+
+        if chave in self.memoria:
+            self.bytes_memoria -= self.memoria.pop(chave)[1]
+
+        # Entradas maiores que o nivel inteiro não ficam em memória
+        if tamanho > self.max_bytes_memoria:
+            return
+
+        self.memoria[chave] = (nfe, tamanho)
+        self.bytes_memoria += tamanho
+
+        # Remove as entradas usadas há mais tempo até caber no limite
+        while self.bytes_memoria > self.max_bytes_memoria:
+            _, (_, tamanho_removido) = self.memoria.popitem(last=False)
+            self.bytes_memoria -= tamanho_removido
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.pkl")
+
+    def _ler_disco(self, chave):
+        if not self.pasta:
+            return None
+
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as arquivo:
+                nfe = pickle.load(arquivo)
+                tamanho = os.fstat(arquivo.fileno()).st_size
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        # Atualiza a data de modificação para a ordem de uso depois de um reinicio
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+
+        # O arquivo pode ter sido gravado por outro worker
+        with self.lock:
+            self._registrar_disco(chave, tamanho)
+
+        return nfe
+
+    def _gravar_disco(self, chave, nfe):
+        if not self.pasta:
+            return
+
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, "wb") as arquivo:
+                pickle.dump(nfe, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+                tamanho = arquivo.tell()
+            os.replace(temporario, caminho)
+        except OSError:
+            remover_arquivo(temporario)
+            return
+
+        with self.lock:
+            self._registrar_disco(chave, tamanho)
+            removidos = self._limitar_disco()
+
+        for chave_removida in removidos:
+            remover_arquivo(self._caminho(chave_removida))
+
+    def _registrar_disco(self, chave, tamanho):
+        self.bytes_disco += tamanho - self.disco.pop(chave, 0)
+        self.disco[chave] = tamanho
+
+    def _limitar_disco(self):
+        """
+        Tira do total os arquivos usados há mais tempo até caber no limite \n
+        Retorna as chaves que devem ser removidas do disco
+        """
+        removidos = []
+        while self.bytes_disco > self.max_bytes_disco and self.disco:
+            chave, tamanho = self.disco.popitem(last=False)
+            self.bytes_disco -= tamanho
+            removidos.append(chave)
+        return removidos
+
+    def _arquivos_disco(self):
+        """
+        Percorre a pasta uma vez e retorna [(chave, tamanho)] do arquivo usado há mais tempo para o mais recente
+        """
+        if not self.pasta:
+            return []
+
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith(".pkl"):
+                continue
+            try:
+                info = os.stat(os.path.join(self.pasta, nome))
+            except OSError:
+                continue
+            arquivos.append((info.st_mtime, nome[:-len(".pkl")], info.st_size))
+
+        return [(chave, tamanho) for _, chave, tamanho in sorted(arquivos)]
+
+
+def copiar_nfe(nfe):
+    """
+    Copia o dicionario da nfe para que quem usa o cache não altere o DataFrame guardado
+    """
+    return {"itens": nfe["itens"].copy(), "codigo_nfe": nfe["codigo_nfe"]}
+
+
+def tamanho_nfe(nfe):
+    """
+    Estima quantos bytes a nfe ocupa em memória
+    """
+    return int(nfe["itens"].memory_usage(index=True, deep=True).sum()) + len(str(nfe["codigo_nfe"]))
+
+
+def remover_arquivo(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def calcular_sha256(arquivo):
+    """
+    Calcula o SHA-256 de um arquivo aberto lendo em blocos
+    """
+    sha256 = hashlib.sha256()
+
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b""):
+        sha256.update(bloco)
+    arquivo.seek(0)
+
+    return sha256.hexdigest()
+
+
+def sha256_upload(arquivo):
+    """
+    SHA-256 de um arquivo enviado, calculado uma única vez e guardado no próprio arquivo (sha256_nfe) \n
+    A chave do cache de respostas e o DocumentoPDF da mesma requisição usam o mesmo valor
+    """
+    sha256 = getattr(arquivo, "sha256_nfe", None)
+    if sha256 is None:
+        sha256 = calcular_sha256(arquivo)
+        try:
+            arquivo.sha256_nfe = sha256
+        except AttributeError:
+            pass
+
+    return sha256
+
+
+def chave_sha256(sha256, motor=None, modo_tabula=None):
+    """
+    Calcula a chave do cache a partir do SHA-256 (hexadecimal) já calculado do pdf \n
+    e das opções de leitura (ver opcoes_leitura), já que cada motor pode devolver itens diferentes
+    """
+    return f"{VERSAO_CACHE}-{opcoes_leitura(motor, modo_tabula)}-{sha256}"
+
+
+def opcoes_leitura(motor=None, modo_tabula=None):
+    """
+    Motor de extração, modo do tabula e NFE_TABULA_AREA usados na leitura, com os mesmos padrões de \n
+    get_dados_nfe_by_pdf (ex: "pypdf-documento-area1")
+    """
+    motor = motor or os.getenv("NFE_MOTOR_PDF", "tabula")
+    modo_tabula = modo_tabula or os.getenv("NFE_TABULA_MODO", "documento")
+    return f"{motor}-{modo_tabula}-area{os.getenv('NFE_TABULA_AREA', '1')}"
+
+
+def cache_ativo():
+    """
+    O cache pode ser desligado com NFE_CACHE_ATIVO=0
+    """
+    return os.getenv("NFE_CACHE_ATIVO", "1") != "0"
+
+
+_cache_nfe = None
+_lock_cache_nfe = threading.Lock()
+
+
+def obter_cache_nfe():
+    """
+    Retorna o cache compartilhado do processo, criado a partir das variaveis de ambiente \n
+    NFE_CACHE_DIR (nivel em disco, padrão PASTA_CACHE_PADRAO), NFE_CACHE_MEMORIA_MB \n
+    e NFE_CACHE_DISCO_MB (0 desliga o nivel em disco)
+    """
+    global _cache_nfe
+
+    with _lock_cache_nfe:
+        if _cache_nfe is None:
+            max_bytes_disco = int(float(os.getenv("NFE_CACHE_DISCO_MB", "512")) * 1024 * 1024)
+            _cache_nfe = CacheNFe(
+                pasta=(os.getenv("NFE_CACHE_DIR") or PASTA_CACHE_PADRAO) if max_bytes_disco > 0 else None,
+                max_bytes_memoria=int(float(os.getenv("NFE_CACHE_MEMORIA_MB", "64")) * 1024 * 1024),
+                max_bytes_disco=max_bytes_disco,
+            )
+
+        return _cache_nfe
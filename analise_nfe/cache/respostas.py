@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from analise_nfe.cache.main import cache_ativo, sha256_upload
+from analise_nfe.metricas.main import registrar_cache_resposta
+
+# Muda quando o formato da resposta de /processar_arquivos mudar, invalidando o que já está salvo
+VERSAO_RESPOSTAS = "1"
+
+
+class CacheRespostas:
+    """
+    Cache das respostas de /processar_arquivos já codificadas (bytes), identificadas por chave_resposta \n
+    LRU em memória limitado por max_bytes, e cada entrada vale por ttl segundos \n
+    Cada entrada é um dicionario {corpo, codigo, etag, expira_em}, a etag é a própria chave
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600, relogio=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.relogio = relogio
+
+        self.entradas = OrderedDict()
+        self.bytes_memoria = 0
+        self.lock = threading.Lock()
+
+        self.acertos = 0
+        self.falhas = 0
+
+    def recuperar(self, chave):
+        """
+        Recupera uma resposta do cache \n
+        Retorna None caso a chave não exista ou a entrada já tenha expirado
+        """
+        with self.lock:
+            entrada = self.entradas.get(chave)
+            if entrada is not None and entrada["expira_em"] <= self.relogio():
+                self._remover(chave)
+                entrada = None
+
+            if entrada is None:
+                self.falhas += 1
+                registrar_cache_resposta(False)
+                return None
+
+            self.entradas.move_to_end(chave)
+            self.acertos += 1
+            registrar_cache_resposta(True)
+            return entrada
+
+    def salvar(self, chave, corpo, codigo):
+        """
+        Guarda a resposta codificada, descartando as menos usadas até caber em max_bytes \n
+        Respostas maiores que max_bytes não são guardadas \n
+        Retorna a entrada (com a etag) mesmo quando ela não é guardada
+        """
+        entrada = {
+            "corpo": corpo,
+            "codigo": codigo,
+            "etag": chave,
+            "expira_em": self.relogio() + self.ttl,
+        }
+        if len(corpo) > self.max_bytes:
+            return entrada
+
+        with self.lock:
+            if chave in self.entradas:
+                self._remover(chave)
+
+            self.entradas[chave] = entrada
+            self.bytes_memoria += len(corpo)
+
+            while self.bytes_memoria > self.max_bytes:
+                self._remover(next(iter(self.entradas)))
+
+        return entrada
+
+    def estatisticas(self):
+        with self.lock:
+            return {
+                "entradas": len(self.entradas),
+                "bytes_memoria": self.bytes_memoria,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+            }
+
+    def limpar(self):
+        with self.lock:
+            self.entradas.clear()
+            self.bytes_memoria = 0
+
+    def _remover(self, chave):
+        entrada = self.entradas.pop(chave)
+        self.bytes_memoria -= len(entrada["corpo"])
+
+
+def chave_resposta(pdfs, xmls, csv_file=None, catalogo_versao=None, **opcoes):
+    """
+    Impressão digital de uma requisição de /processar_arquivos \n
+    SHA-256 da planilha (ou a versão do catálogo), dos SHA-256 ordenados das notas e das opções \n
+    A ordem em que as notas foram enviadas não muda a chave, já que a resposta não depende dela \n
+    O SHA-256 de cada nota fica no arquivo (ver sha256_upload) e o DocumentoPDF não lê a nota de novo para calculá-lo
+    """
+    notas = sorted(
+        [("pdfs", sha256_upload(arquivo), arquivo.filename) for arquivo in pdfs]
+        + [("xmls", sha256_upload(arquivo), arquivo.filename) for arquivo in xmls]
+    )
+    planilha = f"catalogo:{catalogo_versao}" if catalogo_versao else f"csv:{sha256_upload(csv_file)}"
+
+    sha256 = hashlib.sha256()
+    sha256.update(f"{VERSAO_RESPOSTAS}\n{planilha}\n".encode())
+    for campo, sha256_nota, nome_arquivo in notas:
+        sha256.update(f"{campo}:{sha256_nota}:{nome_arquivo}\n".encode())
+    for opcao, valor in sorted(opcoes.items()):
+        sha256.update(f"{opcao}={valor}\n".encode())
+
+    return sha256.hexdigest()
+
+
+def cache_respostas_ativo():
+    """
+    O cache de respostas pode ser desligado com NFE_CACHE_RESPOSTAS=0 (ou com NFE_CACHE_ATIVO=0)
+    """
+    return cache_ativo() and os.getenv("NFE_CACHE_RESPOSTAS", "1") != "0"
+
+
+_cache_respostas = None
+_lock_cache_respostas = threading.Lock()
+
+
+def obter_cache_respostas():
+    """
+    Retorna o cache de respostas compartilhado do processo, criado a partir das variaveis de ambiente \n
+    NFE_CACHE_RESPOSTAS_MB e NFE_CACHE_RESPOSTAS_TTL (segundos)
+    """
+    global _cache_respostas
+
+    with _lock_cache_respostas:
+        if _cache_respostas is None:
+            _cache_respostas = CacheRespostas(
+                max_bytes=int(float(os.getenv("NFE_CACHE_RESPOSTAS_MB", "64")) * 1024 * 1024),
+                ttl=float(os.getenv("NFE_CACHE_RESPOSTAS_TTL", "600")),
+            )
+
+        return _cache_respostas
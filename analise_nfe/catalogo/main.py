@@ -0,0 +1,233 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from analise_nfe.cache.main import remover_arquivo
+from analise_nfe.produtos.main import carregar_planilha, recuperar_planilhas
+from analise_nfe.sugestoes.main import IndiceCodigos
+
+# Quantidade de caracteres do SHA-256 usados como identificador da versão
+TAMANHO_VERSAO = 16
+# Menor prefixo do SHA-256 aceito para buscar uma versão
+TAMANHO_MINIMO_PREFIXO = 8
+
+
+class Catalogo:
+    """
+    Planilha de custos já validada e normalizada por recuperar_planilhas \n
+    resposta: o mesmo dicionario de recuperar_planilhas {codigo, planilha, planilhaDuplicados, custosInvalidos} \n
+    indice: planilha indexada por "Cod", usada por analisar_notas no lugar do merge \n
+    indice_codigos: IndiceCodigos das sugestões, montado só quando algum item não for encontrado
+    """
+
+    def __init__(self, info, resposta):
+        self.info = info
+        self.resposta = resposta
+        self.indice = montar_indice(resposta["planilha"])
+        self._indice_codigos = None
+
+    @property
+    def versao(self):
+        return self.info["versao"]
+
+    @property
+    def planilha(self):
+        return self.resposta["planilha"]
+
+    @property
+    def indice_codigos(self):
+        if self._indice_codigos is None:
+            self._indice_codigos = IndiceCodigos(self.planilha["Cod"])
+        return self._indice_codigos
+
+
+class RepositorioCatalogos:
+    """
+    Guarda as versões do catálogo de custos em disco, identificadas pelo SHA-256 do csv \n
+    Cada versão é um pickle com a resposta de recuperar_planilhas, o csv é validado uma única vez \n
+    indice.json lista as versões e a mais recente é a versão "atual" \n
+    As versões usadas ficam em memória (LRU) para não ler o pickle a cada requisição
+    """
+
+    def __init__(self, pasta, max_memoria=4):
+        self.pasta = pasta
+        self.max_memoria = max_memoria
+        self.memoria = OrderedDict()
+        self.lock = threading.Lock()
+
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def salvar(self, conteudo, nome_arquivo=None):
+        """
+        Valida e guarda uma planilha de custos (csv, parquet ou xlsx, pela extensão de nome_arquivo) \n
+        Retorna {codigo, versao, ...informações da versão} \n
+        codigo 201 para uma versão nova, 200 se o mesmo csv já estava salvo \n
+        ou a resposta de erro de recuperar_planilhas se as colunas forem inválidas
+        """
+        sha256 = hashlib.sha256(conteudo).hexdigest()
+        versao = sha256[:TAMANHO_VERSAO]
+
+        with self.lock:
+            versoes = self._ler_indice()
+            existente = next((info for info in versoes if info["versao"] == versao), None)
+            if existente:
+                # Reenviar um csv antigo o torna a versão atual de novo
+                versoes.remove(existente)
+                versoes.append(existente)
+                self._gravar_indice(versoes)
+                return {"codigo": 200, **existente}
+
+        resposta = recuperar_planilhas(carregar_planilha(io.BytesIO(conteudo), nome_arquivo or "planilha.csv"))
+        if resposta["codigo"] not in (200, 203):
+            return resposta
+
+        info = {
+            "versao": versao,
+            "sha256": sha256,
+            "nome_arquivo": nome_arquivo,
+            "criado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "linhas": len(resposta["planilha"]),
+            "duplicados": len(resposta.get("planilhaDuplicados", [])),
+            "custos_invalidos": len(resposta["custosInvalidos"]),
+        }
+        catalogo = Catalogo(info, resposta)
+
+        caminho = self._caminho(versao)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, "wb") as arquivo:
+                pickle.dump({"info": info, "resposta": resposta}, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, caminho)
+        except OSError:
+            remover_arquivo(temporario)
+            raise
+
+        with self.lock:
+            versoes = [item for item in self._ler_indice() if item["versao"] != versao]
+            versoes.append(info)
+            self._gravar_indice(versoes)
+            self._guardar_memoria(catalogo)
+
+        return {"codigo": 201, **info}
+
+    def carregar(self, versao=None, erros=None):
+        """
+        Recupera um Catalogo pela versão (ou prefixo do SHA-256 com pelo menos TAMANHO_MINIMO_PREFIXO caracteres) \n
+        Sem versão (ou "atual") retorna a versão mais recente \n
+        Retorna None caso a versão não exista, ou se o prefixo for curto ou de mais de uma versão \n
+        (nesses dois casos o motivo vai para a lista erros)
+        """
+        with self.lock:
+            info, erro = self._procurar(versao)
+            if info is None:
+                if erro and erros is not None:
+                    erros.append(erro)
+                return None
+
+            if info["versao"] in self.memoria:
+                self.memoria.move_to_end(info["versao"])
+                return self.memoria[info["versao"]]
+
+        try:
+            with open(self._caminho(info["versao"]), "rb") as arquivo:
+                dados = pickle.load(arquivo)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        catalogo = Catalogo(dados["info"], dados["resposta"])
+
+        with self.lock:
+            self._guardar_memoria(catalogo)
+
+        return catalogo
+
+    def listar(self):
+        """
+        Informações de todas as versões, da mais recente para a mais antiga
+        """
+        with self.lock:
+            return list(reversed(self._ler_indice()))
+
+    def _procurar(self, versao):
+        """
+        Retorna (info, erro): a versão exata, ou a única versão cujo SHA-256 começa com o prefixo \n
+        Prefixos curtos ou de mais de uma versão não escolhem nenhuma, para não usar o catálogo errado
+        """
+        versoes = self._ler_indice()
+        if not versao or versao == "atual":
+            return (versoes[-1] if versoes else None), None
+
+        versao = versao.lower()
+        exata = next((info for info in versoes if versao in (info["versao"], info["sha256"])), None)
+        if exata is not None:
+            return exata, None
+
+        if len(versao) < TAMANHO_MINIMO_PREFIXO:
+            return None, f"A versão do catálogo precisa ter pelo menos {TAMANHO_MINIMO_PREFIXO} caracteres"
+
+        encontradas = [info for info in versoes if info["sha256"].startswith(versao)]
+        if len(encontradas) > 1:
+            return None, f"A versão '{versao}' corresponde a mais de um catálogo: {[info['versao'] for info in encontradas]}"
+
+        return (encontradas[0] if encontradas else None), None
+
+    def _guardar_memoria(self, catalogo):
+        self.memoria[catalogo.versao] = catalogo
+        self.memoria.move_to_end(catalogo.versao)
+
+        while len(self.memoria) > self.max_memoria:
+            self.memoria.popitem(last=False)
+
+    def _caminho(self, versao):
+        return os.path.join(self.pasta, f"{versao}.pkl")
+
+    def _caminho_indice(self):
+        return os.path.join(self.pasta, "indice.json")
+
+    def _ler_indice(self):
+        try:
+            with open(self._caminho_indice(), encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return []
+
+    def _gravar_indice(self, versoes):
+        caminho = self._caminho_indice()
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(versoes, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho)
+
+
+def montar_indice(planilha):
+    """
+    Monta o DataFrame indexado por "Cod" (códigos repetidos continuam repetidos, como no merge) \n
+    A tabela de hash do index é criada aqui, uma vez por versão do catálogo
+    """
+    indice = planilha.set_index("Cod")
+    indice.index.get_indexer_for(indice.index[:1])
+    return indice
+
+
+_repositorio = None
+_lock_repositorio = threading.Lock()
+
+
+def obter_repositorio_catalogos():
+    """
+    Retorna o repositório compartilhado do processo, na pasta NFE_CATALOGO_DIR (padrão "catalogos")
+    """
+    global _repositorio
+
+    with _lock_repositorio:
+        if _repositorio is None:
+            _repositorio = RepositorioCatalogos(os.getenv("NFE_CATALOGO_DIR") or "catalogos")
+
+        return _repositorio
@@ -0,0 +1,383 @@
+import contextlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from analise_nfe.cache.main import remover_arquivo
+from analise_nfe.catalogo.main import obter_repositorio_catalogos
+from analise_nfe.processamento.main import processar_arquivos_nfe
+from analise_nfe.resposta.main import codificar_resposta
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+# Campos dos arquivos enviados que são notas (contam no progresso)
+CAMPOS_NOTAS = ("pdfs", "xmls")
+
+logger = logging.getLogger(__name__)
+
+
+class RepositorioJobs:
+    """
+    Estado dos jobs em um banco SQLite, que sobrevive a reinicios e é compartilhado pelos workers do gunicorn \n
+    Cada operação abre a sua conexão, então o repositório pode ser usado por várias threads
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    parametros TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    lidas INTEGER NOT NULL DEFAULT 0,
+                    codigo INTEGER,
+                    erro TEXT,
+                    pid INTEGER,
+                    instancia TEXT,
+                    criado_em TEXT NOT NULL,
+                    atualizado_em TEXT NOT NULL
+                )
+                """
+            )
+
+            # Bancos criados antes da coluna instancia
+            colunas = {linha["name"] for linha in conexao.execute("PRAGMA table_info(jobs)")}
+            if "instancia" not in colunas:
+                conexao.execute("ALTER TABLE jobs ADD COLUMN instancia TEXT")
+
+    def criar(self, job_id, parametros, total):
+        agora = agora_iso()
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT INTO jobs (id, estado, parametros, total, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, PENDENTE, json.dumps(parametros, ensure_ascii=False), total, agora, agora),
+            )
+
+    def reservar(self, job_id, pid, instancia=None):
+        """
+        Passa o job de pendente para processando no processo pid \n
+        instancia: identificação do processo (instancia_processo), que continua única com o pid reutilizado \n
+        Retorna False se outro worker já reservou o job
+        """
+        with self._conectar() as conexao:
+            cursor = conexao.execute(
+                "UPDATE jobs SET estado = ?, pid = ?, instancia = ?, atualizado_em = ? WHERE id = ? AND estado = ?",
+                (PROCESSANDO, pid, instancia, agora_iso(), job_id, PENDENTE),
+            )
+            return cursor.rowcount == 1
+
+    def atualizar_progresso(self, job_id, lidas):
+        self._atualizar(job_id, lidas=lidas)
+
+    def concluir(self, job_id, codigo):
+        self._atualizar(job_id, estado=CONCLUIDO, codigo=codigo)
+
+    def falhar(self, job_id, erro):
+        self._atualizar(job_id, estado=ERRO, codigo=500, erro=erro)
+
+    def consultar(self, job_id):
+        """
+        Retorna o job como dicionario (com os parametros) ou None
+        """
+        with self._conectar() as conexao:
+            linha = conexao.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        if linha is None:
+            return None
+
+        job = dict(linha)
+        job["parametros"] = json.loads(job["parametros"])
+        return job
+
+    def retomar(self):
+        """
+        Devolve para pendente os jobs que estavam processando em um worker que não existe mais \n
+        O worker é procurado pela instancia gravada em reservar: um processo novo com o mesmo pid \n
+        (depois de um reinicio) tem outra instancia, então o job volta para a fila \n
+        Retorna os ids de todos os jobs pendentes, do mais antigo para o mais novo
+        """
+        with self._conectar() as conexao:
+            processando = conexao.execute(
+                "SELECT id, pid, instancia FROM jobs WHERE estado = ?", (PROCESSANDO,)
+            ).fetchall()
+
+            for linha in processando:
+                if not linha["pid"] or instancia_processo(linha["pid"]) != linha["instancia"]:
+                    conexao.execute(
+                        "UPDATE jobs SET estado = ?, lidas = 0, pid = NULL, instancia = NULL WHERE id = ? AND estado = ?",
+                        (PENDENTE, linha["id"], PROCESSANDO),
+                    )
+
+            pendentes = conexao.execute(
+                "SELECT id FROM jobs WHERE estado = ? ORDER BY criado_em", (PENDENTE,)
+            ).fetchall()
+
+        return [linha["id"] for linha in pendentes]
+
+    def remover_antigos(self, limite):
+        """
+        Remove os jobs concluidos ou com erro atualizados antes de limite (datetime) \n
+        Retorna os ids removidos
+        """
+        with self._conectar() as conexao:
+            antigos = conexao.execute(
+                "SELECT id FROM jobs WHERE estado IN (?, ?) AND atualizado_em < ?",
+                (CONCLUIDO, ERRO, limite.isoformat(timespec="seconds")),
+            ).fetchall()
+            conexao.executemany("DELETE FROM jobs WHERE id = ?", [(linha["id"],) for linha in antigos])
+
+        return [linha["id"] for linha in antigos]
+
+    def _atualizar(self, job_id, **campos):
+        campos["atualizado_em"] = agora_iso()
+        atribuicoes = ", ".join(f"{campo} = ?" for campo in campos)
+
+        with self._conectar() as conexao:
+            conexao.execute(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), job_id))
+
+    @contextlib.contextmanager
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        conexao.row_factory = sqlite3.Row
+        try:
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+
+class GerenciadorJobs:
+    """
+    Executa /processar_arquivos em segundo plano: os arquivos enviados ficam em disco, \n
+    o estado no RepositorioJobs e um pool de threads processa os jobs \n
+    Ao iniciar, os jobs pendentes (ou interrompidos por um reinicio) voltam para a fila \n
+    (o gerenciador é criado na inicialização de cada worker, ver gunicorn.conf.py)
+    """
+
+    def __init__(self, pasta, workers=1, retencao_horas=24):
+        self.pasta = pasta
+        self.retencao_horas = retencao_horas
+        os.makedirs(self.pasta, exist_ok=True)
+
+        self.repositorio = RepositorioJobs(os.path.join(self.pasta, "jobs.sqlite3"))
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nfe-job")
+
+        for job_id in self.repositorio.retomar():
+            self.pool.submit(self._executar, job_id)
+
+    def enviar(self, arquivos, parametros):
+        """
+        Cria um job e o coloca na fila \n
+        arquivos: lista [(campo, nome_arquivo, arquivo)] com campo "csv", "pdfs" ou "xmls" \n
+        parametros: {catalogo_versao, motor, centavos} \n
+        Retorna o job como em consultar
+        """
+        self._remover_antigos()
+
+        job_id = uuid.uuid4().hex
+        pasta_entrada = os.path.join(self._pasta_job(job_id), "entrada")
+        os.makedirs(pasta_entrada)
+
+        entradas = []
+        for posicao, (campo, nome_arquivo, arquivo) in enumerate(arquivos):
+            caminho = os.path.join(pasta_entrada, str(posicao))
+            with open(caminho, "wb") as destino:
+                shutil.copyfileobj(arquivo, destino)
+            entradas.append({"campo": campo, "nome": nome_arquivo, "caminho": caminho})
+
+        total = sum(1 for entrada in entradas if entrada["campo"] in CAMPOS_NOTAS)
+        self.repositorio.criar(job_id, {**parametros, "arquivos": entradas}, total)
+        self.pool.submit(self._executar, job_id)
+
+        return self.consultar(job_id)
+
+    def consultar(self, job_id):
+        """
+        Estado e progresso do job (notas lidas / total) ou None se não existir
+        """
+        job = self.repositorio.consultar(job_id)
+        if job is None:
+            return None
+
+        return {
+            "job_id": job["id"],
+            "estado": job["estado"],
+            "notas_lidas": job["lidas"],
+            "total_notas": job["total"],
+            "codigo": job["codigo"],
+            "erro": job["erro"],
+            "criado_em": job["criado_em"],
+            "atualizado_em": job["atualizado_em"],
+        }
+
+    def resultado(self, job_id):
+        """
+        Resposta de /processar_arquivos do job concluido (None enquanto não terminar)
+        """
+        try:
+            with open(self._caminho_resultado(job_id), encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+    def _executar(self, job_id):
+        if not self.repositorio.reservar(job_id, os.getpid(), instancia_processo()):
+            return
+
+        job = self.repositorio.consultar(job_id)
+        lidas = [0]
+
+        def progresso(_nome):
+            lidas[0] += 1
+            self.repositorio.atualizar_progresso(job_id, lidas[0])
+
+        try:
+            resposta, codigo = executar_job(job["parametros"], progresso)
+            gravar_json(self._caminho_resultado(job_id), resposta, job["parametros"].get("formato", "registros"))
+            self.repositorio.concluir(job_id, codigo)
+        except Exception as e:
+            self.repositorio.falhar(job_id, str(e))
+        finally:
+            shutil.rmtree(os.path.join(self._pasta_job(job_id), "entrada"), ignore_errors=True)
+
+    def _remover_antigos(self):
+        limite = datetime.now(timezone.utc) - timedelta(hours=self.retencao_horas)
+        for job_id in self.repositorio.remover_antigos(limite):
+            shutil.rmtree(self._pasta_job(job_id), ignore_errors=True)
+
+    def _pasta_job(self, job_id):
+        return os.path.join(self.pasta, job_id)
+
+    def _caminho_resultado(self, job_id):
+        return os.path.join(self._pasta_job(job_id), "resultado.json")
+
+
+def executar_job(parametros, progresso=None):
+    """
+    Processa um job a partir dos arquivos salvos em disco \n
+    Retorna (resposta, codigo_http) de processar_arquivos_nfe
+    """
+    catalogo = None
+    if parametros.get("catalogo_versao"):
+        catalogo = obter_repositorio_catalogos().carregar(parametros["catalogo_versao"])
+        if catalogo is None:
+            return {"error": f"Catálogo '{parametros['catalogo_versao']}' não encontrado"}, 404
+
+    with contextlib.ExitStack() as pilha:
+        arquivos = {"csv": [], "pdfs": [], "xmls": []}
+        for entrada in parametros["arquivos"]:
+            arquivo = pilha.enter_context(open(entrada["caminho"], "rb"))
+            # Mesmo atributo dos uploads do Flask
+            arquivo.filename = entrada["nome"]
+            arquivos[entrada["campo"]].append(arquivo)
+
+        return processar_arquivos_nfe(
+            arquivos["pdfs"],
+            arquivos["xmls"],
+            csv_file=arquivos["csv"][0] if arquivos["csv"] else None,
+            catalogo=catalogo,
+            motor=parametros.get("motor"),
+            centavos=parametros.get("centavos", False),
+            progresso=progresso,
+        )
+
+
+def gravar_json(caminho, dados, formato="registros"):
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(codificar_resposta(dados, formato))
+        os.replace(temporario, caminho)
+    except OSError:
+        remover_arquivo(temporario)
+        raise
+
+
+def instancia_processo(pid=None):
+    """
+    Identificação de um processo que não se repete quando o pid é reutilizado: "boot_id:pid:inicio" \n
+    inicio é o starttime de /proc/<pid>/stat e boot_id muda a cada boot da máquina \n
+    Sem /proc (fora do Linux) fica só o pid \n
+    Retorna None se o processo não existir
+    """
+    pid = pid or os.getpid()
+
+    if not os.path.isdir("/proc"):
+        return str(pid) if processo_ativo(pid) else None
+
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as arquivo:
+            estado = arquivo.read()
+        with open("/proc/sys/kernel/random/boot_id", encoding="utf-8") as arquivo:
+            boot_id = arquivo.read().strip()
+    except OSError:
+        return None
+
+    # O nome do processo (entre parenteses) pode ter espaços, os campos contam a partir do ")"
+    inicio = estado.rsplit(")", 1)[1].split()[19]
+    return f"{boot_id}:{pid}:{inicio}"
+
+
+def processo_ativo(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def agora_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+_gerenciador = None
+_lock_gerenciador = threading.Lock()
+
+
+def obter_gerenciador_jobs():
+    """
+    Retorna o gerenciador compartilhado do processo \n
+    Pasta em NFE_JOBS_DIR (padrão "jobs"), NFE_JOBS_WORKERS threads (padrão 1) \n
+    e resultados guardados por NFE_JOBS_RETENCAO_HORAS (padrão 24)
+    """
+    global _gerenciador
+
+    with _lock_gerenciador:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorJobs(
+                os.getenv("NFE_JOBS_DIR") or "jobs",
+                int(os.getenv("NFE_JOBS_WORKERS", "1")),
+                float(os.getenv("NFE_JOBS_RETENCAO_HORAS", "24")),
+            )
+
+        return _gerenciador
+
+
+def retomar_jobs():
+    """
+    Cria o gerenciador na inicialização do worker, o que devolve para a fila os jobs pendentes e os interrompidos \n
+    por um reinicio, mesmo em um worker que só atende /processar_arquivos sem 'assincrono' \n
+    Um erro aqui não derruba o worker, os jobs são retomados na próxima vez que o gerenciador for criado
+    """
+    try:
+        obter_gerenciador_jobs()
+    except Exception:
+        logger.warning("Erro ao retomar os jobs", exc_info=True)
@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Atributos que todo LogRecord tem; o resto veio do extra={...} e vai para o log estruturado
+ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class FormatadorJson(logging.Formatter):
+    """
+    Uma linha JSON por log: {momento, nivel, logger, mensagem, ...campos do extra}
+    """
+
+    def format(self, record):
+        registro = {
+            "momento": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+        }
+        registro.update({chave: valor for chave, valor in vars(record).items() if chave not in ATRIBUTOS_PADRAO})
+
+        if record.exc_info:
+            registro["excecao"] = self.formatException(record.exc_info)
+
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+class FormatadorTexto(logging.Formatter):
+    """
+    Log em texto com os campos do extra no fim da linha (chave=valor)
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        texto = super().format(record)
+        campos = " ".join(f"{chave}={valor}" for chave, valor in vars(record).items() if chave not in ATRIBUTOS_PADRAO)
+        return f"{texto} {campos}" if campos else texto
+
+
+def configurar_logs():
+    """
+    Configura os logs de analise_nfe e emissao_nfe no stderr \n
+    NFE_LOG_NIVEL (padrão INFO) e NFE_LOG_FORMATO ("json" ou "texto", padrão "texto")
+    """
+    nivel = os.getenv("NFE_LOG_NIVEL", "INFO").upper()
+    formatador = FormatadorJson() if os.getenv("NFE_LOG_FORMATO", "texto") == "json" else FormatadorTexto()
+
+    for nome in ("analise_nfe", "emissao_nfe"):
+        logger = logging.getLogger(nome)
+        logger.setLevel(nivel)
+        if not any(getattr(handler, "nfe", False) for handler in logger.handlers):
+            handler = logging.StreamHandler(sys.stderr)
+            handler.nfe = True
+            logger.addHandler(handler)
+        for handler in logger.handlers:
+            if getattr(handler, "nfe", False):
+                handler.setFormatter(formatador)
+        logger.propagate = False
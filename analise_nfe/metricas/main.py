@@ -0,0 +1,290 @@
+import bisect
+import contextlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos baldes dos histogramas de tempo
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Limites dos baldes da quantidade de páginas de cada pdf
+BALDES_PAGINAS = (1, 2, 3, 5, 10, 20, 50)
+
+
+class Contador:
+    """
+    Contador acumulado (counter do Prometheus), um valor para cada combinação de rótulos
+    """
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = chave_rotulos(self.rotulos, rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        with self.lock:
+            return self.valores.get(chave_rotulos(self.rotulos, rotulos), 0)
+
+    def amostras(self):
+        with self.lock:
+            valores = dict(self.valores)
+        return [(self.nome, dict(zip(self.rotulos, chave)), valor) for chave, valor in sorted(valores.items())]
+
+
+class Histograma:
+    """
+    Distribuição dos valores observados em baldes (histogram do Prometheus) \n
+    Guarda apenas a contagem de cada balde, a soma e a quantidade para cada combinação de rótulos
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.baldes = tuple(sorted(baldes))
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, **rotulos):
+        chave = chave_rotulos(self.rotulos, rotulos)
+        # O balde "le" inclui o próprio limite, o último (len(baldes)) é o +Inf
+        balde = bisect.bisect_left(self.baldes, valor)
+        with self.lock:
+            contagens, soma, quantidade = self.series.get(chave) or ([0] * (len(self.baldes) + 1), 0.0, 0)
+            contagens[balde] += 1
+            self.series[chave] = (contagens, soma + valor, quantidade + 1)
+
+    def quantidade(self, **rotulos):
+        with self.lock:
+            serie = self.series.get(chave_rotulos(self.rotulos, rotulos))
+        return serie[2] if serie else 0
+
+    def amostras(self):
+        with self.lock:
+            series = {chave: (list(contagens), soma, quantidade) for chave, (contagens, soma, quantidade) in self.series.items()}
+
+        amostras = []
+        for chave, (contagens, soma, quantidade) in sorted(series.items()):
+            rotulos = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.baldes + (math.inf,), contagens):
+                acumulado += contagem
+                amostras.append((f"{self.nome}_bucket", {**rotulos, "le": formatar_numero(limite)}, acumulado))
+            amostras.append((f"{self.nome}_sum", rotulos, soma))
+            amostras.append((f"{self.nome}_count", rotulos, quantidade))
+        return amostras
+
+
+class Medidor:
+    """
+    Valor atual de uma medida (gauge do Prometheus), um valor para cada combinação de rótulos
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def definir(self, valor, **rotulos):
+        chave = chave_rotulos(self.rotulos, rotulos)
+        with self.lock:
+            self.valores[chave] = valor
+
+    def valor(self, **rotulos):
+        with self.lock:
+            return self.valores.get(chave_rotulos(self.rotulos, rotulos))
+
+    def amostras(self):
+        with self.lock:
+            valores = dict(self.valores)
+        return [(self.nome, dict(zip(self.rotulos, chave)), valor) for chave, valor in sorted(valores.items())]
+
+
+class RegistroMetricas:
+    """
+    Conjunto das métricas do processo, exportadas no formato de texto do Prometheus (/metrics) \n
+    Cada processo tem o seu registro: com vários workers do gunicorn, ou os pdfs lidos no pool \n
+    de NFE_PDF_WORKERS, cada processo mede apenas o que executou
+    """
+
+    def __init__(self):
+        self.metricas = {}
+        self.lock = threading.Lock()
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        return self._registrar(Histograma(nome, ajuda, rotulos, baldes))
+
+    def medidor(self, nome, ajuda, rotulos=()):
+        return self._registrar(Medidor(nome, ajuda, rotulos))
+
+    def texto(self):
+        """
+        Todas as métricas no formato de exposição de texto do Prometheus (versão 0.0.4)
+        """
+        with self.lock:
+            metricas = list(self.metricas.values())
+
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for nome, rotulos, valor in metrica.amostras():
+                linhas.append(f"{nome}{formatar_rotulos(rotulos)} {formatar_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+    def _registrar(self, metrica):
+        # Registrar de novo o mesmo nome devolve a métrica já existente
+        with self.lock:
+            return self.metricas.setdefault(metrica.nome, metrica)
+
+
+def chave_rotulos(nomes, rotulos):
+    if set(rotulos) != set(nomes):
+        raise ValueError(f"Rótulos esperados: {', '.join(nomes) or 'nenhum'}")
+    return tuple(str(rotulos[nome]) for nome in nomes)
+
+
+def formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{escapar_rotulo(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+def escapar_rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatar_numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor)) if abs(valor) < 1e15 else repr(valor)
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+REGISTRO = RegistroMetricas()
+
+ETAPAS = REGISTRO.histograma(
+    "nfe_etapa_segundos", "Tempo de cada etapa da análise das notas", ("etapa",)
+)
+ERROS = REGISTRO.contador(
+    "nfe_erros_total", "Erros em cada etapa da análise das notas", ("etapa",)
+)
+NOTAS = REGISTRO.contador(
+    "nfe_notas_total", "Notas lidas, por tipo de arquivo (pdf ou xml)", ("tipo",)
+)
+ITENS = REGISTRO.contador(
+    "nfe_itens_total", "Itens das notas lidas, por tipo de arquivo (pdf ou xml)", ("tipo",)
+)
+PAGINAS = REGISTRO.contador(
+    "nfe_paginas_total", "Páginas dos pdfs lidos com pypdf/tabula (sem os que vieram do cache)"
+)
+PAGINAS_PDF = REGISTRO.histograma(
+    "nfe_pdf_paginas", "Quantidade de páginas de cada pdf lido", baldes=BALDES_PAGINAS
+)
+FOCUSNFE = REGISTRO.histograma(
+    "nfe_focusnfe_segundos", "Tempo das requisições à FocusNFe", ("operacao",)
+)
+RESPOSTAS_FOCUSNFE = REGISTRO.contador(
+    "nfe_focusnfe_respostas_total", "Respostas da FocusNFe por operação e status HTTP (\"erro\" sem resposta)",
+    ("operacao", "codigo"),
+)
+CACHE_RESPOSTAS = REGISTRO.contador(
+    "nfe_cache_respostas_total", "Consultas ao cache de respostas de /processar_arquivos (acerto ou falha)",
+    ("resultado",),
+)
+INICIALIZACAO = REGISTRO.medidor(
+    "nfe_inicializacao_segundos",
+    "Inicialização do processo: importacao_main, aquecimento e primeira_requisicao (a primeira requisição atendida)",
+    ("fase",),
+)
+
+_primeira_requisicao = threading.Event()
+
+
+@contextlib.contextmanager
+def medir_etapa(etapa):
+    """
+    Mede o tempo do bloco em nfe_etapa_segundos{etapa} \n
+    Exceções contam em nfe_erros_total{etapa} e continuam subindo
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERROS.incrementar(etapa=etapa)
+        raise
+    finally:
+        ETAPAS.observar(time.perf_counter() - inicio, etapa=etapa)
+
+
+def registrar_erro(etapa):
+    ERROS.incrementar(etapa=etapa)
+
+
+def registrar_nota(tipo, itens_nfe):
+    NOTAS.incrementar(tipo=tipo)
+    ITENS.incrementar(len(itens_nfe), tipo=tipo)
+
+
+def registrar_paginas(paginas):
+    PAGINAS.incrementar(paginas)
+    PAGINAS_PDF.observar(paginas)
+
+
+def requisicao_focusnfe(operacao, metodo, url, **opcoes):
+    """
+    Executa metodo(url, **opcoes) (requests.post, get ou delete) medindo o tempo da requisição \n
+    e contando a resposta pelo status HTTP
+    """
+    inicio = time.perf_counter()
+    try:
+        resposta = metodo(url, **opcoes)
+    except Exception:
+        RESPOSTAS_FOCUSNFE.incrementar(operacao=operacao, codigo="erro")
+        raise
+    finally:
+        FOCUSNFE.observar(time.perf_counter() - inicio, operacao=operacao)
+
+    RESPOSTAS_FOCUSNFE.incrementar(operacao=operacao, codigo=resposta.status_code)
+    return resposta
+
+
+def registrar_cache_resposta(acerto):
+    CACHE_RESPOSTAS.incrementar(resultado="acerto" if acerto else "falha")
+
+
+def registrar_inicializacao(fase, segundos, **campos):
+    INICIALIZACAO.definir(segundos, fase=fase)
+    logger.info("Inicialização", extra={"fase": fase, "segundos": round(segundos, 4), **campos})
+
+
+def registrar_primeira_requisicao(rota, segundos):
+    """
+    Registra apenas a primeira requisição do processo, que inclui as importações feitas sob demanda
+    """
+    if _primeira_requisicao.is_set():
+        return
+    _primeira_requisicao.set()
+    registrar_inicializacao("primeira_requisicao", segundos, rota=rota)
+
+
+def texto_metricas():
+    return REGISTRO.texto()
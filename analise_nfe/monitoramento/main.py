@@ -0,0 +1,227 @@
+import hashlib
+import os
+import pickle
+import threading
+
+from analise_nfe.cache.main import VERSAO_CACHE, opcoes_leitura, remover_arquivo
+from analise_nfe.cache.main import calcular_sha256
+from analise_nfe.pdfs.main import processar_pdfs_por_arquivo
+
+
+class MonitorPastaNFe:
+    """
+    Acompanha uma pasta de DANFEs e lê apenas os pdfs novos ou alterados \n
+    Cada arquivo é lembrado pelo caminho, data de modificação, tamanho e SHA-256 \n
+    O resultado acumulado {codigo_nota: itens_nfe} fica disponível sem ler a pasta de novo \n
+    Com arquivo_estado o estado é salvo em disco e recuperado depois de um reinicio
+    """
+
+    def __init__(self, pasta, arquivo_estado=None, motor=None, workers=None):
+        self.pasta = pasta
+        self.arquivo_estado = arquivo_estado
+        self.motor = motor
+        self.workers = workers
+
+        # {caminho: {"mtime", "tamanho", "sha256", "codigo", "erro"}}
+        self.arquivos = {}
+        # {codigo_nota: itens_nfe}
+        self.nfes = {}
+        self.lock = threading.Lock()
+
+        self.carregar_estado()
+
+    def atualizar(self, erros=None):
+        """
+        Lê a pasta e processa apenas os pdfs novos ou alterados \n
+        Arquivos removidos da pasta saem do resultado \n
+        erros: lista que recebe {"arquivo", "erro"} dos pdfs que falharem (como em processar_pdfs) \n
+        Retorna a lista de caminhos lidos nesta atualização
+        """
+        with self.lock:
+            encontrados = listar_pdfs(self.pasta)
+            alterados = []
+
+            for caminho, (mtime, tamanho) in encontrados.items():
+                anterior = self.arquivos.get(caminho)
+
+                if anterior and anterior["mtime"] == mtime and anterior["tamanho"] == tamanho:
+                    continue
+
+                sha256 = calcular_sha_arquivo(caminho)
+
+                # Data de modificação mudou mas o conteúdo é o mesmo
+                if anterior and anterior["sha256"] == sha256:
+                    anterior.update({"mtime": mtime, "tamanho": tamanho})
+                    continue
+
+                self.arquivos[caminho] = {
+                    "mtime": mtime, "tamanho": tamanho, "sha256": sha256, "codigo": None, "erro": None
+                }
+                alterados.append(caminho)
+
+            removidos = [caminho for caminho in self.arquivos if caminho not in encontrados]
+            for caminho in removidos:
+                del self.arquivos[caminho]
+
+            erros_lote = []
+            lidos = processar_pdfs_por_arquivo(
+                [(caminho, caminho) for caminho in alterados], self.motor, self.workers, erros_lote
+            ) if alterados else []
+
+            for caminho, codigo, itens_nfe in lidos:
+                self.arquivos[caminho]["codigo"] = codigo
+                self.nfes[codigo] = itens_nfe
+
+            # Pdfs com erro só são lidos de novo quando mudarem
+            for erro in erros_lote:
+                self.arquivos[erro["arquivo"]]["erro"] = erro["erro"]
+
+            if erros is not None:
+                erros.extend(erros_lote)
+
+            self._remover_nfes_sem_arquivo()
+
+            if alterados or removidos:
+                self.salvar_estado()
+
+            return alterados
+
+    def resultados(self):
+        """
+        Resultado acumulado {codigo_nota: itens_nfe}, sem ler a pasta
+        """
+        with self.lock:
+            return dict(self.nfes)
+
+    def observar(self, intervalo=None, parar=None, ao_atualizar=None):
+        """
+        Atualiza a pasta a cada intervalo segundos (padrão NFE_MONITOR_INTERVALO) até parar ser sinalizado \n
+        parar: threading.Event \n
+        ao_atualizar: função chamada com (caminhos_lidos, erros) quando algum pdf for lido
+        """
+        intervalo = intervalo or float(os.getenv("NFE_MONITOR_INTERVALO", "30"))
+        parar = parar or threading.Event()
+
+        while not parar.is_set():
+            erros = []
+            lidos = self.atualizar(erros)
+
+            if ao_atualizar and (lidos or erros):
+                ao_atualizar(lidos, erros)
+
+            parar.wait(intervalo)
+
+    def carregar_estado(self):
+        """
+        Recupera o estado salvo, ignorando arquivos de outra versão ou de outro motor da leitura dos pdfs
+        """
+        if not self.arquivo_estado:
+            return
+
+        try:
+            with open(self.arquivo_estado, "rb") as arquivo:
+                estado = pickle.load(arquivo)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+
+        if (
+            estado.get("versao") != VERSAO_CACHE
+            or estado.get("pasta") != os.path.abspath(self.pasta)
+            or estado.get("leitura") != opcoes_leitura(self.motor)
+        ):
+            return
+
+        self.arquivos = estado["arquivos"]
+        self.nfes = estado["nfes"]
+
+    def salvar_estado(self):
+        """
+        Grava o estado em disco (arquivo temporário + os.replace, para não deixar o estado pela metade)
+        """
+        if not self.arquivo_estado:
+            return
+
+        estado = {
+            "versao": VERSAO_CACHE,
+            "pasta": os.path.abspath(self.pasta),
+            "leitura": opcoes_leitura(self.motor),
+            "arquivos": self.arquivos,
+            "nfes": self.nfes,
+        }
+
+        temporario = f"{self.arquivo_estado}.{os.getpid()}.tmp"
+        try:
+            with open(temporario, "wb") as arquivo:
+                pickle.dump(estado, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, self.arquivo_estado)
+        except OSError:
+            remover_arquivo(temporario)
+
+    def _remover_nfes_sem_arquivo(self):
+        codigos = {info["codigo"] for info in self.arquivos.values() if info["codigo"] is not None}
+        for codigo in [codigo for codigo in self.nfes if codigo not in codigos]:
+            del self.nfes[codigo]
+
+
+def listar_pdfs(pasta):
+    """
+    Lista os pdfs da pasta com a data de modificação e o tamanho \n
+    Retorna um dicionario {caminho: (mtime, tamanho)}
+    """
+    pdfs = {}
+
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if not entrada.name.endswith(".pdf") or not entrada.is_file():
+                continue
+            try:
+                info = entrada.stat()
+            except OSError:
+                continue
+            pdfs[f"{pasta}/{entrada.name}"] = (info.st_mtime_ns, info.st_size)
+
+    return pdfs
+
+
+def calcular_sha_arquivo(caminho):
+    with open(caminho, "rb") as arquivo:
+        return calcular_sha256(arquivo)
+
+
+_monitores = {}
+_lock_monitores = threading.Lock()
+
+
+def percorrer_lista_pdfs_diretorio_incremental(src, motor=None, workers=None, erros=None):
+    '''
+    Versão incremental de percorrer_lista_pdfs_diretorio: a cada chamada só lê os pdfs novos ou alterados \n
+    Cada pasta tem um monitor (e um estado) por motor de leitura, já que cada motor pode devolver itens diferentes \n
+    O estado fica em NFE_MONITOR_ESTADO_DIR e sobrevive a reinicios \n
+    retorna um dicionario {codigo_nota:lista_itens_nfe} com todas as notas da pasta
+    '''
+    with _lock_monitores:
+        chave = (os.path.abspath(src), opcoes_leitura(motor))
+        if chave not in _monitores:
+            _monitores[chave] = MonitorPastaNFe(src, arquivo_estado_pasta(src, motor), motor, workers)
+        monitor = _monitores[chave]
+
+        # workers só muda o paralelismo e não o resultado, então vale o da chamada atual
+        monitor.workers = workers
+
+    monitor.atualizar(erros)
+    return monitor.resultados()
+
+
+def arquivo_estado_pasta(src, motor=None):
+    """
+    Caminho do estado salvo de uma pasta dentro de NFE_MONITOR_ESTADO_DIR (None se não configurado) \n
+    O nome leva o SHA-256 do caminho absoluto e das opções de leitura, então pastas diferentes nunca dividem o estado
+    """
+    pasta_estado = os.getenv("NFE_MONITOR_ESTADO_DIR")
+    if not pasta_estado:
+        return None
+
+    os.makedirs(pasta_estado, exist_ok=True)
+    caminho = os.path.abspath(src)
+    sha256 = hashlib.sha256(f"{caminho}\n{opcoes_leitura(motor)}".encode()).hexdigest()
+    return os.path.join(pasta_estado, f"{os.path.basename(caminho) or 'raiz'}-{sha256[:16]}.pkl")
@@ -0,0 +1,124 @@
+import xml.etree.ElementTree as ET
+import pandas as pd
+import os
+
+from analise_nfe.metricas.main import medir_etapa, registrar_nota
+from analise_nfe.produtos.main import normalizar_codigos
+
+
+def percorrer_lista_xmls_diretorio(src, erros=None):
+    '''
+    Percorre uma pasta e recupera todos os dados de nfe a partir dos xmls (procNFe) \n
+    retorna um dicionario {codigo_nota:lista_itens_nfe} \n
+    '''
+    tarefas = [
+        (arquivo, f"{src}/{arquivo}")
+        for arquivo in os.listdir(src)
+        if arquivo.lower().endswith(".xml")
+    ]
+
+    return processar_xmls(tarefas, erros)
+
+def percorrer_lista_xmls(lista_xmls, erros=None, progresso=None):
+    '''
+    Percorre uma lista de xmls de nfe enviados e recupera os dados de cada nota \n
+    retorna um dicionario {codigo_nota:lista_itens_nfe} \n
+    erros: lista que recebe {"arquivo": nome_arquivo, "erro": mensagem} dos xmls que falharem \n
+    progresso: função chamada com o nome de cada arquivo depois de lido (com ou sem erro)
+    '''
+    tarefas = [
+        (arquivo.filename, arquivo)
+        for arquivo in lista_xmls
+        if arquivo.filename.lower().endswith(".xml")
+    ]
+
+    return processar_xmls(tarefas, erros, progresso)
+
+def processar_xmls(tarefas, erros=None, progresso=None):
+    '''
+    Recupera os dados de nfe de uma lista de tarefas [(nome_arquivo, xml)] \n
+    Sem a lista de erros o primeiro erro é repassado
+    '''
+    dfs_total = {}
+
+    for _, codigo, itens_nfe in iterar_xmls_por_arquivo(tarefas, erros, progresso):
+        dfs_total.update({codigo:itens_nfe})
+
+    return dfs_total
+
+def iterar_xmls_por_arquivo(tarefas, erros=None, progresso=None):
+    '''
+    Versão gerador de processar_xmls: entrega (nome_arquivo, codigo_nota, lista_itens_nfe) assim que cada xml é lido
+    '''
+    for nome, xml in tarefas:
+        try:
+            with medir_etapa("leitura_xml"):
+                nfe = get_dados_nfe_by_xml(xml)
+        except Exception as e:
+            if erros is None:
+                raise
+            erros.append({"arquivo": nome, "erro": str(e)})
+            continue
+        finally:
+            if progresso:
+                progresso(nome)
+
+        registrar_nota("xml", nfe["itens"])
+        yield nome, str(nfe["codigo_nfe"]), nfe["itens"]
+
+def get_dados_nfe_by_xml(xml_file):
+    '''
+    Recupera os itens e o numero da nota de um xml de NF-e (procNFe ou NFe) \n
+    Lê o xml em streaming: cada <det> é descartado assim que os dados do produto são lidos \n
+    Retorna o mesmo formato de get_dados_nfe_by_pdf {itens: df[Cod, QTDD, ITEM], codigo_nfe}
+    '''
+    if hasattr(xml_file, "seek"):
+        xml_file.seek(0)
+
+    codigos, quantidades, descricoes = [], [], []
+    codigo_nota = None
+
+    for _, elemento in ET.iterparse(xml_file, events=("end",)):
+        tag = nome_tag(elemento)
+
+        if tag == "nNF" and codigo_nota is None:
+            codigo_nota = elemento.text.strip()
+
+        elif tag == "det":
+            elemento_produto = elemento.find("{*}prod")
+            if elemento_produto is None:
+                raise ValueError("Item (det) sem os dados do produto (prod)")
+
+            produto = {nome_tag(filho): (filho.text or "").strip() for filho in elemento_produto}
+            codigos.append(produto.get("cProd", ""))
+            quantidades.append(produto.get("qCom", ""))
+            descricoes.append(produto.get("xProd", ""))
+
+            # Libera a memória do item já lido
+            elemento.clear()
+
+    if codigo_nota is None:
+        raise ValueError("O xml não possui o numero da nota (nNF)")
+
+    df_itens = pd.DataFrame({"Cod": codigos, "QTDD": quantidades, "ITEM": descricoes})
+    # Mesma chave dos códigos da planilha de custos
+    df_itens["Cod"] = normalizar_codigos(df_itens["Cod"])
+
+    # qCom vem com 4 casas decimais ("5.0000"), quantidades inteiras ficam iguais às do pdf
+    df_itens["QTDD"] = pd.to_numeric(df_itens["QTDD"])
+    if len(df_itens) and (df_itens["QTDD"] % 1 == 0).all():
+        df_itens["QTDD"] = df_itens["QTDD"].astype("int64")
+
+    # Recuperando apenas o nome, como no pdf
+    df_itens["ITEM"] = df_itens["ITEM"].str.split(" - ").str[0]
+
+    return {
+        "itens": df_itens,
+        "codigo_nfe": codigo_nota
+    }
+
+def nome_tag(elemento):
+    '''
+    Remove o namespace do nome da tag ({http://www.portalfiscal.inf.br/nfe}det -> det)
+    '''
+    return elemento.tag.rsplit("}", 1)[-1]
@@ -0,0 +1,123 @@
+import re
+import threading
+from collections import OrderedDict
+
+ROTULO_PRODUTOS = "DADOS DO PRODUTO/SERVIÇO"
+ROTULO_ADICIONAIS = "DADOS ADICIONAIS"
+
+REGEX_CHAVE_ACESSO = re.compile(r"CHAVE DE ACESSO\s*((?:\d{4}\s?){11})")
+
+# Quantidade máxima de layouts lembrados em cada processo (os usados há mais tempo saem primeiro)
+MAXIMO_LAYOUTS = 1000
+
+# Áreas já detectadas por layout {(cnpj_emitente, primeira_pagina): area}, do usado há mais tempo para o mais recente
+# Cada processo do pool tem o seu, e as threads de um processo o acessam sempre com _lock_areas
+_areas_por_layout = OrderedDict()
+_lock_areas = threading.Lock()
+
+
+def areas_produtos(documento):
+    '''
+    Recupera a área do bloco "DADOS DO PRODUTO/SERVIÇO" de cada pagina no formato do tabula \n
+    [top, left, bottom, right] em pontos, a partir do canto superior esquerdo \n
+    A área vem das posições do texto no pypdf e, quando a página não tem os rótulos, \n
+    do modelo já detectado para o mesmo emitente \n
+    Retorna uma lista com a área de cada pagina ou None caso alguma não seja encontrada
+    '''
+    cnpj = cnpj_emitente(documento)
+    areas = []
+
+    for indice in range(documento.paginas):
+        layout = (cnpj, indice == 0)
+        area = detectar_area_produtos(documento, indice)
+
+        if area is not None and cnpj:
+            lembrar_area(layout, area)
+        elif area is None:
+            area = area_lembrada(layout)
+
+        if area is None:
+            return None
+
+        areas.append(area)
+
+    return areas
+
+
+def lembrar_area(layout, area):
+    """
+    Guarda a área detectada para o layout, descartando os layouts usados há mais tempo acima de MAXIMO_LAYOUTS
+    """
+    with _lock_areas:
+        _areas_por_layout[layout] = area
+        _areas_por_layout.move_to_end(layout)
+
+        while len(_areas_por_layout) > MAXIMO_LAYOUTS:
+            _areas_por_layout.popitem(last=False)
+
+
+def area_lembrada(layout):
+    """
+    Área já detectada para o layout ou None
+    """
+    with _lock_areas:
+        area = _areas_por_layout.get(layout)
+        if area is not None:
+            _areas_por_layout.move_to_end(layout)
+        return area
+
+
+def detectar_area_produtos(documento, indice):
+    '''
+    Detecta a área da tabela de produtos de uma pagina pelos rótulos do bloco \n
+    Começa no rótulo "DADOS DO PRODUTO/SERVIÇO" e termina antes de "DADOS ADICIONAIS" \n
+    (ou no fim da página, nas páginas de continuação)
+    '''
+    pagina = documento.reader.pages[indice]
+    if pagina.rotation % 360 != 0:
+        return None
+
+    largura = float(pagina.mediabox.width)
+    altura = float(pagina.mediabox.height)
+
+    inicio = None
+    fim = None
+    for texto, _, y, tamanho_fonte in documento.posicoes_pagina(indice):
+        # Trechos sem posição (0, 0) no pypdf são ignorados
+        if y <= 0:
+            continue
+        if texto.startswith(ROTULO_PRODUTOS) and inicio is None:
+            inicio = y
+        elif texto.startswith(ROTULO_ADICIONAIS) and fim is None:
+            fim = y + tamanho_fonte
+
+    if inicio is None or (fim is not None and fim >= inicio):
+        return None
+
+    topo = altura - inicio - 1
+    base = altura - fim if fim is not None else altura
+
+    return [round(topo, 2), 0.0, round(base, 2), round(largura, 2)]
+
+
+def cnpj_emitente(documento):
+    '''
+    Recupera o CNPJ do emitente a partir da chave de acesso (posições 7 a 20) \n
+    Retorna None caso a chave não seja encontrada
+    '''
+    chave = REGEX_CHAVE_ACESSO.search(documento.texto_pagina(0))
+    if chave is None:
+        return None
+
+    return re.sub(r"\s", "", chave.group(1))[6:20]
+
+
+def eh_tabela_produtos(tabela):
+    '''
+    Verifica se uma tabela json do tabula tem o cabeçalho da tabela de produtos
+    '''
+    if not tabela["data"]:
+        return False
+
+    cabecalho = [celula["text"] for celula in tabela["data"][0]]
+    return "CÓDIGO" in cabecalho and "QTD." in cabecalho
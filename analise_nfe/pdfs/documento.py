@@ -0,0 +1,157 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pypdf as pyf
+
+from analise_nfe.cache.main import TAMANHO_BLOCO, calcular_sha256
+from analise_nfe.uploads.main import caminho_upload
+
+
+class DocumentoPDF:
+    """
+    Guarda os bytes de um pdf uma única vez e compartilha a leitura entre todas as etapas \n
+    Caminhos são lidos direto do disco, bytes ficam em memória e arquivos enviados (FileStorage) \n
+    são copiados para um único arquivo temporário, que só vai para o disco acima de NFE_PDF_MEMORIA_MB \n
+    (os uploads que já estão no disco, ver ArquivoUpload, são lidos direto do arquivo) \n
+    O PdfReader, o SHA-256 e os textos das páginas são calculados uma vez e reaproveitados \n
+    (o SHA-256 já calculado para a chave do cache de respostas, ver sha256_upload, é usado como está)
+    """
+
+    def __init__(self, origem):
+        self._caminho = None
+        self._caminho_temporario = None
+        self._sha256 = getattr(origem, "sha256_nfe", None)
+        self._reader = None
+        self._textos = {}
+        self._posicoes = {}
+
+        if caminho_upload(origem):
+            origem = caminho_upload(origem)
+
+        if isinstance(origem, (str, os.PathLike)):
+            self._caminho = os.fspath(origem)
+            self.arquivo = open(self._caminho, "rb")
+        elif isinstance(origem, (bytes, bytearray)):
+            self.arquivo = io.BytesIO(origem)
+            self._sha256 = hashlib.sha256(origem).hexdigest()
+        else:
+            self.arquivo, self._sha256 = copiar_para_temporario(origem, self._sha256)
+
+    @property
+    def sha256(self):
+        """
+        SHA-256 dos bytes do pdf
+        """
+        if self._sha256 is None:
+            self._sha256 = calcular_sha256(self.arquivo)
+        return self._sha256
+
+    @property
+    def reader(self):
+        """
+        PdfReader compartilhado pelas etapas de leitura
+        """
+        if self._reader is None:
+            self.arquivo.seek(0)
+            self._reader = pyf.PdfReader(self.arquivo)
+        return self._reader
+
+    @property
+    def paginas(self):
+        return len(self.reader.pages)
+
+    def texto_pagina(self, indice, modo="plain"):
+        """
+        Texto de uma pagina, extraido uma única vez para cada modo do pypdf ("plain" ou "layout")
+        """
+        if (indice, modo) not in self._textos:
+            self._textos[(indice, modo)] = self.reader.pages[indice].extract_text(extraction_mode=modo)
+        return self._textos[(indice, modo)]
+
+    def posicoes_pagina(self, indice):
+        """
+        Trechos de texto de uma pagina com a posição [(texto, x, y, tamanho_fonte)] \n
+        y é medido a partir da parte de baixo da página, como no pdf
+        """
+        if indice not in self._posicoes:
+            posicoes = []
+
+            def visitar_texto(texto, cm, tm, fonte, tamanho_fonte):
+                if texto.strip():
+                    posicoes.append((texto.strip(), tm[4] * cm[0] + cm[4], tm[5] * cm[3] + cm[5], tamanho_fonte * tm[3]))
+
+            self.reader.pages[indice].extract_text(visitor_text=visitar_texto)
+            self._posicoes[indice] = posicoes
+
+        return self._posicoes[indice]
+
+    def caminho(self):
+        """
+        Caminho do pdf no disco para o tabula \n
+        Arquivos em memória são gravados em um arquivo temporário uma única vez
+        """
+        if self._caminho:
+            return self._caminho
+
+        if self._caminho_temporario is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporario:
+                self.arquivo.seek(0)
+                shutil.copyfileobj(self.arquivo, temporario, TAMANHO_BLOCO)
+            self._caminho_temporario = temporario.name
+
+        return self._caminho_temporario
+
+    def fechar(self):
+        """
+        Fecha o arquivo e remove os temporários criados
+        """
+        self.arquivo.close()
+
+        if self._caminho_temporario:
+            try:
+                os.remove(self._caminho_temporario)
+            except OSError:
+                pass
+            self._caminho_temporario = None
+
+
+@contextmanager
+def abrir_documento(origem):
+    """
+    Abre um DocumentoPDF a partir de um caminho, bytes ou arquivo \n
+    Um DocumentoPDF recebido é usado como está e continua aberto para quem o criou
+    """
+    if isinstance(origem, DocumentoPDF):
+        yield origem
+        return
+
+    documento = DocumentoPDF(origem)
+    try:
+        yield documento
+    finally:
+        documento.fechar()
+
+
+def copiar_para_temporario(origem, sha256=None):
+    """
+    Copia um arquivo aberto para um SpooledTemporaryFile, que passa para o disco acima de NFE_PDF_MEMORIA_MB \n
+    Calcula o SHA-256 durante a cópia para não ler o arquivo de novo, a não ser que ele já venha em sha256 \n
+    Retorna (arquivo_temporario, sha256)
+    """
+    limite = int(float(os.getenv("NFE_PDF_MEMORIA_MB", "8")) * 1024 * 1024)
+    temporario = tempfile.SpooledTemporaryFile(max_size=limite)
+    calculo = hashlib.sha256() if sha256 is None else None
+
+    origem.seek(0)
+    for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b""):
+        if calculo is not None:
+            calculo.update(bloco)
+        temporario.write(bloco)
+    origem.seek(0)
+    temporario.seek(0)
+
+    return temporario, sha256 or calculo.hexdigest()
@@ -0,0 +1,114 @@
+import re
+
+# Cabeçalho da tabela de produtos no mesmo formato devolvido pelo tabula
+CABECALHO_PRODUTOS = ["CÓDIGO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "QTD."]
+
+# NCM sempre tem 8 digitos e abre a parte numérica de cada item
+REGEX_NCM = re.compile(r"(?<!\S)\d{8}(?!\S)")
+
+
+def extrair_tabelas_produtos_pypdf(documento):
+    '''
+    Recupera a tabela de produtos de cada pagina usando apenas o texto posicionado do pypdf \n
+    Cada tabela é uma lista de linhas [CÓDIGO, DESCRIÇÃO DO PRODUTO/SERVIÇO, QTD.] \n
+    com a primeira linha sendo o cabeçalho e as quebras de linha das celulas como "\\r" (igual ao tabula) \n
+    documento: DocumentoPDF, para reaproveitar o PdfReader e o texto das páginas \n
+    Retorna None caso alguma pagina não tenha uma tabela reconhecível
+    '''
+    tabelas = []
+
+    for indice in range(documento.paginas):
+        texto = documento.texto_pagina(indice, modo="layout")
+        linhas = extrair_linhas_produtos(texto)
+
+        if linhas is None:
+            return None
+
+        tabelas.append(linhas)
+
+    return tabelas
+
+
+def extrair_linhas_produtos(texto):
+    '''
+    Monta as linhas da tabela "DADOS DO PRODUTO/SERVIÇO" a partir do texto em layout de uma pagina \n
+    Retorna None caso não encontre o cabeçalho ou algum item não seja consistente
+    '''
+    linhas_texto = texto.split("\n")
+
+    # Procurando o cabeçalho da tabela de produtos
+    indice_cabecalho = None
+    for indice, linha in enumerate(linhas_texto):
+        if "CÓDIGO" in linha and "DESCRIÇÃO DO PRODUTO/SERVIÇO" in linha and "QTD." in linha:
+            indice_cabecalho = indice
+            break
+
+    if indice_cabecalho is None:
+        return None
+
+    cabecalho = linhas_texto[indice_cabecalho]
+    # Margem de 2 caracteres porque o layout do pypdf pode deslocar o cabeçalho
+    inicio_descricao = max(cabecalho.find("DESCRIÇÃO") - 2, 0)
+    inicio_ncm = max(cabecalho.find("NCM/SH") - 3, inicio_descricao)
+
+    itens = []
+    for linha in linhas_texto[indice_cabecalho + 1:]:
+        if "DADOS ADICIONAIS" in linha:
+            break
+        if not linha.strip():
+            continue
+
+        codigo = linha[:inicio_descricao].strip()
+        ncm = REGEX_NCM.search(linha, inicio_ncm)
+
+        # Linha com NCM inicia um novo item
+        if ncm:
+            quantidade = recuperar_quantidade(linha[ncm.start():].split())
+            if quantidade is None:
+                return None
+
+            descricao = linha[inicio_descricao:ncm.start()].strip()
+            itens.append([[codigo], [descricao], quantidade])
+
+        # Linhas sem NCM continuam o item anterior (ou são o fim do cabeçalho)
+        elif itens:
+            descricao = " ".join(linha[inicio_descricao:].split())
+            if codigo:
+                itens[-1][0].append(codigo)
+            if descricao:
+                itens[-1][1].append(descricao)
+
+    if not itens:
+        return None
+
+    return [CABECALHO_PRODUTOS] + [
+        ["\r".join(codigo), "\r".join(descricao), quantidade]
+        for codigo, descricao, quantidade in itens
+    ]
+
+
+def recuperar_quantidade(valores):
+    '''
+    Recupera a quantidade a partir dos valores de um item [NCM, CST, CFOP, UNID., QTD., VLR. UNIT., VLR. TOTAL, ...] \n
+    Confere QTD. x VLR. UNIT. = VLR. TOTAL para não depender da unidade ter uma única palavra
+    '''
+    for indice in range(4, len(valores) - 2):
+        quantidade, unitario, total = (converter_numero(valor) for valor in valores[indice:indice + 3])
+
+        if None in (quantidade, unitario, total):
+            continue
+
+        if abs(quantidade * unitario - total) <= 0.01:
+            return valores[indice]
+
+    return None
+
+
+def converter_numero(valor):
+    '''
+    Converte um número no formato "1.020,83" para float
+    '''
+    try:
+        return float(valor.replace(".", "").replace(",", "."))
+    except ValueError:
+        return None
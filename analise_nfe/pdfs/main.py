@@ -1,73 +1,232 @@
-import pypdf as pyf
 import tabula
 import pandas as pd
+import numpy as np
 import os
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from analise_nfe.cache.main import cache_ativo, chave_sha256, obter_cache_nfe
+from analise_nfe.metricas.main import medir_etapa, registrar_erro, registrar_nota, registrar_paginas
+from analise_nfe.pdfs.areas import areas_produtos, eh_tabela_produtos
+from analise_nfe.pdfs.documento import abrir_documento
+from analise_nfe.pdfs.extrator_pypdf import extrair_tabelas_produtos_pypdf
+from analise_nfe.pdfs.pool import descartar_pool_pdfs, obter_pool_pdfs
+from analise_nfe.pdfs.tabula_worker import obter_worker_tabula, worker_tabula_ativo
+from analise_nfe.produtos.main import normalizar_codigos
+from analise_nfe.uploads.main import caminho_upload
 
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-def percorrer_lista_pdfs_diretorio(src):
+def percorrer_lista_pdfs_diretorio(src, motor=None, workers=None, erros=None):
     '''
     Percorre uma pasta e recupera todos os dados de nfe a partir de um pdf \n
     retorna um dicionario {codigo_nota:lista_itens_nfe} \n
+    workers e erros funcionam como em processar_pdfs
     '''
-    dfs_total = {}
+    tarefas = [
+        (arquivo, f"{src}/{arquivo}")
+        for arquivo in os.listdir(src)
+        if arquivo.endswith(".pdf")
+    ]
 
-    for arquivo in os.listdir(src):
-        if arquivo.endswith(".pdf"):
-            nfe = get_dados_nfe_by_pdf(f"{src}/{arquivo}")
-            itens_nfe = nfe["itens"]
-            codigo = str(nfe["codigo_nfe"])
-            dfs_total.update({codigo:itens_nfe})
+    return processar_pdfs(tarefas, motor, workers, erros)
 
-    return dfs_total
-
-def percorrer_lista_pdfs(lista_pdfs):
+def percorrer_lista_pdfs(lista_pdfs, motor=None, workers=None, erros=None, progresso=None):
     '''
     Percorre umalista de pdfs_nfe e recupera todos os dados de nfe a partir de um pdf \n
     retorna um dicionario {codigo_nota:lista_itens_nfe} \n
+    workers, erros e progresso funcionam como em processar_pdfs
+    '''
+    workers = workers or int(os.getenv("NFE_PDF_WORKERS", "1"))
+    return processar_pdfs(tarefas_pdfs(lista_pdfs, workers), motor, workers, erros, progresso)
+
+def tarefas_pdfs(lista_pdfs, workers):
+    '''
+    Tarefas [(nome_arquivo, pdf)] dos pdfs enviados para processar_pdfs / iterar_pdfs_por_arquivo
+    '''
+    pdfs = [arquivo for arquivo in lista_pdfs if arquivo.filename.endswith('.pdf')]
+
+    # Os processos do pool não recebem o arquivo aberto: recebem o caminho dos uploads que já estão
+    # no disco e os bytes apenas dos que ficaram em memória (limitados por NFE_UPLOAD_MEMORIA_MB)
+    if workers > 1 and len(pdfs) > 1:
+        return [(arquivo.filename, caminho_upload(arquivo) or arquivo.read()) for arquivo in pdfs]
+    return [(arquivo.filename, arquivo) for arquivo in pdfs]
+
+def processar_pdfs(tarefas, motor=None, workers=None, erros=None, progresso=None):
+    '''
+    Recupera os dados de nfe de uma lista de tarefas [(nome_arquivo, pdf)] \n
+    pdf pode ser um caminho, um arquivo aberto ou os bytes do pdf \n
+    workers: quantidade de processos lendo os pdfs em paralelo (padrão NFE_PDF_WORKERS, 1 = sequencial) \n
+    erros: lista que recebe {"arquivo": nome_arquivo, "erro": mensagem} dos pdfs que falharem, \n
+    sem interromper o lote. Sem a lista o primeiro erro é repassado \n
+    progresso: função chamada com o nome de cada arquivo depois de lido (com ou sem erro) \n
+    retorna um dicionario {codigo_nota:lista_itens_nfe} \n
     '''
     dfs_total = {}
 
-    for arquivo in lista_pdfs:
-        if arquivo.filename.endswith('.pdf'):
-            nfe = get_dados_nfe_by_pdf(arquivo)
-            itens_nfe = nfe["itens"]
-            codigo = str(nfe["codigo_nfe"])
-            dfs_total.update({codigo:itens_nfe})
+    for _, codigo, itens_nfe in processar_pdfs_por_arquivo(tarefas, motor, workers, erros, progresso):
+        dfs_total.update({codigo:itens_nfe})
 
     return dfs_total
 
-def get_dados_nfe_by_pdf(pdf_name):
+def processar_pdfs_por_arquivo(tarefas, motor=None, workers=None, erros=None, progresso=None):
+    '''
+    Igual a processar_pdfs, mas mantendo de qual arquivo veio cada nota \n
+    retorna uma lista [(nome_arquivo, codigo_nota, lista_itens_nfe)] na ordem das tarefas
+    '''
+    return list(iterar_pdfs_por_arquivo(tarefas, motor, workers, erros, progresso))
+
+def iterar_pdfs_por_arquivo(tarefas, motor=None, workers=None, erros=None, progresso=None):
+    '''
+    Versão gerador de processar_pdfs_por_arquivo: entrega (nome_arquivo, codigo_nota, lista_itens_nfe) \n
+    assim que cada pdf é lido, na ordem das tarefas \n
+    Com mais de um worker os pdfs vão para o pool compartilhado do processo (obter_pool_pdfs)
+    '''
+    workers = min(workers or int(os.getenv("NFE_PDF_WORKERS", "1")), len(tarefas))
+    futuros = []
+    pool = None
+
+    if workers > 1:
+        pool = obter_pool_pdfs(workers)
+        try:
+            resultados = [(nome, agendar_nfe(pool, pdf, motor, futuros)) for nome, pdf in tarefas]
+        except BrokenProcessPool:
+            descartar_pool_pdfs(pool)
+            pool = obter_pool_pdfs(workers)
+            resultados = [(nome, agendar_nfe(pool, pdf, motor, futuros)) for nome, pdf in tarefas]
+    else:
+        resultados = [(nome, partial(ler_nfe, pdf, motor)) for nome, pdf in tarefas]
+
+    try:
+        for nome, recuperar_resultado in resultados:
+            try:
+                codigo, itens_nfe = recuperar_resultado()
+            except Exception as e:
+                registrar_erro("pdf")
+                if isinstance(e, BrokenProcessPool):
+                    descartar_pool_pdfs(pool)
+                if erros is None:
+                    raise
+                erros.append({"arquivo": nome, "erro": str(e)})
+                continue
+            finally:
+                if progresso:
+                    progresso(nome)
+
+            registrar_nota("pdf", itens_nfe)
+            yield nome, codigo, itens_nfe
+    finally:
+        # Leitura interrompida (erro ou cliente do ndjson desconectado): os pdfs que ainda não começaram
+        # saem da fila do pool compartilhado
+        for futuro in futuros:
+            futuro.cancel()
+
+def agendar_nfe(pool, pdf, motor=None, futuros=None):
+    '''
+    Consulta o cache no processo principal e envia ao pool apenas os pdfs que não estão nele \n
+    futuros: lista que recebe os futuros enviados ao pool \n
+    Retorna uma função que devolve (codigo_nota, itens_nfe)
+    '''
+    futuros = [] if futuros is None else futuros
+
+    if not cache_ativo():
+        futuros.append(pool.submit(ler_nfe, pdf, motor))
+        return futuros[-1].result
+
+    with abrir_documento(pdf) as documento:
+        chave = chave_sha256(documento.sha256, motor)
+    nfe = obter_cache_nfe().recuperar(chave)
+    if nfe is not None:
+        return partial(resultado_nfe, nfe)
+
+    futuro = pool.submit(ler_nfe, pdf, motor, False)
+    futuros.append(futuro)
+
+    def recuperar_resultado():
+        codigo, itens_nfe = futuro.result()
+        obter_cache_nfe().salvar(chave, {"itens": itens_nfe, "codigo_nfe": codigo})
+        return codigo, itens_nfe
+
+    return recuperar_resultado
+
+def ler_nfe(pdf, motor=None, usar_cache=True):
     '''
-    Recupera Tabelas de Produtos de um pdf
+    Recupera (codigo_nota, itens_nfe) de um pdf, aceitando também os bytes do pdf \n
+    Fica no nivel do módulo para poder ser executada pelos processos do pool
     '''
+    nfe = get_dados_nfe_by_pdf(pdf, motor=motor, usar_cache=usar_cache)
+    return resultado_nfe(nfe)
+
+def resultado_nfe(nfe):
+    return str(nfe["codigo_nfe"]), nfe["itens"]
+
+def get_dados_nfe_by_pdf(pdf_name, modo_tabula=None, motor=None, usar_cache=True):
+    '''
+    Recupera Tabelas de Produtos de um pdf \n
+    modo_tabula: "documento" (uma execução do tabula para o pdf inteiro) ou "pagina" (uma execução por página) \n
+    motor: "tabula" ou "pypdf" (sem Java, usando o tabula caso não reconheça a tabela) \n
+    usar_cache: consulta o cache pelo SHA-256 do pdf (e pelo motor / modo do tabula) antes de ler com pypdf/tabula \n
+    pdf_name pode ser um caminho, um arquivo aberto, os bytes do pdf ou um DocumentoPDF
+    '''
+    with abrir_documento(pdf_name) as documento:
+        return ler_documento_nfe(documento, modo_tabula, motor, usar_cache)
+
+def ler_documento_nfe(documento, modo_tabula=None, motor=None, usar_cache=True):
+    '''
+    Recupera as Tabelas de Produtos e o numero da nota de um DocumentoPDF \n
+    Todas as etapas usam os mesmos bytes e o mesmo PdfReader do documento
+    '''
+    # Consultando o cache a partir dos bytes do pdf
+    chave_cache = None
+    if usar_cache and cache_ativo():
+        chave_cache = chave_sha256(documento.sha256, motor, modo_tabula)
+        nfe = obter_cache_nfe().recuperar(chave_cache)
+        if nfe is not None:
+            return nfe
+
     # Recuperando lista de Paginas
-    reader = pyf.PdfReader(pdf_name)
-    paginas = len(reader.pages)
+    paginas = documento.paginas
+    registrar_paginas(paginas)
 
     # Cria o Dataframe Final 
     df_todos_os_produtos_nota = pd.DataFrame(columns=["CÓDIGO", "QTD."])
 
-    for page in range(paginas):
-        # Recuperando tabelas na pagina do pdf
-        lista_de_tabelas = tabula.read_pdf(pdf_name, pages=page + 1, lattice=True)
+    # Recuperando a tabela de produtos de cada pagina do pdf
+    tabelas_produtos = None
+    if (motor or os.getenv("NFE_MOTOR_PDF", "tabula")) == "pypdf":
+        with medir_etapa("extracao_pypdf"):
+            tabelas_produtos = extrair_tabelas_produtos_pypdf(documento)
+
+    if tabelas_produtos is not None:
+        tabelas_produtos = [montar_df_tabela(linhas) for linhas in tabelas_produtos]
+    elif os.getenv("NFE_TABULA_AREA", "1") == "1":
+        with medir_etapa("extracao_tabula_area"):
+            tabelas_produtos = extrair_tabelas_produtos_area(documento)
 
+    if tabelas_produtos is None:
         # Escolhendo a tabela que tem os dados dos produtos da nota   
-        df_itens_nota = lista_de_tabelas[-2]
+        with medir_etapa("extracao_tabula"):
+            tabelas_por_pagina = extrair_tabelas_por_pagina(documento.caminho(), paginas, modo_tabula)
+        tabelas_produtos = [lista_de_tabelas[-2] for lista_de_tabelas in tabelas_por_pagina]
 
+    # As paginas são acumuladas em uma lista e juntadas com um único concat
+    # (o DataFrame vazio só entra sem nenhuma pagina, para não deixar "QTD." como object)
+    paginas_itens = []
+    for df_itens_nota in tabelas_produtos:
         # Limpando colunas vazias e trocando valores vazios para ""
         df_itens_nota = df_itens_nota.dropna(how="all", axis=0)
         df_itens_nota = df_itens_nota.dropna(how="all", axis=1)
         df_itens_nota.fillna("")
 
-        df_todos_os_produtos_nota = pd.concat([
-            df_todos_os_produtos_nota,
-            df_itens_nota[["CÓDIGO", "QTD.", "DESCRIÇÃO DO PRODUTO/SERVIÇO"]]], 
-            ignore_index=True)
+        paginas_itens.append(df_itens_nota[["CÓDIGO", "QTD.", "DESCRIÇÃO DO PRODUTO/SERVIÇO"]])
+
+    df_todos_os_produtos_nota = pd.concat(paginas_itens or [df_todos_os_produtos_nota], ignore_index=True)
     
     # Limpando o código do produto
     df_todos_os_produtos_nota["CÓDIGO"] = df_todos_os_produtos_nota["CÓDIGO"].map(lambda txt: str(txt).replace("\r", ""))
+    # Mesma chave dos códigos da planilha de custos
+    df_todos_os_produtos_nota["CÓDIGO"] = normalizar_codigos(df_todos_os_produtos_nota["CÓDIGO"])
     
     df_todos_os_produtos_nota = df_todos_os_produtos_nota.rename(columns={
         "CÓDIGO":"Cod",
@@ -84,23 +243,154 @@ def get_dados_nfe_by_pdf(pdf_name):
 
 
     # Recuperando código da nota
-    codigo_nota = recuperar_numero_nota(pdf_name)
+    with medir_etapa("numero_nota"):
+        codigo_nota = recuperar_numero_nota(documento)
 
-    return {
+    nfe = {
         "itens":df_todos_os_produtos_nota, 
         "codigo_nfe": codigo_nota
     }
 
+    if chave_cache:
+        obter_cache_nfe().salvar(chave_cache, nfe)
+
+    return nfe
+
+def extrair_tabelas_por_pagina(pdf_name, paginas, modo_tabula=None):
+    '''
+    Recupera as tabelas do pdf agrupadas por pagina \n
+    No modo "documento" o tabula é executado uma única vez para todas as páginas \n
+    e as tabelas são separadas de volta por página a partir das suas coordenadas \n
+    Caso a separação não bata com o número de páginas, volta para o modo "pagina" \n
+    retorna uma lista [lista_de_tabelas_pagina_1, lista_de_tabelas_pagina_2, ...]
+    '''
+    modo_tabula = modo_tabula or os.getenv("NFE_TABULA_MODO", "documento")
+
+    if modo_tabula == "documento":
+        tabelas_json = ler_pdf_tabula(pdf_name, pages="all", lattice=True, output_format="json")
+        grupos = separar_tabelas_por_pagina(tabelas_json)
+
+        if len(grupos) == paginas:
+            return [
+                [tabela_json_para_df(tabela) for tabela in grupo if len(tabela["data"]) > 0]
+                for grupo in grupos
+            ]
+
+    return [ler_pdf_tabula(pdf_name, pages=page + 1, lattice=True) for page in range(paginas)]
+
+def ler_pdf_tabula(pdf_name, **opcoes):
+    '''
+    Executa o tabula.read_pdf, usando o processo auxiliar com o tabula-java já carregado \n
+    quando NFE_TABULA_WORKER=1
+    '''
+    if worker_tabula_ativo():
+        return obter_worker_tabula().read_pdf(pdf_name, **opcoes)
+
+    return tabula.read_pdf(pdf_name, **opcoes)
+
+def extrair_tabelas_produtos_area(documento):
+    '''
+    Executa o tabula apenas na área do bloco "DADOS DO PRODUTO/SERVIÇO" de cada pagina \n
+    e escolhe a tabela pelo cabeçalho (CÓDIGO / QTD.) em vez da posição na lista \n
+    Páginas com a mesma área são lidas em uma única execução do tabula \n
+    Retorna None caso a área ou a tabela de alguma pagina não seja encontrada
+    '''
+    areas = areas_produtos(documento)
+    if areas is None:
+        return None
+
+    paginas_por_area = {}
+    for indice, area in enumerate(areas):
+        paginas_por_area.setdefault(tuple(area), []).append(indice + 1)
+
+    tabela_por_pagina = {}
+    for area, paginas in paginas_por_area.items():
+        tabelas_json = ler_pdf_tabula(
+            documento.caminho(), pages=paginas, area=list(area), lattice=True, output_format="json"
+        )
+        tabelas = [tabela for tabela in tabelas_json if eh_tabela_produtos(tabela)]
+
+        # Cada pagina tem exatamente uma tabela de produtos
+        if len(tabelas) != len(paginas):
+            return None
+
+        tabela_por_pagina.update(zip(paginas, tabelas))
+
+    return [tabela_json_para_df(tabela_por_pagina[pagina]) for pagina in sorted(tabela_por_pagina)]
+
+def separar_tabelas_por_pagina(tabelas_json):
+    '''
+    Separa a saida json do tabula (lista plana de tabelas) por pagina \n
+    O tabula devolve as tabelas de cada pagina de cima para baixo, \n
+    então uma tabela que fica inteira acima da anterior inicia uma nova página
+    '''
+    grupos = []
+    anterior = None
+
+    for tabela in tabelas_json:
+        if anterior is None or tabela["bottom"] <= anterior["top"]:
+            grupos.append([])
+        grupos[-1].append(tabela)
+        anterior = tabela
+
+    return grupos
+
+def tabela_json_para_df(tabela):
+    '''
+    Converte uma tabela json do tabula em um DataFrame \n
+    Usa a primeira linha como cabeçalho, assim como o tabula.read_pdf
+    '''
+    linhas = [[celula["text"] for celula in linha] for linha in tabela["data"]]
+    return montar_df_tabela(linhas)
+
+def montar_df_tabela(linhas):
+    '''
+    Monta um DataFrame a partir das linhas de texto de uma tabela, como o _extract_from do tabula \n
+    Celulas vazias viram NaN, colunas repetidas são renomeadas e colunas numéricas são convertidas
+    '''
+    linhas = [[np.nan if not celula else celula for celula in linha] for linha in linhas]
+    cabecalho = linhas.pop(0)
+
+    # Colunas sem nome recebem "Unnamed: n"
+    sem_nome = 0
+    for idx, coluna in enumerate(cabecalho):
+        if coluna is np.nan:
+            cabecalho[idx] = f"Unnamed: {sem_nome}"
+            sem_nome += 1
+
+    # Colunas repetidas recebem o sufixo ".n" ("QTD.", "QTD..1"), como no tabula
+    contagens = {}
+    for idx, coluna in enumerate(cabecalho):
+        contagem = contagens.get(coluna, 0)
+        while contagem > 0:
+            contagens[coluna] = contagem + 1
+            coluna = f"{coluna}.{contagem}"
+            contagem = contagens.get(coluna, 0)
+
+        cabecalho[idx] = coluna
+        contagens[coluna] = contagem + 1
+
+    df = pd.DataFrame(linhas, columns=cabecalho)
+
+    # Converte para número as colunas que forem numéricas
+    for idx in range(len(df.columns)):
+        try:
+            df.isetitem(idx, pd.to_numeric(df.iloc[:, idx]))
+        except (ValueError, TypeError):
+            pass
+
+    return df
+
 def formatar_df(txt):
     return str(txt).replace("\r", "")
 
 
 def recuperar_numero_nota(pdf_name):
     '''
-    Recupera o numero da nota a partir de um pdf
+    Recupera o numero da nota a partir de um pdf (caminho, arquivo, bytes ou DocumentoPDF)
     '''
-    reader = pyf.PdfReader(pdf_name)
-    texto = reader.pages[0].extract_text().split("NOTA FISCAL: ")[1].split(" SÉRIE: ")[0]
+    with abrir_documento(pdf_name) as documento:
+        texto = documento.texto_pagina(0).split("NOTA FISCAL: ")[1].split(" SÉRIE: ")[0]
     return texto
 
 #recuperar_numero_nota("pdfs/nfe2.pdf")
\ No newline at end of file
@@ -0,0 +1,49 @@
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pool_pdfs = None
+_lock_pool_pdfs = threading.Lock()
+
+
+def obter_pool_pdfs(workers):
+    """
+    Retorna o pool de processos de leitura dos pdfs, compartilhado por todas as requisições do processo \n
+    Criado na primeira chamada com max(workers, NFE_PDF_WORKERS) processos, que ficam com o pandas e o pypdf \n
+    já importados entre uma requisição e outra e limitam o total de processos mesmo com várias threads
+    """
+    global _pool_pdfs
+
+    with _lock_pool_pdfs:
+        if _pool_pdfs is None:
+            # spawn evita herdar a JVM e as threads do processo do servidor
+            _pool_pdfs = ProcessPoolExecutor(
+                max_workers=max(workers, int(os.getenv("NFE_PDF_WORKERS", "1"))),
+                mp_context=mp.get_context("spawn"),
+            )
+        return _pool_pdfs
+
+
+def descartar_pool_pdfs(pool):
+    """
+    Descarta um pool quebrado (um processo filho morreu), a próxima requisição cria outro
+    """
+    global _pool_pdfs
+
+    with _lock_pool_pdfs:
+        if _pool_pdfs is pool:
+            _pool_pdfs = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def encerrar_pool_pdfs():
+    """
+    Encerra os processos do pool (no fim do worker do Gunicorn, ver gunicorn.conf.py)
+    """
+    global _pool_pdfs
+
+    with _lock_pool_pdfs:
+        pool, _pool_pdfs = _pool_pdfs, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
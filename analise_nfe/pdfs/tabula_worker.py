@@ -0,0 +1,208 @@
+import logging
+import multiprocessing as mp
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerTabula:
+    """
+    Processo auxiliar que mantém o tabula-java carregado entre as requisições \n
+    A JVM fica dentro do processo auxiliar pelo jpype1 (requirements.txt) e só é iniciada uma vez, \n
+    aquecer confere que o tabula não caiu no modo subprocess (um java novo a cada leitura) \n
+    Recebe (caminho_pdf, opções do tabula.read_pdf) por um Pipe e devolve o resultado do tabula \n
+    As leituras passam uma de cada vez pelo processo auxiliar \n
+    O processo é reiniciado quando morre ou passa do tempo limite
+    """
+
+    def __init__(self, tempo_limite=None):
+        self.tempo_limite = tempo_limite or float(os.getenv("NFE_TABULA_TIMEOUT", "120"))
+        self.lock = threading.Lock()
+        self.processo = None
+        self.conexao = None
+        self.reinicios = 0
+
+    def ativo(self):
+        return self.processo is not None and self.processo.is_alive()
+
+    def iniciar(self):
+        """
+        Inicia o processo auxiliar (spawn, para não herdar as threads do servidor)
+        """
+        contexto = mp.get_context("spawn")
+        self.conexao, conexao_worker = contexto.Pipe()
+        self.processo = contexto.Process(target=executar_worker, args=(conexao_worker,), daemon=True)
+        self.processo.start()
+        conexao_worker.close()
+
+    def parar(self):
+        """
+        Encerra o processo auxiliar
+        """
+        if self.conexao is not None:
+            self.conexao.close()
+            self.conexao = None
+
+        if self.processo is not None:
+            if self.processo.is_alive():
+                self.processo.kill()
+            self.processo.join()
+            self.processo = None
+
+    def read_pdf(self, caminho, **opcoes):
+        """
+        Executa tabula.read_pdf(caminho, **opcoes) no processo auxiliar \n
+        Se o processo tiver morrido ele é reiniciado e a leitura é repetida uma vez
+        """
+        return self.pedir(caminho, opcoes)
+
+    def modo(self):
+        """
+        Modo do tabula no processo auxiliar, ver modo_tabula
+        """
+        return self.pedir(None, {})
+
+    def pedir(self, caminho, opcoes):
+        """
+        Envia um pedido ao processo auxiliar (caminho None pede o modo do tabula) e espera a resposta
+        """
+        with self.lock:
+            for tentativa in range(2):
+                if not self.ativo():
+                    if self.processo is not None:
+                        self.reinicios += 1
+                    self.parar()
+                    self.iniciar()
+
+                try:
+                    self.conexao.send((caminho, opcoes))
+
+                    if not self.conexao.poll(self.tempo_limite):
+                        self.parar()
+                        raise TimeoutError(f"O tabula passou de {self.tempo_limite}s lendo {caminho}")
+
+                    sucesso, resultado = self.conexao.recv()
+                except (EOFError, BrokenPipeError, ConnectionResetError):
+                    self.parar()
+                    if tentativa == 1:
+                        raise RuntimeError("O processo do tabula foi encerrado durante a leitura")
+                    continue
+
+                if not sucesso:
+                    raise RuntimeError(f"Erro no tabula: {resultado}")
+
+                return resultado
+
+    def aquecer(self, caminho_exemplo=None):
+        """
+        Inicia o processo e carrega o tabula-java lendo um pdf de exemplo \n
+        Erro se o tabula estiver no modo subprocess, em que a JVM não fica carregada entre as leituras
+        """
+        caminho_exemplo = caminho_exemplo or pdf_exemplo()
+        if not caminho_exemplo:
+            raise RuntimeError("Nenhum pdf de exemplo para aquecer o tabula")
+
+        self.read_pdf(caminho_exemplo, pages=1, lattice=True, output_format="json")
+
+        modo = self.modo()
+        if modo != "jpype":
+            raise RuntimeError(f"O tabula está no modo {modo}, instale o jpype1 para manter a JVM carregada")
+
+
+def executar_worker(conexao):
+    """
+    Laço do processo auxiliar: recebe pedidos de leitura até a conexão ser fechada
+    """
+    import tabula
+
+    while True:
+        try:
+            caminho, opcoes = conexao.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        try:
+            if caminho is None:
+                conexao.send((True, modo_tabula()))
+            else:
+                conexao.send((True, tabula.read_pdf(caminho, **opcoes)))
+        except Exception as e:
+            conexao.send((False, f"{type(e).__name__}: {e}"))
+
+
+def modo_tabula():
+    """
+    Como o tabula deste processo executa o tabula-java depois da primeira leitura: \n
+    "jpype" (JVM dentro do processo, iniciada uma única vez) ou "subprocess" (sem o jpype1 ou sem a JVM, \n
+    um java novo a cada leitura)
+    """
+    import tabula.io
+    from tabula.backend import TabulaVm
+
+    return "jpype" if isinstance(tabula.io._tabula_vm, TabulaVm) else "subprocess"
+
+
+def pdf_exemplo():
+    """
+    Primeiro pdf de NFeExemplo, usado para aquecer o tabula
+    """
+    pasta = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "NFeExemplo"))
+    if not os.path.isdir(pasta):
+        return None
+
+    pdfs = sorted(arquivo for arquivo in os.listdir(pasta) if arquivo.endswith(".pdf"))
+    return os.path.join(pasta, pdfs[0]) if pdfs else None
+
+
+_worker_tabula = None
+_lock_worker_tabula = threading.Lock()
+
+
+def worker_tabula_ativo():
+    """
+    O processo auxiliar é ligado com NFE_TABULA_WORKER=1 e só é usado pelo processo principal \n
+    (os processos do pool de leitura em paralelo chamam o tabula diretamente)
+    """
+    return os.getenv("NFE_TABULA_WORKER", "0") == "1" and mp.parent_process() is None
+
+
+def obter_worker_tabula():
+    """
+    Retorna o processo auxiliar compartilhado, criando na primeira chamada
+    """
+    global _worker_tabula
+
+    with _lock_worker_tabula:
+        if _worker_tabula is None:
+            _worker_tabula = WorkerTabula()
+        return _worker_tabula
+
+
+def aquecer_tabula(em_segundo_plano=True):
+    """
+    Aquece o processo auxiliar do tabula na inicialização do servidor \n
+    Em segundo plano para não atrasar o boot do Gunicorn, a primeira requisição espera o aquecimento terminar
+    """
+    if not worker_tabula_ativo():
+        return None
+
+    worker = obter_worker_tabula()
+
+    if not em_segundo_plano:
+        worker.aquecer()
+        return None
+
+    thread = threading.Thread(target=aquecer_sem_erro, args=(worker,), name="aquecer-tabula", daemon=True)
+    thread.start()
+    return thread
+
+
+def aquecer_sem_erro(worker):
+    """
+    Um erro no aquecimento não derruba o servidor, a primeira leitura tenta de novo
+    """
+    try:
+        worker.aquecer()
+    except Exception:
+        logger.warning("Erro ao aquecer o tabula", exc_info=True)
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Quantidades ficam em inteiros com 4 casas decimais (mesma precisão do qCom da NF-e)
+ESCALA_QUANTIDADE = 10000
+
+COLUNAS_CENTAVOS = ["CUSTO_CENTAVOS", "QTDD_ESCALADA", "TOTAL_CENTAVOS"]
+
+
+def modo_centavos_ativo(valor=None):
+    """
+    Modo de valores em centavos inteiros, pelo campo da requisição ou por NFE_MODO_CENTAVOS=1
+    """
+    if valor is None:
+        valor = os.getenv("NFE_MODO_CENTAVOS", "0")
+    return str(valor).lower() in ("1", "true", "sim")
+
+
+def custos_para_centavos(custos: pd.Series):
+    """
+    Converte custos (float com 2 casas, como os de normalizar_custos) para centavos em int64 \n
+    O custo já arredondado está a menos de meio centavo do inteiro, então o np.rint é exato
+    """
+    return pd.Series(np.rint(custos.to_numpy(dtype=float) * 100).astype(np.int64), index=custos.index)
+
+
+def quantidades_para_inteiros(quantidades: pd.Series):
+    """
+    Converte quantidades para int64 com ESCALA_QUANTIDADE ('' vale 0, como no cálculo em float)
+    """
+    quantidades = pd.to_numeric(quantidades.mask(quantidades.eq(""), 0))
+    return pd.Series(np.rint(quantidades.to_numpy(dtype=float) * ESCALA_QUANTIDADE).astype(np.int64), index=quantidades.index)
+
+
+def total_centavos(quantidades_escaladas: pd.Series, custos_centavos: pd.Series):
+    """
+    Total em centavos de cada item, arredondando meio centavo para cima \n
+    Com quantidades inteiras a conta é exata
+    """
+    return (quantidades_escaladas * custos_centavos + ESCALA_QUANTIDADE // 2) // ESCALA_QUANTIDADE
+
+
+def adicionar_colunas_centavos(df_itens: pd.DataFrame, encontrados):
+    """
+    Adiciona CUSTO_CENTAVOS, QTDD_ESCALADA e TOTAL_CENTAVOS aos itens já juntados com a planilha \n
+    Itens sem custo na planilha ficam com 0 nas colunas em centavos
+    """
+    custos = custos_para_centavos(df_itens["CUSTO"].where(encontrados, 0))
+    quantidades = quantidades_para_inteiros(df_itens["QTDD"])
+
+    return df_itens.assign(
+        CUSTO_CENTAVOS=custos,
+        QTDD_ESCALADA=quantidades,
+        TOTAL_CENTAVOS=total_centavos(quantidades, custos),
+    )
+
+
+def centavos_para_texto(centavos: pd.Series):
+    """
+    Converte centavos em int64 para texto decimal ("241.00"), sem passar por float
+    """
+    centavos = centavos.astype(np.int64)
+    absolutos = centavos.abs()
+    sinal = pd.Series(np.where(centavos < 0, "-", ""), index=centavos.index)
+
+    return sinal + (absolutos // 100).astype(str) + "." + (absolutos % 100).astype(str).str.zfill(2)
+
+
+def quantidades_para_numero(quantidades_escaladas: pd.Series):
+    """
+    Converte as quantidades escaladas de volta, como int64 quando todas forem inteiras
+    """
+    if (quantidades_escaladas % ESCALA_QUANTIDADE == 0).all():
+        return quantidades_escaladas // ESCALA_QUANTIDADE
+    return quantidades_escaladas / ESCALA_QUANTIDADE
+
+
+def converter_centavos_para_json(df: pd.DataFrame):
+    """
+    Converte as colunas em centavos para a resposta JSON \n
+    X_CENTAVOS vira X em texto decimal e QTDD_ESCALADA volta a ser QTDD
+    """
+    colunas = {}
+    for coluna in df.columns:
+        if str(coluna).upper().endswith("_CENTAVOS"):
+            colunas[coluna] = (coluna[:-len("_CENTAVOS")], centavos_para_texto(df[coluna]))
+        elif coluna == "QTDD_ESCALADA":
+            colunas[coluna] = ("QTDD", quantidades_para_numero(df[coluna]))
+
+    if not colunas:
+        return df
+
+    df = df.assign(**{coluna: valores for coluna, (_, valores) in colunas.items()})
+    return df.rename(columns={coluna: nome for coluna, (nome, _) in colunas.items()})
@@ -1,45 +1,94 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
-def create_planilhas_by_danfe(planilha_items:pd.DataFrame, itens_danfe:dict, title=""):
+from analise_nfe.planilha.centavos import COLUNAS_CENTAVOS, adicionar_colunas_centavos
+
+# Coluna auxiliar com a posição da nota no merge de todas as notas
+COLUNA_NOTA = "__nota"
+
+logger = logging.getLogger(__name__)
+
+def create_planilhas_by_danfe(planilha_items:pd.DataFrame, itens_danfe:dict, title="", centavos=False, indice=None):
     """
     Percorre um dicionario de itens_danfe \n
     {codigo: df_itens_danfe} \n
     Recebe um dataframe com a planilha de custo \n
-    Retorna um dicionario com os valores
+    Os resultados de cada nota são acumulados em listas e juntados uma única vez \n
+    centavos: custos, quantidades e totais em int64 (CUSTO_CENTAVOS, QTDD_ESCALADA, TOTAL_CENTAVOS e total_centavos), \n
+    convertidos para decimal apenas na resposta JSON (converter_centavos_para_json) \n
+    indice: planilha indexada por "Cod" (montar_indice / Catalogo.indice), usada no lugar do merge \n
+    Retorna um dicionario com os valores (um DataFrame cada, com a coluna "numeroDaNota")
     { \n
         planilha_total_itens: df_total_itens_nfe, \n
-        planilha_itens_nao_encontrados: erros_by_nfe_dict, \n
-        planilha_itens_nfe: itens_by_nfe_dict \n
+        planilha_itens_nao_encontrados: df_itens_nao_encontrados, \n
+        planilha_itens_nfe: df_itens_nfe \n
     }
     """
-    erros_by_nfe_dict = {}
-    itens_by_nfe_dict = {}
-    df_total_itens_nfe = pd.DataFrame(columns=["numeroDaNota", "total"])
+    erros_by_nfe = []
+    itens_by_nfe = []
+    linhas_total_itens_nfe = []
 
     # Recupera os itens validos, não encontrados e o total da nota
-    dict_danfe_infos = recupera_informacoes_sobre_as_nfe(planilha_items, itens_danfe, title)
+    dict_danfe_infos = recupera_informacoes_sobre_as_nfe(planilha_items, itens_danfe, title, centavos, indice)
 
     for codigo, danfe_infos in dict_danfe_infos.items():
         # Recupera informações da Danfe
         item_df, soma_total, erros_df = danfe_infos
         
         # Registra os erros e os itens
-        erros_by_nfe_dict.update({codigo:erros_df.to_dict(orient="records")})
-        itens_by_nfe_dict.update({codigo:item_df.to_dict(orient="records")})
+        erros_by_nfe.append(erros_df.assign(numeroDaNota=codigo))
+        itens_by_nfe.append(item_df.assign(numeroDaNota=codigo))
 
-        nova_linha_df_total = pd.DataFrame([[codigo, soma_total]], columns=["numeroDaNota", "total"])
+        linhas_total_itens_nfe.append([codigo, soma_total])
 
-        df_total_itens_nfe = pd.concat([ df_total_itens_nfe, nova_linha_df_total], ignore_index=True)
+    if centavos:
+        df_total_itens_nfe = pd.DataFrame(linhas_total_itens_nfe, columns=["numeroDaNota", "total_centavos"])
+        df_total_itens_nfe["total_centavos"] = df_total_itens_nfe["total_centavos"].astype(np.int64)
+    else:
+        df_total_itens_nfe = pd.DataFrame(linhas_total_itens_nfe, columns=["numeroDaNota", "total"], dtype=object)
     
     return {
         "planilha_total_itens": df_total_itens_nfe, 
-        "planilha_itens_nao_encontrados": erros_by_nfe_dict, 
-        "planilha_itens_nfe": itens_by_nfe_dict
+        "planilha_itens_nao_encontrados": juntar_por_nota(erros_by_nfe), 
+        "planilha_itens_nfe": juntar_por_nota(itens_by_nfe)
     }
 
-def recupera_informacoes_sobre_as_nfe(planilha_items:pd.DataFrame, itens_danfe:dict, title=""):
+def juntar_por_nota(dfs_notas):
+    """
+    Junta os DataFrames de cada nota em um só, com "numeroDaNota" como primeira coluna
+    """
+    if not dfs_notas:
+        return pd.DataFrame(columns=["numeroDaNota"])
+
+    df = pd.concat(dfs_notas, ignore_index=True)
+    return df[["numeroDaNota"] + [coluna for coluna in df.columns if coluna != "numeroDaNota"]]
+
+def quantidades_numericas(df_itens):
+    """
+    Passa a coluna "QTDD" de object para número ('' vale 0), como as notas em que o pdf já tem os números \n
+    (o DataFrame vazio do inicio da leitura do pdf deixa a coluna como object) \n
+    Colunas com algum texto que não é número ficam como estão
+    """
+    if df_itens["QTDD"].dtype != object:
+        return df_itens
+
+    try:
+        quantidades = pd.to_numeric(df_itens["QTDD"].where(df_itens["QTDD"] != "", 0))
+    except (ValueError, TypeError):
+        return df_itens
+
+    return df_itens.assign(QTDD=quantidades)
+
+def recupera_informacoes_sobre_as_nfe(planilha_items:pd.DataFrame, itens_danfe:dict, title="", centavos=False, indice=None):
     """
     Percorre um dicionario de NFe {codigo:df_itens_nfe}\n
+    Junta os itens de todas as notas com a planilha em um único merge \n
+    "QTDD" em object é convertida para número antes (quantidades_numericas), então QTDD e TOTAL saem numéricas \n
+    e calcula o total de cada nota com um groupby \n
+    centavos: os valores ficam em int64 e a soma é o total em centavos (int) em vez do texto "{:.2f}" \n
+    indice: planilha já indexada por "Cod" (montar_indice), os custos são buscados pelo índice sem merge \n
     Retorna um dicionario com as seguintes informações sobre a nfe\n
     {codigo: [\n
         df_nfe_itens_validos,\n 
@@ -50,31 +99,89 @@ def recupera_informacoes_sobre_as_nfe(planilha_items:pd.DataFrame, itens_danfe:d
     # Cria um dicionario vazio
     dict_danfe = {}
 
-    # Percorre um dicionario de nfe {codigo:df_itens_danfe}
-    for codigo, df_itens in itens_danfe.items():
-        # Junta os dfs, df_itens_danfe e df_planilha_itens a partir do código dos itens
-        df_nfe_itens_validos = pd.merge(df_itens, planilha_items, on='Cod', how='left')
-        print(df_nfe_itens_validos)
+    if not itens_danfe:
+        return dict_danfe
+
+    codigos = list(itens_danfe.keys())
+    notas = [quantidades_numericas(df) for df in itens_danfe.values()]
+    tipos_notas = [df.dtypes for df in notas]
+
+    # Junta os itens de todas as notas, marcando a posição da nota em COLUNA_NOTA
+    df_itens = pd.concat(
+        [df.assign(**{COLUNA_NOTA: posicao}) for posicao, df in enumerate(notas)],
+        ignore_index=True,
+    )
+
+    if indice is not None:
+        # Busca pelo índice (a tabela de hash já está montada), sem percorrer a planilha
+        # Códigos repetidos no índice repetem o item, como no merge
+        df_todos_itens = df_itens.join(indice, on="Cod").reset_index(drop=True)
+    else:
+        # Apenas as linhas da planilha com códigos presentes nas notas entram no merge
+        planilha_usada = planilha_items[planilha_items["Cod"].isin(df_itens["Cod"].unique())]
+
+        # Junta os itens de todas as notas com a planilha a partir do código dos itens
+        # O merge "left" mantém a ordem dos itens, então cada nota continua em um bloco contínuo
+        df_todos_itens = pd.merge(df_itens, planilha_usada, on='Cod', how='left')
+
+    # Itens da NFe que possuem um custo na planilha
+    encontrados = df_todos_itens["CUSTO"].notna().to_numpy()
+
+    # Soma de todas as notas em um único groupby ('' na coluna "QTDD" vale 0)
+    if centavos:
+        df_todos_itens = adicionar_colunas_centavos(df_todos_itens, encontrados)
+        totais = df_todos_itens["TOTAL_CENTAVOS"]
+    else:
+        totais = df_todos_itens["QTDD"].replace("", 0) * df_todos_itens["CUSTO"]
+    somas = totais[encontrados].groupby(df_todos_itens[COLUNA_NOTA][encontrados]).sum()
+
+    # Inicio e fim do bloco de cada nota
+    limites = np.searchsorted(df_todos_itens[COLUNA_NOTA].to_numpy(), np.arange(len(codigos) + 1))
+    df_todos_itens = df_todos_itens.drop(columns=[COLUNA_NOTA])
+
+    for posicao, codigo in enumerate(codigos):
+        inicio, fim = limites[posicao], limites[posicao + 1]
+        encontrados_nota = encontrados[inicio:fim]
+        df_nota = df_todos_itens.iloc[inicio:fim].reset_index(drop=True)
+
+        # O concat pode ter mudado o tipo das colunas da nota (ex: QTDD int64 + object)
+        tipos = tipos_notas[posicao]
+        if not df_nota.dtypes[tipos.index].equals(tipos):
+            df_nota = df_nota.astype(tipos.to_dict())
+
         # Na coluna "QTDD" os itens com os valores '' serão trocados por 0
-        df_nfe_itens_validos['QTDD'] = df_nfe_itens_validos['QTDD'].replace("", 0)
+        df_nota['QTDD'] = df_nota['QTDD'].replace("", 0)
 
         # Recupera os itens da NFe que não possuem um custo na planilha
-        df_nfe_itens_nao_encontrados = df_nfe_itens_validos[df_nfe_itens_validos["CUSTO"].isna() == True]
-        
-        # Recupera os itens da NFe que possuem um custo na planilha
-        df_nfe_itens_validos = df_nfe_itens_validos[df_nfe_itens_validos["CUSTO"].isna() == False]
+        df_nfe_itens_nao_encontrados = df_nota[~encontrados_nota]
+        if centavos:
+            df_nfe_itens_nao_encontrados = df_nfe_itens_nao_encontrados.drop(columns=COLUNAS_CENTAVOS)
         
         # Caso tenha algum item da NFe sem um valor na coluna Custo
-        if not df_nfe_itens_nao_encontrados.empty:
-            print("ERROS", title, codigo)            
-            print(df_nfe_itens_nao_encontrados[["Cod", "QTDD", "ITEM"]])
+        # (os itens só são montados para o log quando o nivel DEBUG está ligado)
+        if not df_nfe_itens_nao_encontrados.empty and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Itens sem custo na planilha", extra={
+                "titulo": title,
+                "nota": codigo,
+                "itens": df_nfe_itens_nao_encontrados[["Cod", "QTDD", "ITEM"]].to_dict(orient="records"),
+            })
         
         # Caso não possua nenhum item da NFe com algum valor na coluna custo
-        if len(df_nfe_itens_validos) == 0:
+        if not encontrados_nota.any():
             continue
         
+        # Recupera os itens da NFe que possuem um custo na planilha
+        df_nfe_itens_validos = df_nota[encontrados_nota]
+
+        if centavos:
+            df_nfe_itens_validos = df_nfe_itens_validos.reindex(
+                columns=["ITEM","Cod","CUSTO_CENTAVOS","QTDD_ESCALADA","TOTAL_CENTAVOS"]
+            ).reset_index(drop=True)
+            dict_danfe.update({codigo: [df_nfe_itens_validos, int(somas[posicao]), df_nfe_itens_nao_encontrados]})
+            continue
+
         # Cria a coluna "Total" para cada item valido da NFe
-        df_nfe_itens_validos["TOTAL"] = df_nfe_itens_validos["QTDD"] * df_nfe_itens_validos["CUSTO"]
+        df_nfe_itens_validos = df_nfe_itens_validos.assign(TOTAL=df_nfe_itens_validos["QTDD"] * df_nfe_itens_validos["CUSTO"])
         
         # Define a ordem em que serão exibidas as colunas do dataframe
         # reset_index reinicia o index do dataframe
@@ -82,10 +189,9 @@ def recupera_informacoes_sobre_as_nfe(planilha_items:pd.DataFrame, itens_danfe:d
         df_nfe_itens_validos = df_nfe_itens_validos.reindex(columns=["ITEM","Cod","CUSTO","QTDD","TOTAL"]).reset_index(drop=True)
         
         # Recupera o valor final da nota
-        df_soma_total = df_nfe_itens_validos["TOTAL"].sum()
-        soma_total_todos_itens = "{:.2f}".format(df_soma_total)
+        soma_total_todos_itens = "{:.2f}".format(somas[posicao])
 
         dict_danfe.update({codigo: [df_nfe_itens_validos, soma_total_todos_itens, df_nfe_itens_nao_encontrados]})
 
 
-    return dict_danfe
\ No newline at end of file
+    return dict_danfe
@@ -0,0 +1,264 @@
+import logging
+import os
+
+import pandas as pd
+
+from analise_nfe.metricas.main import medir_etapa, registrar_erro
+from analise_nfe.catalogo.main import montar_indice
+from analise_nfe.nfe_xml.main import iterar_xmls_por_arquivo
+from analise_nfe.pdfs.main import iterar_pdfs_por_arquivo, tarefas_pdfs
+from analise_nfe.planilha.centavos import converter_centavos_para_json
+from analise_nfe.planilha.main import create_planilhas_by_danfe
+from analise_nfe.produtos.blocos import planilha_em_blocos_ativa, recuperar_planilhas_em_blocos, tamanho_arquivo
+from analise_nfe.produtos.main import carregar_planilha, recuperar_planilhas
+from analise_nfe.sugestoes.main import adicionar_sugestoes, obter_indice_codigos, sugestoes_ativas
+
+logger = logging.getLogger(__name__)
+
+
+def processar_arquivos_nfe(pdfs, xmls, csv_file=None, catalogo=None, motor=None, centavos=False, progresso=None):
+    '''
+    Analisa as notas enviadas (pdfs e xmls) com a planilha de custos, como em /processar_arquivos \n
+    csv_file: planilha de custos enviada (csv, parquet ou xlsx), usada quando não há catalogo \n
+    catalogo: Catalogo salvo em /catalogos \n
+    Os arquivos podem ser os uploads do Flask ou qualquer arquivo aberto com o atributo filename \n
+    progresso: função chamada com o nome de cada nota depois de lida \n
+    Retorna (resposta, codigo_http), com as planilhas como DataFrames (ver codificar_resposta)
+    '''
+    planilha_response, planilha_em_blocos, erro = preparar_planilha(csv_file, catalogo)
+    if erro:
+        return erro
+
+    # Você pode realizar outras operações com os PDFs aqui (ex: extração de texto, análise de conteúdo)
+    # Os PDFs que falharem são informados na resposta sem interromper o lote
+    # O XML tem os dados exatos da nota, então substitui o PDF da mesma nota (mesma regra do streaming)
+    pdfs_com_erro = []
+    nfe_pdfs_list = {
+        codigo: itens_nfe for _, codigo, itens_nfe in iterar_notas(pdfs, xmls, motor, pdfs_com_erro, progresso)
+    }
+
+    if planilha_em_blocos:
+        planilha_response, erro = ler_planilha_em_blocos(csv_file, nfe_pdfs_list.values())
+        if erro:
+            return erro
+
+    planilha_duplicados = planilha_response["planilhaDuplicados"] if planilha_response["codigo"] == 203 else []
+    # Linhas com um CUSTO que não pôde ser convertido (ficam com custo 0.0)
+    planilha_custos_invalidos = planilha_response.get("custosInvalidos", [])
+
+    informacoes_nfe = analisar_notas(planilha_response, nfe_pdfs_list, catalogo, planilha_em_blocos, centavos)
+
+    # RESPOSTA CORRIGIDA – TUDO COMO ARRAY JSON
+    # Os DataFrames vão direto para codificar_resposta, que os serializa sem to_dict
+    response = {
+        "planilha_itens_nfe": quadro(informacoes_nfe["planilha_itens_nfe"]),
+        "planilha_itens_nao_encontrados": quadro(informacoes_nfe["planilha_itens_nao_encontrados"]),
+        "planilha_total_itens": quadro(informacoes_nfe["planilha_total_itens"]),
+        "planilha_duplicados": quadro(planilha_duplicados),
+        "planilha_custos_invalidos": quadro(planilha_custos_invalidos),
+        "pdfs_com_erro": pdfs_com_erro
+    }
+    
+    return response, 200
+
+
+def processar_arquivos_nfe_por_nota(pdfs, xmls, csv_file=None, catalogo=None, motor=None, centavos=False, progresso=None):
+    '''
+    Versão em streaming de processar_arquivos_nfe: a planilha é validada antes e as notas são entregues \n
+    uma a uma, assim que cada nota é lida e juntada com a planilha \n
+    Retorna (linhas, None), com linhas um gerador de dicionarios (ver gerar_linhas_por_nota), \n
+    ou (None, (resposta, codigo_http)) se a planilha for inválida
+    '''
+    planilha_response, planilha_em_blocos, erro = preparar_planilha(csv_file, catalogo)
+    if erro:
+        return None, erro
+
+    linhas = gerar_linhas_por_nota(
+        pdfs, xmls, planilha_response, planilha_em_blocos, csv_file, catalogo, motor, centavos, progresso
+    )
+    return linhas, None
+
+
+def gerar_linhas_por_nota(pdfs, xmls, planilha_response, planilha_em_blocos, csv_file, catalogo, motor, centavos, progresso):
+    '''
+    Gera as linhas da resposta em streaming (com DataFrames, ver codificar_resposta): \n
+    {"tipo": "nota", numeroDaNota, arquivo, total, planilha_itens_nfe, planilha_itens_nao_encontrados} para cada nota \n
+    {"tipo": "erro", arquivo, erro} para cada arquivo que não pôde ser lido \n
+    e por último {"tipo": "resumo", planilha_total_itens, planilha_duplicados, planilha_custos_invalidos, pdfs_com_erro} \n
+    Apenas os totais ficam em memória até o resumo
+    '''
+    pdfs_com_erro = []
+    notas = iterar_notas(pdfs, xmls, motor, pdfs_com_erro, progresso)
+
+    # Na leitura em blocos a planilha depende dos códigos de todas as notas
+    if planilha_em_blocos:
+        notas = list(notas)
+        planilha_response, erro = ler_planilha_em_blocos(csv_file, [itens_nfe for _, _, itens_nfe in notas])
+        if erro:
+            resposta, codigo = erro
+            yield {"tipo": "erro", "codigo": codigo, "erro": resposta["error"]}
+            return
+
+    totais = []
+    erros_enviados = 0
+    # Índices da planilha montados na primeira nota e reaproveitados nas seguintes
+    indices = {}
+
+    for nome, codigo, itens_nfe in notas:
+        for erro in pdfs_com_erro[erros_enviados:]:
+            yield {"tipo": "erro", **erro}
+        erros_enviados = len(pdfs_com_erro)
+
+        informacoes_nfe = analisar_notas(
+            planilha_response, {codigo: itens_nfe}, catalogo, planilha_em_blocos, centavos, indices
+        )
+        total_nota = informacoes_nfe["planilha_total_itens"].to_dict(orient="records")
+        totais.extend(total_nota)
+
+        yield {
+            "tipo": "nota",
+            "numeroDaNota": codigo,
+            "arquivo": nome,
+            "total": total_nota[0]["total"] if total_nota else None,
+            "planilha_itens_nfe": quadro(informacoes_nfe["planilha_itens_nfe"]),
+            "planilha_itens_nao_encontrados": quadro(informacoes_nfe["planilha_itens_nao_encontrados"]),
+        }
+
+    for erro in pdfs_com_erro[erros_enviados:]:
+        yield {"tipo": "erro", **erro}
+
+    yield {
+        "tipo": "resumo",
+        "planilha_total_itens": totais,
+        "planilha_duplicados": quadro(planilha_response.get("planilhaDuplicados")),
+        "planilha_custos_invalidos": quadro(planilha_response.get("custosInvalidos")),
+        "pdfs_com_erro": pdfs_com_erro,
+    }
+
+
+def iterar_notas(pdfs, xmls, motor, erros, progresso=None):
+    '''
+    Entrega (nome_arquivo, codigo_nota, itens_nfe) assim que cada nota é lida \n
+    Os xmls vêm antes porque têm os dados exatos: o pdf de uma nota já entregue é ignorado \n
+    Entre arquivos do mesmo tipo vale o primeiro. Usado pela resposta em streaming e por processar_arquivos_nfe
+    '''
+    entregues = set()
+    workers = int(os.getenv("NFE_PDF_WORKERS", "1"))
+
+    leituras = [
+        iterar_xmls_por_arquivo([(arquivo.filename, arquivo) for arquivo in xmls], erros, progresso),
+        iterar_pdfs_por_arquivo(tarefas_pdfs(pdfs, workers), motor, workers, erros, progresso),
+    ]
+
+    for leitura in leituras:
+        for nome, codigo, itens_nfe in leitura:
+            if codigo in entregues:
+                continue
+            entregues.add(codigo)
+            yield nome, codigo, itens_nfe
+
+
+def preparar_planilha(csv_file=None, catalogo=None):
+    '''
+    Recupera a planilha de custos do catalogo ou do arquivo enviado \n
+    Retorna (planilha_response, planilha_em_blocos, erro), com erro = (resposta, codigo_http) ou None \n
+    Na leitura em blocos planilha_response fica None até as notas serem lidas (ler_planilha_em_blocos)
+    '''
+    if catalogo is not None:
+        return catalogo.resposta, False, None
+
+    # Csvs grandes (NFE_PLANILHA_BLOCOS_MB) são lidos em blocos depois das notas,
+    # guardando apenas as linhas dos códigos usados nas notas
+    if planilha_em_blocos_ativa(csv_file.filename, tamanho_arquivo(csv_file)):
+        return None, True, None
+
+    # Lê apenas as colunas usadas, sem inferir tipos
+    try:
+        with medir_etapa("leitura_planilha"):
+            planilha = carregar_planilha(csv_file, csv_file.filename)
+        logger.debug("Planilha de custos lida", extra={"arquivo": csv_file.filename, "linhas": len(planilha)})
+        with medir_etapa("recuperar_planilhas"):
+            planilha_response = recuperar_planilhas(planilha)
+    except Exception as e:
+        return None, False, ({"error": f"Erro ao ler o CSV: {str(e)}"}, 400)
+
+    # Caso a planilha não seje valida
+    if planilha_response["codigo"] != 200 and planilha_response["codigo"] != 203:
+        registrar_erro("planilha_invalida")
+        return None, False, resposta_planilha_invalida(planilha_response)
+
+    return planilha_response, False, None
+
+
+def ler_planilha_em_blocos(csv_file, itens_notas):
+    '''
+    Lê a planilha em blocos guardando os códigos dos itens das notas \n
+    Retorna (planilha_response, erro) como em preparar_planilha
+    '''
+    codigos_notas = {codigo for itens_nfe in itens_notas for codigo in itens_nfe["Cod"]}
+    try:
+        with medir_etapa("leitura_planilha_blocos"):
+            planilha_response = recuperar_planilhas_em_blocos(csv_file, codigos_notas)
+    except Exception as e:
+        return None, ({"error": f"Erro ao ler o CSV: {str(e)}"}, 400)
+
+    if planilha_response["codigo"] != 200 and planilha_response["codigo"] != 203:
+        registrar_erro("planilha_invalida")
+        return None, resposta_planilha_invalida(planilha_response)
+
+    return planilha_response, None
+
+
+def analisar_notas(planilha_response, notas, catalogo, planilha_em_blocos, centavos, indices=None):
+    '''
+    create_planilhas_by_danfe com as sugestões para os itens não encontrados \n
+    e os centavos já convertidos para a resposta JSON \n
+    indices: dicionario reaproveitado entre as chamadas com a mesma planilha (uma chamada por nota no streaming), \n
+    guarda o índice por "Cod" e o IndiceCodigos das sugestões para não percorrer a planilha a cada nota
+    '''
+    # Com um catálogo os custos vêm do índice montado uma vez por versão (ver Catalogo.indice)
+    # No streaming o índice da planilha enviada é montado uma vez e usado por todas as notas
+    indice = catalogo.indice if catalogo is not None else None
+    if indice is None and indices is not None:
+        if "planilha" not in indices:
+            indices["planilha"] = montar_indice(planilha_response["planilha"])
+        indice = indices["planilha"]
+
+    with medir_etapa("juntar_planilha"):
+        informacoes_nfe = create_planilhas_by_danfe(planilha_response["planilha"], notas, centavos=centavos, indice=indice)
+
+    # Sugere códigos do catálogo para os itens não encontrados (NFE_SUGESTOES=0 desliga)
+    # O índice é montado uma vez por catálogo e só quando algum item não for encontrado
+    # Na leitura em blocos o catálogo inteiro não fica em memória, então não há sugestões
+    nao_encontrados = informacoes_nfe["planilha_itens_nao_encontrados"]
+    if sugestoes_ativas() and not planilha_em_blocos and not nao_encontrados.empty:
+        with medir_etapa("sugestoes"):
+            if catalogo:
+                indice_codigos = catalogo.indice_codigos
+            elif indices is not None:
+                if "codigos" not in indices:
+                    indices["codigos"] = obter_indice_codigos(planilha_response["planilha"])
+                indice_codigos = indices["codigos"]
+            else:
+                indice_codigos = obter_indice_codigos(planilha_response["planilha"])
+            informacoes_nfe["planilha_itens_nao_encontrados"] = adicionar_sugestoes(nao_encontrados, indice_codigos)
+
+    # Os centavos só viram decimal aqui, na resposta
+    if centavos:
+        informacoes_nfe = {chave: converter_centavos_para_json(df) for chave, df in informacoes_nfe.items()}
+
+    return informacoes_nfe
+
+
+def quadro(df):
+    '''
+    DataFrame da resposta (um DataFrame vazio para o que não for DataFrame)
+    '''
+    return df if isinstance(df, pd.DataFrame) else pd.DataFrame()
+
+
+def resposta_planilha_invalida(planilha_response):
+    return {
+        "error": planilha_response["mensage"], 
+        "planilha": planilha_response["planilha"]
+    }, planilha_response["codigo"] 
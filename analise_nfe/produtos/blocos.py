@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analise_nfe.produtos.main import (
+    COLUNAS_PLANILHA,
+    TIPOS_PLANILHA,
+    normalizar_codigos,
+    normalizar_custos,
+    verificando_colunas_planilha,
+)
+
+# Quantidade máxima de custos (texto -> valor) lembrados entre os blocos
+MAXIMO_CUSTOS_LEMBRADOS = 500000
+
+# Arquivos em que os hashes são divididos quando passam do limite de memória (pelos 4 bits mais altos)
+BITS_PARTICAO = 4
+PARTICOES = 2 ** BITS_PARTICAO
+
+
+class DetectorDuplicados:
+    """
+    Conjunto dos hashes (uint64) dos códigos já lidos, para achar "Cod" repetidos sem guardar a planilha \n
+    Acima de memoria_maxima bytes os hashes vão para disco, divididos em PARTICOES arquivos pelos bits mais altos \n
+    No fim cada partição é lida separadamente, então a memória usada fica perto de memoria_maxima
+    """
+
+    def __init__(self, memoria_maxima):
+        self.memoria_maxima = memoria_maxima
+        self.blocos = []
+        self.bytes_memoria = 0
+        self.pasta = None
+
+    def adicionar(self, hashes):
+        self.blocos.append(hashes)
+        self.bytes_memoria += hashes.nbytes
+
+        if self.bytes_memoria > self.memoria_maxima:
+            self._despejar()
+
+    def duplicados(self):
+        """
+        Hashes que apareceram mais de uma vez (conjunto de inteiros)
+        """
+        if self.pasta is None:
+            return hashes_repetidos(np.concatenate(self.blocos) if self.blocos else np.zeros(0, dtype=np.uint64))
+
+        self._despejar()
+        repetidos = set()
+        for particao in range(PARTICOES):
+            repetidos |= hashes_repetidos(np.fromfile(self._caminho(particao), dtype=np.uint64))
+        return repetidos
+
+    def fechar(self):
+        if self.pasta is not None:
+            shutil.rmtree(self.pasta, ignore_errors=True)
+            self.pasta = None
+        self.blocos = []
+
+    def _despejar(self):
+        if self.pasta is None:
+            self.pasta = tempfile.mkdtemp(prefix="nfe_duplicados_")
+            for particao in range(PARTICOES):
+                open(self._caminho(particao), "wb").close()
+
+        if not self.blocos:
+            return
+
+        hashes = np.concatenate(self.blocos)
+        particoes = hashes >> np.uint64(64 - BITS_PARTICAO)
+        for particao in range(PARTICOES):
+            with open(self._caminho(particao), "ab") as arquivo:
+                arquivo.write(hashes[particoes == particao].tobytes())
+
+        self.blocos = []
+        self.bytes_memoria = 0
+
+    def _caminho(self, particao):
+        return os.path.join(self.pasta, f"{particao}.bin")
+
+
+class NormalizadorCustos:
+    """
+    normalizar_custos para uma sequência de blocos, lembrando os custos já convertidos \n
+    (os mesmos custos se repetem ao longo do catálogo, então cada texto é convertido uma única vez)
+    """
+
+    def __init__(self, maximo=MAXIMO_CUSTOS_LEMBRADOS):
+        self.maximo = maximo
+        self.conhecidos = {}
+
+    def normalizar(self, custos: pd.Series):
+        codigos, unicos = pd.factorize(custos)
+        novos = [unico for unico in unicos if unico not in self.conhecidos]
+
+        if novos:
+            if len(self.conhecidos) + len(novos) > self.maximo:
+                self.conhecidos = {}
+            valores, invalidos = normalizar_custos(pd.Series(novos, dtype=custos.dtype))
+            self.conhecidos.update(zip(novos, zip(valores.tolist(), invalidos.tolist())))
+
+        # factorize marca os vazios com -1, que apontam para (0.0, válido) no fim da lista
+        convertidos = [self.conhecidos[unico] for unico in unicos] + [(0.0, False)]
+        valores = np.array([valor for valor, _ in convertidos])[codigos]
+        invalidos = np.array([invalido for _, invalido in convertidos], dtype=bool)[codigos]
+
+        return pd.Series(valores, index=custos.index), pd.Series(invalidos, index=custos.index)
+
+
+def hashes_repetidos(hashes):
+    hashes = np.sort(hashes)
+    return set(np.unique(hashes[1:][hashes[1:] == hashes[:-1]]).tolist())
+
+
+def hash_codigos(codigos: pd.Series):
+    return pd.util.hash_array(codigos.to_numpy(dtype=object))
+
+
+def tamanho_arquivo(arquivo):
+    """
+    Tamanho em bytes de um arquivo aberto (ou do upload do Flask), voltando para o inicio
+    """
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return tamanho
+
+
+def planilha_em_blocos_ativa(nome_arquivo, tamanho):
+    """
+    Planilhas csv maiores que NFE_PLANILHA_BLOCOS_MB (padrão 100, 0 desliga) são lidas em blocos
+    """
+    limite_mb = float(os.getenv("NFE_PLANILHA_BLOCOS_MB", "100"))
+    return limite_mb > 0 and str(nome_arquivo).lower().endswith(".csv") and tamanho > limite_mb * 1024 * 1024
+
+
+def ler_blocos(arquivo, linhas_bloco):
+    # usecols com a lista das colunas (e não uma função) deixa o parser descartar as outras colunas mais cedo
+    arquivo.seek(0)
+    colunas = [coluna for coluna in pd.read_csv(arquivo, nrows=0).columns if coluna in COLUNAS_PLANILHA]
+    arquivo.seek(0)
+    return pd.read_csv(arquivo, usecols=colunas, dtype=TIPOS_PLANILHA, chunksize=linhas_bloco)
+
+
+def recuperar_planilhas_em_blocos(arquivo, codigos_notas, linhas_bloco=None, memoria_maxima_mb=None):
+    """
+    Versão de recuperar_planilhas para csvs grandes, lidos em blocos de linhas_bloco linhas \n
+    Guarda apenas as linhas com os códigos de codigos_notas (os itens das notas enviadas) \n
+    Os "Cod" repetidos são encontrados pelos hashes (DetectorDuplicados, até memoria_maxima_mb em memória) \n
+    e só quando existem o csv é lido uma segunda vez para recuperar as linhas repetidas \n
+    arquivo precisa aceitar seek (o upload do Flask ou um arquivo aberto) \n
+    Return {codigo, planilha, planilhaDuplicados, custosInvalidos}, como recuperar_planilhas
+    """
+    linhas_bloco = linhas_bloco or int(os.getenv("NFE_PLANILHA_BLOCO_LINHAS", "100000"))
+    memoria_maxima_mb = memoria_maxima_mb or float(os.getenv("NFE_PLANILHA_MEMORIA_MB", "64"))
+
+    arquivo.seek(0)
+    colunas = verificando_colunas_planilha(pd.read_csv(arquivo, nrows=0))
+    if colunas["codigo"] != 200:
+        return colunas
+
+    codigos_notas = pd.Index(list(codigos_notas), dtype=object)
+    detector = DetectorDuplicados(memoria_maxima_mb * 1024 * 1024)
+    normalizador = NormalizadorCustos()
+    usados = []
+    invalidos = []
+
+    try:
+        for bloco in ler_blocos(arquivo, linhas_bloco):
+            custos, custos_invalidos = normalizador.normalizar(bloco["CUSTO"])
+            invalidos.append(bloco[custos_invalidos].assign(Cod=lambda df: normalizar_codigos(df["Cod"])))
+
+            bloco = bloco.assign(CUSTO=custos, Cod=normalizar_codigos(bloco["Cod"]))
+            detector.adicionar(hash_codigos(bloco["Cod"]))
+            usados.append(bloco[bloco["Cod"].isin(codigos_notas)])
+
+        repetidos = detector.duplicados()
+    finally:
+        detector.fechar()
+
+    planilha = juntar_blocos(usados)
+    resposta = {"codigo": 200, "planilha": planilha, "custosInvalidos": juntar_blocos(invalidos)}
+
+    if repetidos:
+        planilha_de_duplicados = recuperar_duplicados(arquivo, repetidos, linhas_bloco)
+        if not planilha_de_duplicados.empty:
+            resposta.update({"codigo": 203, "planilhaDuplicados": planilha_de_duplicados})
+
+    return resposta
+
+
+def recuperar_duplicados(arquivo, repetidos, linhas_bloco):
+    """
+    Segunda leitura do csv: linhas com os hashes repetidos, conferidas pelo "Cod" (descarta colisões) \n
+    Ordenadas por "Cod" como em verificando_itens_duplicados
+    """
+    repetidos = np.fromiter(repetidos, dtype=np.uint64)
+    candidatos = []
+
+    for bloco in ler_blocos(arquivo, linhas_bloco):
+        bloco = bloco.assign(Cod=normalizar_codigos(bloco["Cod"]))
+        bloco = bloco[np.isin(hash_codigos(bloco["Cod"]), repetidos)]
+        candidatos.append(bloco.assign(CUSTO=normalizar_custos(bloco["CUSTO"])[0]))
+
+    candidatos = juntar_blocos(candidatos)
+    planilha_de_duplicados = candidatos[candidatos.duplicated("Cod", keep=False)]
+    return planilha_de_duplicados.sort_values(by="Cod", ignore_index=True)
+
+
+def juntar_blocos(blocos):
+    if not blocos:
+        return pd.DataFrame(columns=COLUNAS_PLANILHA)
+    return pd.concat(blocos, ignore_index=True)
@@ -1,43 +1,175 @@
+import importlib.util
+import os
+import re
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# Tudo que não for número ou ponto é removido do custo
+REGEX_NAO_NUMERICO = r'[^0-9.]'
+REGEX_NAO_NUMERICO_VIRGULA = r'[^0-9.,]'
+# "1.500,00" -> "1500.00"
+TABELA_VIRGULA_DECIMAL = str.maketrans({'.': None, ',': '.'})
+# "1,500.00" -> "1500.00"
+TABELA_PONTO_DECIMAL = str.maketrans({',': None})
+
+# Códigos só com dígitos ("0123", "123.0") são comparados sem zeros à esquerda e sem casas decimais
+REGEX_CODIGO_NUMERICO = r'\d+(?:\.0*)?'
+
+# Apenas essas colunas da planilha de custos são lidas, as outras não aparecem na resposta
+# (nem em "planilhaDuplicados" / "custosInvalidos")
+COLUNAS_PLANILHA = ["PRODUTOS", "Cod", "CUSTO"]
+# Texto sem inferência de tipo: "Cod" já chega como string e CUSTO vai para normalizar_custos
+TIPOS_PLANILHA = {"PRODUTOS": object, "Cod": str, "CUSTO": object}
+FORMATOS_PLANILHA = (".csv", ".parquet", ".xlsx")
+
+
+def formato_planilha(nome_arquivo):
+    """
+    Extensão da planilha de custos (".csv", ".parquet" ou ".xlsx") ou None se não for suportada
+    """
+    extensao = os.path.splitext(str(nome_arquivo or ""))[1].lower()
+    return extensao if extensao in FORMATOS_PLANILHA else None
+
+
+def motor_csv():
+    """
+    Motor do pd.read_csv: "pyarrow" (multithread) quando instalado, senão o "c" \n
+    NFE_CSV_MOTOR força um dos dois
+    """
+    motor = os.getenv("NFE_CSV_MOTOR")
+    if motor:
+        return motor
+    return "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+
+def carregar_planilha(arquivo, nome_arquivo="planilha.csv"):
+    """
+    Lê a planilha de custos em csv, parquet ou xlsx (o formato vem da extensão de nome_arquivo) \n
+    Somente as colunas COLUNAS_PLANILHA são lidas, sem inferir tipos (TIPOS_PLANILHA) \n
+    As outras colunas do arquivo são descartadas e não voltam em nenhuma parte da resposta \n
+    parquet precisa do pyarrow e xlsx do openpyxl \n
+    Retorna o DataFrame para recuperar_planilhas
+    """
+    formato = formato_planilha(nome_arquivo)
+
+    if formato == ".parquet":
+        import pyarrow.parquet as pq
+
+        colunas = [coluna for coluna in pq.ParquetFile(arquivo).schema_arrow.names if coluna in COLUNAS_PLANILHA]
+        arquivo.seek(0)
+        return pd.read_parquet(arquivo, columns=colunas)
+
+    if formato == ".xlsx":
+        return pd.read_excel(arquivo, usecols=lambda coluna: coluna in COLUNAS_PLANILHA, dtype=TIPOS_PLANILHA)
+
+    motor = motor_csv()
+    if motor == "pyarrow":
+        # O pyarrow não aceita usecols com função, então as colunas vêm do cabeçalho
+        colunas = [coluna for coluna in pd.read_csv(arquivo, nrows=0).columns if coluna in COLUNAS_PLANILHA]
+        arquivo.seek(0)
+        return pd.read_csv(arquivo, usecols=colunas, dtype=TIPOS_PLANILHA, engine="pyarrow")
+
+    return pd.read_csv(arquivo, usecols=lambda coluna: coluna in COLUNAS_PLANILHA, dtype=TIPOS_PLANILHA, engine=motor)
 
 def recuperar_planilhas(planilha):
     """
     Recupera uma planilha de produtos a partir de um csv \n
     Verifica se as colunas são validas \n
-    Verifica se Existem itens duplicados \n
-    Formata o custo \n
-    passa a coluna "Cod" para string \n
-    Return {codigo, planilha}
+    Verifica se Existem itens duplicados (com as colunas lidas por carregar_planilha, PRODUTOS / Cod / CUSTO) \n
+    Formata o custo (as linhas com custo inválido ficam em "custosInvalidos" com o valor original) \n
+    passa a coluna "Cod" para string com normalizar_codigos, a mesma regra dos códigos das notas \n
+    Return {codigo, planilha, custosInvalidos}
     """
     isColumnValid = verificando_colunas_planilha(planilha)
     if isColumnValid["codigo"] == 200:
-        planilha["CUSTO"] = planilha["CUSTO"].map(formatar_custo)
-        planilha["Cod"] = planilha["Cod"].astype(str)
-        return verificando_itens_duplicados(planilha)
+        custos, invalidos = normalizar_custos(planilha["CUSTO"])
+        custos_invalidos = planilha[invalidos].copy()
+
+        planilha["CUSTO"] = custos
+        planilha["Cod"] = normalizar_codigos(planilha["Cod"])
+        custos_invalidos["Cod"] = normalizar_codigos(custos_invalidos["Cod"])
+
+        resposta = verificando_itens_duplicados(planilha)
+        resposta["custosInvalidos"] = custos_invalidos
+        return resposta
     else:
         return isColumnValid
     
 
+def normalizar_codigos(codigos: pd.Series):
+    """
+    Chave de comparação dos códigos, a mesma para a planilha de custos e para as notas (pdf e xml) \n
+    Os códigos viram texto sem espaços nas pontas e os que só têm dígitos perdem os zeros à esquerda \n
+    e as casas decimais zeradas: "0123", "123", 123 e 123.0 viram "123", "GR02A-DIS" fica como está
+    """
+    texto = codigos.astype(str).str.strip()
+    numericos = texto.str.fullmatch(REGEX_CODIGO_NUMERICO)
+    texto[numericos] = texto[numericos].str.split('.').str[0].str.lstrip('0').replace('', '0')
+    return texto
+
+
+def normalizar_custos(custos: pd.Series):
+    """
+    Versão vetorizada de formatar_custo para a coluna inteira \n
+    Aceita: '1.500,00', '120,50', '1500.00', '1,500.00', 'R$ 10', 1500.0 e vazio (0.0) \n
+    Com ponto e vírgula o último separador é o decimal e o outro é o de milhar \n
+    Retorna (custos em float com 2 casas, mascara das linhas que não puderam ser convertidas) \n
+    As linhas inválidas ficam com 0.0, como em formatar_custo
+    """
+    if is_numeric_dtype(custos):
+        return custos.astype(float).round(2).fillna(0.0), pd.Series(False, index=custos.index)
+
+    # Cada valor diferente é convertido uma única vez (catálogos repetem muitos custos)
+    codigos, unicos = pd.factorize(custos)
+    texto = pd.Series(unicos, dtype=object).astype(str)
+
+    # Remove R$, espaços e tudo que não for número, ponto ou vírgula
+    texto = texto.str.replace(REGEX_NAO_NUMERICO_VIRGULA, '', regex=True)
+    # O último separador é o decimal: "1.500,00" e "120,50" têm vírgula decimal, "1,500.00" tem ponto decimal
+    posicao_virgula = texto.str.rfind(',')
+    posicao_ponto = texto.str.rfind('.')
+    virgula_decimal = posicao_virgula > posicao_ponto
+    ponto_decimal = (posicao_virgula >= 0) & (posicao_ponto > posicao_virgula)
+    texto[virgula_decimal] = texto[virgula_decimal].str.translate(TABELA_VIRGULA_DECIMAL)
+    texto[ponto_decimal] = texto[ponto_decimal].str.translate(TABELA_PONTO_DECIMAL)
+
+    # factorize marca os vazios com -1, que apontam para o 0.0 no fim da lista
+    valores_unicos = np.append(pd.to_numeric(texto, errors='coerce').to_numpy(dtype=float), 0.0)
+    valores = pd.Series(valores_unicos[codigos], index=custos.index)
+    invalidos = valores.isna()
+
+    return valores.fillna(0.0).round(2), invalidos
+
+
 def formatar_custo(item):
     """
     Converte qualquer valor de CUSTO para float com 2 casas decimais.
-    Aceita: '1.500,00', '1500.00', '1500', 1500.0
+    Aceita: '1.500,00', '1500.00', '1,500.00', '1500', 1500.0
+    Com ponto e vírgula o último separador é o decimal e o outro é o de milhar
     """
     if pd.isna(item):
         return 0.0
+    if isinstance(item, (int, float)):
+        return round(float(item), 2)
     try:
         # Converte para string
         valor_str = str(item).strip()
         # Remove espaços, R$, etc
         valor_str = valor_str.replace('R$', '').replace(' ', '')
-        # Troca vírgula por ponto
-        valor_str = valor_str.replace(',', '.')
+        # O último separador é o decimal e o outro é o de milhar
+        if valor_str.rfind(',') > valor_str.rfind('.'):
+            # Com vírgula decimal o ponto é separador de milhar, e a vírgula vira ponto
+            valor_str = valor_str.replace('.', '').replace(',', '.')
+        else:
+            # Com ponto decimal a vírgula é separador de milhar
+            valor_str = valor_str.replace(',', '')
         # Remove tudo que não for número ou ponto
-        import re
-        valor_str = re.sub(r'[^0-9.]', '', valor_str)
+        valor_str = re.sub(REGEX_NAO_NUMERICO, '', valor_str)
         # Converte para float
         return round(float(valor_str), 2)
-    except:
+    except ValueError:
         return 0.0
 
 def verificando_itens_duplicados(planilha: pd.DataFrame):
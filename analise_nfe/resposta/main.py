@@ -0,0 +1,87 @@
+import datetime
+import decimal
+import json
+
+import numpy as np
+import pandas as pd
+
+from analise_nfe.metricas.main import medir_etapa
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "registros": [{coluna: valor}], "colunas": {"columns": [...], "data": [[...]]} (sem repetir os nomes em cada linha)
+FORMATOS_QUADRO = ("registros", "colunas")
+
+
+def codificar_resposta(resposta, formato="registros"):
+    '''
+    Codifica a resposta em JSON (bytes, UTF-8), com os DataFrames convertidos por quadro_json \n
+    NaN e None viram null e os tipos do numpy viram números do JSON \n
+    Valores que o JSON não representa geram TypeError, como no json.dumps \n
+    Usa o orjson quando instalado, senão o json da biblioteca padrão
+    '''
+    def converter(valor):
+        if isinstance(valor, pd.DataFrame):
+            return quadro_json(valor, formato)
+        return valor_json(valor)
+
+    with medir_etapa("resposta_json"):
+        if orjson is not None:
+            return orjson.dumps(resposta, default=converter, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+        return json.dumps(resposta, default=converter, ensure_ascii=False).encode("utf-8")
+
+
+def quadro_json(df: pd.DataFrame, formato="registros"):
+    '''
+    DataFrame no formato de FORMATOS_QUADRO, com os valores já em tipos do Python \n
+    Os valores saem coluna por coluna (tolist, sem o to_dict célula por célula) \n
+    "colunas" não cria objetos por linha além da lista de valores, "registros" ainda monta um dicionario \n
+    por linha a partir dessas colunas (o formato exige os nomes em cada linha)
+    '''
+    colunas = [str(coluna) for coluna in df.columns]
+    linhas = zip(*(valores_coluna(df.iloc[:, posicao]) for posicao in range(len(colunas))))
+
+    if formato == "colunas":
+        return {"columns": colunas, "data": [list(linha) for linha in linhas]}
+
+    return [dict(zip(colunas, linha)) for linha in linhas]
+
+
+def valores_coluna(serie: pd.Series):
+    '''
+    Valores de uma coluna em tipos do Python (tolist), com os vazios (NaN, NaT) como None \n
+    O orjson já escreve NaN como null, então só as colunas de object precisam de conversão
+    '''
+    valores = serie.tolist()
+
+    if orjson is not None and serie.dtype != object:
+        return valores
+
+    vazios = serie.isna().to_numpy()
+    if not vazios.any():
+        return valores
+
+    return [None if vazio else valor for valor, vazio in zip(valores, vazios)]
+
+
+def valor_json(valor):
+    '''
+    Conversão dos valores que o encoder não conhece (tipos do numpy em colunas object, datas, Decimal) \n
+    Outros objetos geram TypeError, para um erro de montagem da resposta não chegar ao cliente como texto
+    '''
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+        return None if isinstance(valor, float) and valor != valor else valor
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    if isinstance(valor, pd.Series):
+        return valores_coluna(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return str(valor)
+    raise TypeError(f"Objeto do tipo {type(valor).__name__} não é serializável em JSON")
@@ -0,0 +1,208 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Sufixos de embalagem que costumam faltar ou sobrar no código da nota
+REGEX_SUFIXO = re.compile(r"[-_ ]*(DIS|UD)$")
+REGEX_SEPARADORES = re.compile(r"[^0-9A-Z]")
+
+TAMANHO_NGRAMA = 3
+
+# Símbolos das chaves normalizadas, o 0 fica para o preenchimento dos arrays
+ALFABETO = "\0^$0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TABELA_ALFABETO = np.zeros(256, dtype=np.int64)
+TABELA_ALFABETO[[ord(simbolo) for simbolo in ALFABETO]] = np.arange(len(ALFABETO))
+TOTAL_NGRAMAS = len(ALFABETO) ** TAMANHO_NGRAMA
+
+# N-gramas presentes em mais que essa fração dos códigos (ex: "SKU") não ajudam a escolher candidatos
+FRACAO_MAXIMA_NGRAMA = 0.2
+
+# Semelhança minima (Jaccard dos n-gramas) para um código ser sugerido
+SEMELHANCA_MINIMA = 0.3
+
+
+class IndiceCodigos:
+    """
+    Índice dos códigos ("Cod") de uma planilha para sugerir candidatos aos itens não encontrados \n
+    Montado uma vez por catálogo: chave normalizada (maiúsculas, sem "\\r", traços e espaços), \n
+    chave sem sufixo (-DIS / -UD) e um índice invertido de n-gramas da chave sem sufixo
+    """
+
+    def __init__(self, codigos):
+        self.codigos = list(dict.fromkeys(str(codigo) for codigo in codigos))
+
+        chaves, bases = zip(*map(chaves_codigo, self.codigos)) if self.codigos else ((), ())
+        self.por_chave = agrupar_posicoes(chaves)
+        self.por_base = agrupar_posicoes(bases)
+
+        # Pares (n-grama, posição do código) sem repetição, ordenados pelo n-grama e depois pela posição
+        posicoes, ngramas = ngramas_codigos(bases)
+        pares = np.sort(ngramas * max(len(self.codigos), 1) + posicoes)
+        unicos = np.ones(len(pares), dtype=bool)
+        unicos[1:] = pares[1:] != pares[:-1]
+        pares = pares[unicos]
+        ngramas, posicoes = np.divmod(pares, max(len(self.codigos), 1))
+
+        self.tamanhos = np.bincount(posicoes, minlength=len(self.codigos))
+
+        # Postagem de cada n-grama: posicoes_ngramas[inicios[i]:fins[i]]
+        self.posicoes_ngramas = posicoes.astype(np.int32)
+        self.ngramas, self.inicios = np.unique(ngramas, return_index=True)
+        self.fins = np.append(self.inicios[1:], len(pares))
+
+        self.maximo_postagem = max(1, int(len(self.codigos) * FRACAO_MAXIMA_NGRAMA))
+
+    def sugerir(self, codigo, limite=3):
+        """
+        Sugere até limite códigos do catálogo para um código não encontrado \n
+        Retorna uma lista [(codigo, semelhanca)] da mais para a menos parecida \n
+        Chave normalizada igual vale 1.0 e chave sem sufixo igual vale 0.95
+        """
+        chave, base = chaves_codigo(codigo)
+        sugestoes = OrderedDict()
+
+        for posicao in self.por_chave.get(chave, []):
+            sugestoes[posicao] = 1.0
+        for posicao in self.por_base.get(base, []):
+            sugestoes.setdefault(posicao, 0.95)
+
+        if len(sugestoes) < limite:
+            for posicao, semelhanca in self._semelhantes(base, limite):
+                sugestoes.setdefault(posicao, semelhanca)
+
+        return [(self.codigos[posicao], semelhanca) for posicao, semelhanca in list(sugestoes.items())[:limite]]
+
+    def _semelhantes(self, base, limite):
+        _, ngramas = ngramas_codigos([base])
+        ngramas = np.unique(ngramas)
+        if not len(self.ngramas):
+            return []
+
+        # Postagem (códigos que têm o n-grama) de cada n-grama da consulta
+        indices = np.minimum(np.searchsorted(self.ngramas, ngramas), len(self.ngramas) - 1)
+        indices = indices[self.ngramas[indices] == ngramas]
+        postagens = [self.posicoes_ngramas[self.inicios[indice]:self.fins[indice]] for indice in indices]
+        if not postagens:
+            return []
+
+        # Ignora os n-gramas muito comuns, a menos que só existam eles
+        raras = [postagem for postagem in postagens if len(postagem) <= self.maximo_postagem]
+        postagens = raras or postagens
+
+        candidatos, comuns = np.unique(np.concatenate(postagens), return_counts=True)
+        semelhancas = comuns / (len(ngramas) + self.tamanhos[candidatos] - comuns)
+
+        # Apenas os limite melhores são ordenados
+        melhores = np.arange(len(semelhancas))
+        if len(semelhancas) > limite:
+            melhores = np.argpartition(-semelhancas, limite - 1)[:limite]
+        melhores = melhores[np.lexsort((candidatos[melhores], -semelhancas[melhores]))]
+        return [
+            (int(candidatos[indice]), round(float(semelhancas[indice]), 3))
+            for indice in melhores
+            if semelhancas[indice] >= SEMELHANCA_MINIMA
+        ]
+
+
+def chaves_codigo(codigo):
+    """
+    Retorna (chave normalizada, chave sem sufixo) de um código
+    """
+    texto = str(codigo).upper().replace("\r", "").strip()
+    chave = REGEX_SEPARADORES.sub("", texto)
+    base = REGEX_SEPARADORES.sub("", REGEX_SUFIXO.sub("", texto)) or chave
+    return chave, base
+
+
+def agrupar_posicoes(chaves):
+    """
+    Dicionario {chave: [posições]}
+    """
+    posicoes = {}
+    for posicao, chave in enumerate(chaves):
+        posicoes.setdefault(chave, []).append(posicao)
+    return posicoes
+
+
+def ngramas_codigos(bases):
+    """
+    N-gramas de cada chave, com marcadores de inicio e fim para valorizar prefixos e sufixos \n
+    Cada n-grama vira um inteiro (3 símbolos do ALFABETO) para o índice ficar em arrays do numpy \n
+    Retorna (posição da chave, n-grama) para todos os n-gramas de todas as chaves
+    """
+    textos = [f"^{base}$".encode() for base in bases]
+    if not textos:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    tamanho = max(max(len(texto) for texto in textos), TAMANHO_NGRAMA)
+
+    simbolos = TABELA_ALFABETO[np.array(textos, dtype=f"S{tamanho}").view(np.uint8).reshape(len(textos), tamanho)]
+    tamanhos = np.array([len(texto) for texto in textos])
+
+    # N-grama de cada janela de 3 símbolos
+    ngramas = (
+        simbolos[:, :-2].astype(np.int64) * len(ALFABETO) ** 2
+        + simbolos[:, 1:-1] * len(ALFABETO)
+        + simbolos[:, 2:]
+    )
+    # Apenas janelas inteiras dentro da chave (chaves curtas como "^$" viram uma janela só)
+    validas = np.arange(tamanho - TAMANHO_NGRAMA + 1) <= np.maximum(tamanhos - TAMANHO_NGRAMA, 0)[:, None]
+
+    posicoes = np.broadcast_to(np.arange(len(textos))[:, None], ngramas.shape)
+    return posicoes[validas], ngramas[validas]
+
+
+def adicionar_sugestoes(df_nao_encontrados, indice, limite=None):
+    """
+    Adiciona a coluna SUGESTOES (lista de códigos do catálogo) aos itens não encontrados \n
+    Cada código diferente é consultado uma única vez
+    """
+    limite = limite or int(os.getenv("NFE_SUGESTOES_LIMITE", "3"))
+
+    if df_nao_encontrados.empty or "Cod" not in df_nao_encontrados.columns:
+        return df_nao_encontrados.assign(SUGESTOES=pd.Series(dtype=object))
+
+    sugestoes = {
+        codigo: [sugerido for sugerido, _ in indice.sugerir(codigo, limite)]
+        for codigo in df_nao_encontrados["Cod"].unique()
+    }
+    return df_nao_encontrados.assign(SUGESTOES=df_nao_encontrados["Cod"].map(sugestoes))
+
+
+def sugestoes_ativas():
+    """
+    As sugestões podem ser desligadas com NFE_SUGESTOES=0
+    """
+    return os.getenv("NFE_SUGESTOES", "1") != "0"
+
+
+_indices = OrderedDict()
+_lock_indices = threading.Lock()
+MAXIMO_INDICES = 4
+
+
+def obter_indice_codigos(planilha):
+    """
+    Retorna o IndiceCodigos da planilha, montado uma única vez para cada conjunto de códigos \n
+    (a mesma planilha enviada de novo ou a mesma versão do catálogo reaproveitam o índice)
+    """
+    codigos = planilha["Cod"].astype(str)
+    assinatura = (len(codigos), int(pd.util.hash_pandas_object(codigos, index=False).sum()))
+
+    with _lock_indices:
+        if assinatura in _indices:
+            _indices.move_to_end(assinatura)
+            return _indices[assinatura]
+
+    indice = IndiceCodigos(codigos)
+
+    with _lock_indices:
+        _indices[assinatura] = indice
+        while len(_indices) > MAXIMO_INDICES:
+            _indices.popitem(last=False)
+
+    return indice
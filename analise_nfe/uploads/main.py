@@ -0,0 +1,191 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+MB = 1024 * 1024
+
+
+class PastaUploads:
+    """
+    Pasta temporária dos arquivos de uma requisição, criada só quando algum arquivo vai para o disco \n
+    Controla também quantos bytes dos arquivos da requisição estão em memória
+    """
+
+    def __init__(self, memoria_maxima, base=None):
+        self.memoria_maxima = memoria_maxima
+        self.base = base
+        self.bytes_memoria = 0
+        self.pasta = None
+        self.lock = threading.Lock()
+
+    def reservar_memoria(self, tamanho):
+        """
+        Reserva tamanho bytes da memória da requisição; False quando passaria de memoria_maxima
+        """
+        with self.lock:
+            if self.bytes_memoria + tamanho > self.memoria_maxima:
+                return False
+            self.bytes_memoria += tamanho
+            return True
+
+    def liberar_memoria(self, tamanho):
+        with self.lock:
+            self.bytes_memoria -= tamanho
+
+    def novo_arquivo(self):
+        with self.lock:
+            if self.pasta is None:
+                if self.base:
+                    os.makedirs(self.base, exist_ok=True)
+                self.pasta = tempfile.mkdtemp(prefix="nfe_upload_", dir=self.base or None)
+        descritor, caminho = tempfile.mkstemp(dir=self.pasta)
+        return os.fdopen(descritor, "w+b"), caminho
+
+    def remover(self):
+        with self.lock:
+            pasta, self.pasta = self.pasta, None
+        if pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+class ArquivoUpload(io.RawIOBase):
+    """
+    Destino de um arquivo enviado: fica em memória enquanto a requisição tiver memória reservada \n
+    (NFE_UPLOAD_MEMORIA_MB no total) e depois passa para um arquivo na PastaUploads \n
+    No disco o caminho fica em caminho, para o pypdf, o tabula e os processos do pool lerem direto do arquivo \n
+    Passar de tamanho_maximo bytes interrompe o envio com 413
+    """
+
+    def __init__(self, pasta, tamanho_maximo, nome=None):
+        super().__init__()
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.nome = nome
+        self.arquivo = io.BytesIO()
+        self.caminho = None
+        self.tamanho = 0
+
+    def write(self, dados):
+        novo_tamanho = max(self.tamanho, self.arquivo.tell() + len(dados))
+        if novo_tamanho > self.tamanho_maximo:
+            raise RequestEntityTooLarge(
+                f"O arquivo '{self.nome}' passa do limite de {formatar_mb(self.tamanho_maximo)} MB por arquivo."
+            )
+
+        if self.caminho is None and novo_tamanho > self.tamanho:
+            if not self.pasta.reservar_memoria(novo_tamanho - self.tamanho):
+                self._para_o_disco()
+
+        escritos = self.arquivo.write(dados)
+        self.tamanho = novo_tamanho
+        return escritos
+
+    def readinto(self, destino):
+        dados = self.arquivo.read(len(destino))
+        destino[:len(dados)] = dados
+        return len(dados)
+
+    def read(self, tamanho=-1):
+        return self.arquivo.read(tamanho)
+
+    def readline(self, tamanho=-1):
+        return self.arquivo.readline(tamanho)
+
+    def seek(self, posicao, referencia=io.SEEK_SET):
+        return self.arquivo.seek(posicao, referencia)
+
+    def tell(self):
+        return self.arquivo.tell()
+
+    def flush(self):
+        self.arquivo.flush()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self.arquivo.close()
+        if self.caminho is None:
+            self.pasta.liberar_memoria(self.tamanho)
+        else:
+            try:
+                os.remove(self.caminho)
+            except OSError:
+                pass
+
+    def _para_o_disco(self):
+        arquivo, self.caminho = self.pasta.novo_arquivo()
+        posicao = self.arquivo.tell()
+        arquivo.write(self.arquivo.getbuffer())
+        arquivo.seek(posicao)
+
+        self.pasta.liberar_memoria(self.tamanho)
+        self.arquivo = arquivo
+
+
+class RequisicaoComUploads(Request):
+    """
+    Request do Flask que grava os arquivos enviados em ArquivoUpload \n
+    Os arquivos e a pasta temporária são removidos quando a requisição termina (close)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_form_parts = limite_arquivos() + 50
+        self.pasta_uploads = PastaUploads(int(float(os.getenv("NFE_UPLOAD_MEMORIA_MB", "8")) * MB), os.getenv("NFE_UPLOAD_DIR"))
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return ArquivoUpload(self.pasta_uploads, limite_arquivo(), filename)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.pasta_uploads.remover()
+
+
+def caminho_upload(arquivo):
+    """
+    Caminho no disco de um arquivo enviado (FileStorage com um ArquivoUpload), ou None se estiver em memória
+    """
+    return getattr(getattr(arquivo, "stream", arquivo), "caminho", None)
+
+
+def limite_arquivo():
+    """
+    Tamanho máximo de cada arquivo enviado, NFE_UPLOAD_ARQUIVO_MB (padrão 50)
+    """
+    return int(float(os.getenv("NFE_UPLOAD_ARQUIVO_MB", "50")) * MB)
+
+
+def limite_requisicao():
+    """
+    Tamanho máximo do corpo de uma requisição, NFE_UPLOAD_REQUISICAO_MB (padrão 1024, 0 = sem limite)
+    """
+    limite = float(os.getenv("NFE_UPLOAD_REQUISICAO_MB", "1024"))
+    return int(limite * MB) if limite > 0 else None
+
+
+def limite_arquivos():
+    """
+    Quantidade máxima de arquivos em uma requisição, NFE_UPLOAD_MAXIMO_ARQUIVOS (padrão 1000)
+    """
+    return int(os.getenv("NFE_UPLOAD_MAXIMO_ARQUIVOS", "1000"))
+
+
+def formatar_mb(tamanho):
+    return f"{tamanho / MB:.4g}"
@@ -0,0 +1,366 @@
+"""
+Benchmark do pipeline de análise das DANFEs
+Executa get_dados_nfe_by_pdf, carregar_planilha, recuperar_planilhas, create_planilhas_by_danfe e codificar_resposta com os arquivos de
+NFeExemplo e PlanilhaExemplo e com entradas aumentadas (centenas de pdfs e catálogos com 100k+ SKUs)
+Mede tempo, pico de memória e pdfs/s de cada etapa e compara com benchmarks/baseline.json
+Confere também que create_planilhas_by_danfe cresce de forma linear de 10 a 1000 notas
+Mede também a inicialização do servidor (importação do main.py e primeira requisição) em um processo novo
+O baseline guarda em "_ambiente" a máquina, as versões e as opções com que foi gerado (--salvar-baseline)
+
+Uso:
+    python -m benchmarks.main
+    python -m benchmarks.main --pdfs 300 --skus 150000 --motor tabula
+    python -m benchmarks.main --salvar-baseline
+    python -m benchmarks.main --memoria
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.aquecimento.main import pico_rss_mb, reiniciar_pico_rss
+from analise_nfe.pdfs.main import get_dados_nfe_by_pdf
+from analise_nfe.planilha.main import create_planilhas_by_danfe
+from analise_nfe.produtos.main import carregar_planilha, recuperar_planilhas
+from analise_nfe.resposta.main import codificar_resposta
+
+PASTA_RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PASTA_PDFS = os.path.join(PASTA_RAIZ, 'NFeExemplo')
+CSV_EXEMPLO = os.path.join(PASTA_RAIZ, 'PlanilhaExemplo', 'Planilha G Rollz - Main.csv')
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Uma etapa é uma regressão quando o tempo passa do baseline mais essa fração
+TOLERANCIA = 0.25
+
+# Quantidades de notas usadas para conferir que create_planilhas_by_danfe cresce de forma linear
+ESCALONAMENTO_NOTAS = (10, 100, 1000)
+# Razão máxima entre o tempo por nota da maior e da menor quantidade
+RAZAO_LINEAR = 2.0
+
+
+def medir(nome, funcao, quantidade_pdfs=None, rastrear_memoria=False):
+    """
+    Executa funcao() medindo o tempo e o pico de memória \n
+    O pico de RSS é o da etapa: o VmHWM do processo é zerado antes de funcao() e lido no fim \n
+    Onde não dá para zerar (fora do Linux) o pico é o do processo até o fim da etapa e a medida leva rss_pico_acumulado \n
+    Com rastrear_memoria mede também o pico das alocações da etapa (tracemalloc, que deixa a etapa bem mais lenta) \n
+    Retorna (resultado, {etapa, tempo_s, rss_pico_mb, memoria_pico_mb, pdfs_por_s})
+    """
+    if rastrear_memoria:
+        tracemalloc.start()
+
+    pico_reiniciado = reiniciar_pico_rss()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    tempo = time.perf_counter() - inicio
+
+    medida = {
+        "etapa": nome,
+        "tempo_s": round(tempo, 4),
+        "rss_pico_mb": pico_rss_mb(),
+    }
+    if not pico_reiniciado:
+        medida["rss_pico_acumulado"] = True
+
+    if rastrear_memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        medida["memoria_pico_mb"] = round(pico / 1024 / 1024, 2)
+
+    if quantidade_pdfs:
+        medida["pdfs_por_s"] = round(quantidade_pdfs / tempo, 2) if tempo else None
+
+    return resultado, medida
+
+
+def listar_pdfs_exemplo():
+    return sorted(
+        os.path.join(PASTA_PDFS, arquivo) for arquivo in os.listdir(PASTA_PDFS) if arquivo.endswith('.pdf')
+    )
+
+
+def ler_pdfs(pdfs, motor):
+    """
+    Lê uma lista de pdfs com get_dados_nfe_by_pdf (um a um, como a API) \n
+    Retorna a lista de notas lidas, inclusive repetidas
+    """
+    return [get_dados_nfe_by_pdf(pdf, motor=motor, usar_cache=False) for pdf in pdfs]
+
+
+def aumentar_notas(notas, quantidade):
+    """
+    Monta {codigo: itens} com quantidade notas a partir das notas lidas, com codigos diferentes
+    """
+    return {
+        str(100000 + indice): notas[indice % len(notas)]["itens"].copy()
+        for indice in range(quantidade)
+    }
+
+
+def gerar_catalogo(planilha, skus):
+    """
+    Aumenta a planilha de exemplo até skus linhas com códigos sinteticos únicos \n
+    Os custos seguem o formato brasileiro do csv ("120,50")
+    """
+    extras = skus - len(planilha)
+    if extras <= 0:
+        return planilha.copy()
+
+    sinteticos = pd.DataFrame({
+        "PRODUTOS": [f"Produto sintetico {indice}" for indice in range(extras)],
+        "Cod": [f"SKU{indice:07d}-DIS" for indice in range(extras)],
+        "CUSTO": [f"{(indice % 50000) / 100 + 1:.2f}".replace(".", ",") for indice in range(extras)],
+    })
+    return pd.concat([planilha, sinteticos], ignore_index=True)
+
+
+def executar(quantidade_pdfs=300, skus=100000, motor="pypdf", rastrear_memoria=False, quantidades_notas=ESCALONAMENTO_NOTAS):
+    """
+    Executa todas as etapas e retorna a lista de medidas
+    """
+    medidas = []
+    pdfs = listar_pdfs_exemplo()
+    planilha_exemplo = pd.read_csv(CSV_EXEMPLO)
+
+    notas, medida = medir("pdfs_exemplo", lambda: ler_pdfs(pdfs, motor), len(pdfs), rastrear_memoria)
+    medidas.append(medida)
+
+    pdfs_aumentados = [pdfs[indice % len(pdfs)] for indice in range(quantidade_pdfs)]
+    _, medida = medir("pdfs_aumentados", lambda: ler_pdfs(pdfs_aumentados, motor), quantidade_pdfs, rastrear_memoria)
+    medidas.append(medida)
+
+    planilha, medida = medir("planilha_exemplo", lambda: recuperar_planilhas(planilha_exemplo.copy()), None, rastrear_memoria)
+    medidas.append(medida)
+
+    catalogo = gerar_catalogo(planilha_exemplo, skus)
+    catalogo_csv = catalogo.to_csv(index=False).encode()
+    _, medida = medir("leitura_catalogo", lambda: carregar_planilha(io.BytesIO(catalogo_csv)), None, rastrear_memoria)
+    medidas.append(medida)
+
+    catalogo_response, medida = medir("planilha_aumentada", lambda: recuperar_planilhas(catalogo.copy()), None, rastrear_memoria)
+    medidas.append(medida)
+
+    notas_exemplo = {str(nota["codigo_nfe"]): nota["itens"] for nota in notas}
+    _, medida = medir(
+        "planilhas_exemplo",
+        lambda: create_planilhas_by_danfe(planilha["planilha"], notas_exemplo),
+        len(notas_exemplo),
+        rastrear_memoria,
+    )
+    medidas.append(medida)
+
+    notas_aumentadas = aumentar_notas(notas, quantidade_pdfs)
+    informacoes_nfe, medida = medir(
+        "planilhas_aumentadas",
+        lambda: create_planilhas_by_danfe(catalogo_response["planilha"], notas_aumentadas),
+        quantidade_pdfs,
+        rastrear_memoria,
+    )
+    medidas.append(medida)
+
+    _, medida = medir("resposta_json", lambda: codificar_resposta(informacoes_nfe), None, rastrear_memoria)
+    medidas.append(medida)
+
+    medidas.extend(medir_escalonamento(notas, planilha["planilha"], quantidades_notas, rastrear_memoria))
+    medidas.extend(medir_inicializacao())
+
+    return medidas
+
+
+def medir_inicializacao():
+    """
+    Importação do main.py e primeira requisição em um processo novo (python -m analise_nfe.aquecimento.main) \n
+    Sem o cache de respostas, para a requisição sempre processar as notas \n
+    As medidas têm os mesmos campos de medir, com o pico de RSS do processo novo
+    """
+    saida = subprocess.run(
+        [sys.executable, "-m", "analise_nfe.aquecimento.main"],
+        cwd=PASTA_RAIZ, capture_output=True, text=True, check=True,
+        env={**os.environ, "NFE_CACHE_RESPOSTAS": "0"},
+    ).stdout
+    medidas = json.loads(saida.strip().splitlines()[-1])
+
+    return [
+        {"etapa": "inicializacao_importacao", "tempo_s": medidas["importacao_main_s"], "rss_pico_mb": medidas["rss_pico_mb"]},
+        {
+            "etapa": "inicializacao_primeira_requisicao",
+            "tempo_s": medidas["primeira_requisicao_s"],
+            "rss_pico_mb": medidas["rss_pico_mb"],
+        },
+    ]
+
+
+def medir_escalonamento(notas, planilha, quantidades=ESCALONAMENTO_NOTAS, rastrear_memoria=False):
+    """
+    Executa create_planilhas_by_danfe com quantidades crescentes de notas \n
+    Cada medida tem o tempo por nota (ms_por_nota), que deve ficar estável se o crescimento for linear
+    """
+    medidas = []
+
+    for quantidade in quantidades:
+        itens = aumentar_notas(notas, quantidade)
+        _, medida = medir(
+            f"planilhas_{quantidade}_notas",
+            lambda: create_planilhas_by_danfe(planilha, itens),
+            quantidade,
+            rastrear_memoria,
+        )
+        medida["ms_por_nota"] = round(medida["tempo_s"] * 1000 / quantidade, 3)
+        medidas.append(medida)
+
+    return medidas
+
+
+def razao_escalonamento(medidas):
+    """
+    Razão entre o tempo por nota da maior e da menor quantidade de notas \n
+    Perto de 1 para crescimento linear, proporcional à quantidade para crescimento quadrático
+    """
+    escalonamento = [medida for medida in medidas if "ms_por_nota" in medida]
+    if len(escalonamento) < 2 or not escalonamento[0]["ms_por_nota"]:
+        return None
+
+    return round(escalonamento[-1]["ms_por_nota"] / escalonamento[0]["ms_por_nota"], 2)
+
+
+def comparar_baseline(medidas, baseline, tolerancia=TOLERANCIA):
+    """
+    Compara o tempo de cada etapa com o baseline \n
+    Retorna a lista de regressões [{etapa, tempo_s, baseline_s, variacao}]
+    """
+    regressoes = []
+
+    for medida in medidas:
+        anterior = baseline.get(medida["etapa"])
+        if not anterior:
+            continue
+
+        variacao = medida["tempo_s"] / anterior["tempo_s"] - 1 if anterior["tempo_s"] else 0
+        if variacao > tolerancia:
+            regressoes.append({
+                "etapa": medida["etapa"],
+                "tempo_s": medida["tempo_s"],
+                "baseline_s": anterior["tempo_s"],
+                "variacao": round(variacao, 3),
+            })
+
+    return regressoes
+
+
+def carregar_baseline(caminho=BASELINE):
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def salvar_baseline(medidas, caminho=BASELINE, ambiente=None):
+    """
+    Grava as medidas por etapa, com a máquina e as opções usadas em "_ambiente" (ignorado na comparação)
+    """
+    baseline = {"_ambiente": ambiente} if ambiente else {}
+    baseline.update({medida["etapa"]: medida for medida in medidas})
+
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(baseline, arquivo, indent=2, ensure_ascii=False)
+        arquivo.write("\n")
+
+
+def descrever_ambiente(opcoes):
+    """
+    Máquina, versões e opções do benchmark, para saber em que condições o baseline foi gerado
+    """
+    try:
+        import orjson
+        versao_orjson = orjson.__version__
+    except ImportError:
+        versao_orjson = None
+
+    return {
+        "maquina": platform.machine(),
+        "sistema": platform.platform(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "orjson": versao_orjson,
+        "pdfs": opcoes.pdfs,
+        "skus": opcoes.skus,
+        "motor": opcoes.motor,
+        "memoria": opcoes.memoria,
+        "data": time.strftime("%Y-%m-%d"),
+    }
+
+
+def imprimir(medidas, regressoes):
+    print(f"{'etapa':<34}{'tempo (s)':>12}{'RSS (MB)':>12}{'alocado (MB)':>14}{'pdfs/s':>10}")
+    for medida in medidas:
+        pdfs_por_s = medida.get("pdfs_por_s")
+        memoria = medida.get("memoria_pico_mb")
+        rss = medida.get("rss_pico_mb")
+        print(
+            f"{medida['etapa']:<34}{medida['tempo_s']:>12.4f}"
+            f"{(f'{rss:.2f}' if rss is not None else '-'):>12}"
+            f"{(f'{memoria:.2f}' if memoria is not None else '-'):>14}"
+            f"{(f'{pdfs_por_s:.2f}' if pdfs_por_s else '-'):>10}"
+        )
+
+    razao = razao_escalonamento(medidas)
+    if razao is not None:
+        situacao = "linear" if razao <= RAZAO_LINEAR else "NÃO LINEAR"
+        print(f"Escalonamento das notas: {razao:.2f}x o tempo por nota ({situacao})")
+
+    for regressao in regressoes:
+        print(
+            f"REGRESSÃO {regressao['etapa']}: {regressao['tempo_s']:.4f}s "
+            f"(baseline {regressao['baseline_s']:.4f}s, +{regressao['variacao']:.0%})"
+        )
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de análise das DANFEs")
+    parser.add_argument("--pdfs", type=int, default=300, help="quantidade de pdfs nas etapas aumentadas")
+    parser.add_argument("--skus", type=int, default=100000, help="quantidade de linhas do catálogo aumentado")
+    parser.add_argument("--motor", default="pypdf", choices=["pypdf", "tabula"])
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--memoria", action="store_true", help="mede as alocações de cada etapa com tracemalloc (mais lento)")
+    parser.add_argument("--json", action="store_true", help="imprime as medidas em json")
+    opcoes = parser.parse_args(argumentos)
+
+    # Todas as leituras são medidas, sem o cache das nfes
+    os.environ["NFE_CACHE_ATIVO"] = "0"
+
+    medidas = executar(opcoes.pdfs, opcoes.skus, opcoes.motor, opcoes.memoria)
+
+    if opcoes.salvar_baseline:
+        salvar_baseline(medidas, opcoes.baseline, descrever_ambiente(opcoes))
+        regressoes = []
+    else:
+        regressoes = comparar_baseline(medidas, carregar_baseline(opcoes.baseline), opcoes.tolerancia)
+
+    if opcoes.json:
+        print(json.dumps(
+            {"medidas": medidas, "regressoes": regressoes, "razao_escalonamento": razao_escalonamento(medidas)},
+            indent=2, ensure_ascii=False,
+        ))
+    else:
+        imprimir(medidas, regressoes)
+
+    razao = razao_escalonamento(medidas)
+    return 1 if regressoes or (razao is not None and razao > RAZAO_LINEAR) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
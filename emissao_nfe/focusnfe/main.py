@@ -3,6 +3,8 @@ import os
 from datetime import datetime
 from requests.auth import HTTPBasicAuth
 
+from analise_nfe.metricas.main import requisicao_focusnfe
+
 # URLs da API FocusNFe
 API_URL_PRODUCAO = "https://api.focusnfe.com.br/v2/nfe"
 API_URL_HOMOLOGACAO = "https://homologacao.focusnfe.com.br/v2/nfe"
@@ -56,7 +58,7 @@ def emitir_nfe(dados_nfe, referencia=None):
         auth = HTTPBasicAuth(config['token'], '')
 
         # Faz a requisição POST
-        response = requests.post(url, json=dados_nfe, headers=headers, auth=auth)
+        response = requisicao_focusnfe("emitir", requests.post, url, json=dados_nfe, headers=headers, auth=auth)
 
         # Processa resposta
         if response.status_code in [200, 201, 202]:
@@ -111,7 +113,7 @@ def consultar_nfe(referencia):
         auth = HTTPBasicAuth(config['token'], '')
 
         # Faz a requisição GET
-        response = requests.get(url, auth=auth)
+        response = requisicao_focusnfe("consultar", requests.get, url, auth=auth)
 
         # Processa resposta
         if response.status_code == 200:
@@ -191,7 +193,7 @@ def cancelar_nfe(referencia, justificativa):
         }
 
         # Faz a requisição DELETE
-        response = requests.delete(url, json=dados_cancelamento, headers=headers, auth=auth)
+        response = requisicao_focusnfe("cancelar", requests.delete, url, json=dados_cancelamento, headers=headers, auth=auth)
 
         # Processa resposta
         if response.status_code in [200, 201, 202]:
@@ -0,0 +1,33 @@
+"""
+Configuração do Gunicorn (lida automaticamente de ./gunicorn.conf.py)
+Com NFE_AQUECER=1 o processo principal importa a análise e lê um DANFE de exemplo antes de criar os workers
+(ver analise_nfe/aquecimento/main.py)
+Cada worker retoma os jobs pendentes ou interrompidos ao iniciar (analise_nfe/jobs/main.py)
+e encerra o seu pool de leitura dos pdfs (analise_nfe/pdfs/pool.py) ao terminar
+"""
+
+
+def on_starting(server):
+    from analise_nfe.aquecimento.main import aquecer, aquecimento_ativo
+
+    if aquecimento_ativo():
+        aquecer()
+
+
+def post_worker_init(worker):
+    import threading
+
+    # Em uma thread: a importação da análise (pandas) não atrasa o boot do worker
+    threading.Thread(target=_retomar_jobs, name="retomar-jobs", daemon=True).start()
+
+
+def _retomar_jobs():
+    from analise_nfe.jobs.main import retomar_jobs
+
+    retomar_jobs()
+
+
+def worker_exit(server, worker):
+    from analise_nfe.pdfs.pool import encerrar_pool_pdfs
+
+    encerrar_pool_pdfs()
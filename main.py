@@ -1,88 +1,351 @@
-from flask import Flask, request, jsonify
-import pandas as pd
-from analise_nfe.produtos.main import recuperar_planilhas
-from analise_nfe.pdfs.main import percorrer_lista_pdfs
-from analise_nfe.planilha.main import create_planilhas_by_danfe
+import time
+
+# Inicio da importação do main.py, para medir a inicialização (nfe_inicializacao_segundos)
+INICIO_IMPORTACAO = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+# pandas, pypdf, tabula e o resto da análise só são importados na primeira requisição que precisa deles
+# (dentro das rotas), então um worker que só atende /emitir_nfe e /consultar_nfe não carrega a análise
+from analise_nfe.metricas.logs import configurar_logs
+from analise_nfe.metricas.main import registrar_inicializacao, registrar_primeira_requisicao, texto_metricas
+from analise_nfe.pdfs.tabula_worker import aquecer_tabula
+from analise_nfe.uploads.main import RequisicaoComUploads, limite_arquivos, limite_requisicao
 from emissao_nfe.focusnfe.main import emitir_nfe, consultar_nfe, cancelar_nfe
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
 
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Logs de analise_nfe e emissao_nfe (NFE_LOG_NIVEL, NFE_LOG_FORMATO)
+configurar_logs()
+
 app = Flask(__name__)
+
+# Uploads limitados por arquivo (NFE_UPLOAD_ARQUIVO_MB), por requisição (NFE_UPLOAD_REQUISICAO_MB)
+# e em quantidade (NFE_UPLOAD_MAXIMO_ARQUIVOS); acima de NFE_UPLOAD_MEMORIA_MB vão para o disco
+app.request_class = RequisicaoComUploads
+app.config["MAX_CONTENT_LENGTH"] = limite_requisicao()
+
+# Deixa o tabula-java carregado antes da primeira requisição (NFE_TABULA_WORKER=1)
+aquecer_tabula()
+
+MIMETYPE_NDJSON = "application/x-ndjson"
+
 #CORS(app, resources={r"/processar_arquivos": {"origins": "https://6z4wqd.csb.app"}})
 CORS(app)
 
+registrar_inicializacao("importacao_main", time.perf_counter() - INICIO_IMPORTACAO)
+
+
+@app.before_request
+def iniciar_medida():
+    g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def medir_primeira_requisicao(resposta):
+    # Apenas a primeira requisição de cada processo, que paga as importações da análise
+    inicio = g.get("inicio_requisicao")
+    if inicio is not None:
+        registrar_primeira_requisicao(request.path, time.perf_counter() - inicio)
+    return resposta
+
 
 @app.route('/', methods=['GET'])
 def hello_world():
     return jsonify({"mensage":"Hello World"}), 200
 
+@app.errorhandler(413)
+def upload_muito_grande(erro):
+    # MAX_CONTENT_LENGTH usa a descrição padrão do werkzeug
+    if erro.description == RequestEntityTooLarge.description:
+        return jsonify({"error": "Os arquivos enviados passam do limite de tamanho da requisição."}), 413
+    return jsonify({"error": erro.description}), 413
+
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    """
+    Tempos das etapas, contadores de notas, páginas, itens e erros e as requisições à FocusNFe \n
+    no formato de texto do Prometheus (valores do processo que atendeu a requisição)
+    """
+    return Response(texto_metricas(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/processar_arquivos', methods=['POST'])
 def processar_arquivos():
+    """
+    Analisa as notas com a planilha de custos \n
+    Com o campo 'assincrono' (1) a requisição cria um job e retorna 202 com o job_id logo em seguida \n
+    o progresso fica em /jobs/<job_id> e a resposta em /jobs/<job_id>/resultado \n
+    Com o campo 'formato' = 'ndjson' (ou Accept: application/x-ndjson) a resposta é enviada em streaming, \n
+    uma linha JSON por nota assim que ela é lida e uma linha final com o resumo \n
+    Com o campo 'formato' = 'colunas' cada planilha da resposta vem como {"columns": [...], "data": [[...]]} \n    Da planilha de custos só as colunas PRODUTOS, Cod e CUSTO são lidas, e só elas voltam em planilha_duplicados \n
+    e planilha_custos_invalidos \n
+    A resposta (sem ndjson, sem 'assincrono' e sem notas com erro) fica em cache pela impressão digital da planilha \n
+    e das notas e vem com ETag, uma requisição com If-None-Match igual recebe 304 sem corpo
+    """
+    from analise_nfe.cache.respostas import cache_respostas_ativo, chave_resposta, obter_cache_respostas
+    from analise_nfe.jobs.main import obter_gerenciador_jobs
+    from analise_nfe.processamento.main import processar_arquivos_nfe, processar_arquivos_nfe_por_nota
+    from analise_nfe.resposta.main import FORMATOS_QUADRO, codificar_resposta
+
+    parametros, erro = ler_requisicao_processamento()
+    if erro:
+        return erro
+
+    formato = request.form.get('formato') or "registros"
+    if formato != 'ndjson' and formato not in FORMATOS_QUADRO:
+        return jsonify({"error": "Formato inválido. Use 'registros', 'colunas' ou 'ndjson'."}), 400
+
+    if modo_assincrono_ativo(request.form.get('assincrono')):
+        job = obter_gerenciador_jobs().enviar(arquivos_requisicao(parametros), {
+            "catalogo_versao": parametros["catalogo"].versao if parametros["catalogo"] else None,
+            "motor": parametros["motor"],
+            "centavos": parametros["centavos"],
+            "formato": formato if formato in FORMATOS_QUADRO else "registros",
+        })
+        return jsonify({
+            **job,
+            "status_url": f"/jobs/{job['job_id']}",
+            "resultado_url": f"/jobs/{job['job_id']}/resultado",
+        }), 202
+
+    if modo_ndjson_ativo():
+        linhas, erro = processar_arquivos_nfe_por_nota(**parametros)
+        if erro:
+            resposta, codigo = erro
+            return jsonify(resposta), codigo
+
+        return Response(stream_with_context(linha_ndjson(linha) for linha in linhas), mimetype=MIMETYPE_NDJSON)
+
+    if not cache_respostas_ativo():
+        resposta, codigo = processar_arquivos_nfe(**parametros)
+        return resposta_json(resposta, codigo, formato)
+
+    # Mesma planilha, mesmas notas e mesmas opções: a resposta guardada é enviada sem processar de novo
+    chave = chave_resposta(
+        parametros["pdfs"],
+        parametros["xmls"],
+        parametros["csv_file"],
+        catalogo_versao=parametros["catalogo"].versao if parametros["catalogo"] else None,
+        motor=parametros["motor"],
+        centavos=parametros["centavos"],
+        formato=formato,
+    )
+    cache = obter_cache_respostas()
+    entrada = cache.recuperar(chave)
+    acerto = entrada is not None
+
+    if not acerto:
+        resposta, codigo = processar_arquivos_nfe(**parametros)
+        # Respostas com notas que falharam não ficam no cache, o próximo envio tenta ler essas notas de novo
+        if codigo not in (200, 203) or resposta.get("pdfs_com_erro"):
+            return resposta_json(resposta, codigo, formato)
+        entrada = cache.salvar(chave, codificar_resposta(resposta, formato), codigo)
+
+    return resposta_em_cache(entrada, acerto)
+
+
+def ler_requisicao_processamento():
+    """
+    Valida os campos de /processar_arquivos \n
+    Retorna (parametros de processar_arquivos_nfe, None) ou (None, resposta de erro)
+    """
+    from analise_nfe.catalogo.main import obter_repositorio_catalogos
+    from analise_nfe.planilha.centavos import modo_centavos_ativo
+    from analise_nfe.produtos.main import formato_planilha
+
     # Verifica se os arquivos estão presentes na requisição
-    if 'pdfs' not in request.files or 'csv' not in request.files:
-        return jsonify({"error": "Arquivos CSV ou PDF não encontrados"}), 400
+    # As notas podem vir como PDF (DANFE) ou XML (procNFe), nos campos 'pdfs' ou 'xmls'
+    # A planilha de custos pode vir como CSV ou como uma versão já salva em /catalogos ('catalogo_versao')
+    catalogo_versao = request.form.get('catalogo_versao')
+    if ('pdfs' not in request.files and 'xmls' not in request.files) or ('csv' not in request.files and not catalogo_versao):
+        return None, (jsonify({"error": "Arquivos CSV ou PDF não encontrados"}), 400)
     
-    # Obtém o arquivo CSV
+    catalogo = None
+    csv_file = None
+    if catalogo_versao:
+        erros = []
+        catalogo = obter_repositorio_catalogos().carregar(catalogo_versao, erros)
+        if catalogo is None:
+            # Versão curta ou de mais de um catálogo: 400, versão que não existe: 404
+            if erros:
+                return None, (jsonify({"error": erros[0]}), 400)
+            return None, (jsonify({"error": f"Catálogo '{catalogo_versao}' não encontrado"}), 404)
+    else:
+        # Obtém a planilha de custos (csv, parquet ou xlsx, no campo 'csv')
+        csv_file = request.files['csv']
+        if not formato_planilha(csv_file.filename):
+            return None, (jsonify({"error": "O arquivo CSV é inválido."}), 400)
+ 
+    # Obtém a lista de arquivos PDF e XML
+    nfe_files = request.files.getlist('pdfs') + request.files.getlist('xmls')
+    if len(nfe_files) > limite_arquivos():
+        return None, (jsonify({"error": f"Envie no máximo {limite_arquivos()} arquivos por requisição."}), 413)
+    pdf_files_valid = [file for file in nfe_files if file.filename.endswith('.pdf')]
+    xml_files_valid = [file for file in nfe_files if file.filename.lower().endswith('.xml')]
+    
+    if not pdf_files_valid and not xml_files_valid:
+        return None, (jsonify({"error": "Nenhum arquivo PDF ou XML válido foi encontrado."}), 400)
+
+    # Motor de extração dos PDFs: "tabula" (padrão) ou "pypdf" (sem Java)
+    motor = request.form.get('motor')
+    if motor and motor not in ("tabula", "pypdf"):
+        return None, (jsonify({"error": "Motor de extração inválido. Use 'tabula' ou 'pypdf'."}), 400)
+
+    # Valores em centavos inteiros (campo 'centavos' ou NFE_MODO_CENTAVOS=1)
+    centavos = modo_centavos_ativo(request.form.get('centavos'))
+
+    return {
+        "pdfs": pdf_files_valid,
+        "xmls": xml_files_valid,
+        "csv_file": csv_file,
+        "catalogo": catalogo,
+        "motor": motor,
+        "centavos": centavos,
+    }, None
+
+
+def arquivos_requisicao(parametros):
+    """
+    Arquivos da requisição no formato de GerenciadorJobs.enviar [(campo, nome_arquivo, arquivo)]
+    """
+    arquivos = [("pdfs", arquivo.filename, arquivo) for arquivo in parametros["pdfs"]]
+    arquivos += [("xmls", arquivo.filename, arquivo) for arquivo in parametros["xmls"]]
+    if parametros["csv_file"] is not None:
+        arquivos.append(("csv", parametros["csv_file"].filename, parametros["csv_file"]))
+    return arquivos
+
+
+def modo_assincrono_ativo(valor):
+    return str(valor).lower() in ("1", "true", "sim")
+
+
+def modo_ndjson_ativo():
+    return request.form.get('formato') == 'ndjson' or request.accept_mimetypes.best == MIMETYPE_NDJSON
+
+
+def linha_ndjson(linha):
+    from analise_nfe.resposta.main import codificar_resposta
+
+    return codificar_resposta(linha) + b"\n"
+
+
+def resposta_json(resposta, codigo, formato="registros"):
+    """
+    Resposta JSON com os DataFrames serializados direto por codificar_resposta (no lugar do jsonify)
+    """
+    from analise_nfe.resposta.main import codificar_resposta
+
+    return Response(codificar_resposta(resposta, formato), status=codigo, mimetype="application/json")
+
+
+def resposta_em_cache(entrada, acerto):
+    """
+    Resposta guardada em CacheRespostas, com a ETag (a chave da requisição) e X-Cache (HIT ou MISS) \n
+    304 sem corpo quando o cliente já tem essa resposta (If-None-Match com a mesma ETag)
+    """
+    if request.if_none_match.contains(entrada["etag"]):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(entrada["corpo"], status=entrada["codigo"], mimetype="application/json")
+
+    resposta.set_etag(entrada["etag"])
+    resposta.headers["X-Cache"] = "HIT" if acerto else "MISS"
+    return resposta
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def consultar_job(job_id):
+    """
+    Estado e progresso (notas_lidas / total_notas) de um job de /processar_arquivos
+    """
+    from analise_nfe.jobs.main import obter_gerenciador_jobs
+
+    job = obter_gerenciador_jobs().consultar(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' não encontrado"}), 404
+
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<job_id>/resultado', methods=['GET'])
+def resultado_job(job_id):
+    """
+    Resposta de /processar_arquivos do job \n
+    202 com o estado enquanto o job não terminar
+    """
+    from analise_nfe.jobs.main import CONCLUIDO, ERRO, obter_gerenciador_jobs
+
+    gerenciador = obter_gerenciador_jobs()
+    job = gerenciador.consultar(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' não encontrado"}), 404
+
+    if job["estado"] == ERRO:
+        return jsonify({"error": job["erro"]}), job["codigo"]
+
+    resultado = gerenciador.resultado(job_id) if job["estado"] == CONCLUIDO else None
+    if resultado is None:
+        return jsonify(job), 202
+
+    return resposta_json(resultado, job["codigo"])
+
+
+@app.route('/catalogos', methods=['POST'])
+def salvar_catalogo():
+    """
+    Salva uma versão da planilha de custos (campo 'csv', em csv, parquet ou xlsx) \n
+    A versão é identificada pelo SHA-256 do csv e pode ser usada em /processar_arquivos \n
+    no campo 'catalogo_versao' no lugar do csv
+    """
+    from analise_nfe.catalogo.main import obter_repositorio_catalogos
+    from analise_nfe.produtos.main import formato_planilha
+
+    if 'csv' not in request.files:
+        return jsonify({"error": "Arquivo CSV não encontrado"}), 400
+
     csv_file = request.files['csv']
-    if not csv_file.filename.endswith('.csv'):
+    if not formato_planilha(csv_file.filename):
         return jsonify({"error": "O arquivo CSV é inválido."}), 400
-    
-    # Lê o CSV usando o pandas
+
     try:
-        planilha = pd.read_csv(csv_file)
-        print(planilha)
-        planilha_response = recuperar_planilhas(planilha)
+        resultado = obter_repositorio_catalogos().salvar(csv_file.read(), csv_file.filename)
     except Exception as e:
         return jsonify({"error": f"Erro ao ler o CSV: {str(e)}"}), 400
 
-    # Caso a planilha não seje valida
-    if planilha_response["codigo"] != 200 and planilha_response["codigo"] != 203:
-        return jsonify({
-            "error": planilha_response["mensage"], 
-            "planilha": planilha_response["planilha"]
-        }), planilha_response["codigo"] 
-    
-    planilha_duplicados = planilha_response["planilhaDuplicados"] if planilha_response["codigo"] == 203 else []
- 
-    # Obtém a lista de arquivos PDF
-    pdf_files = request.files.getlist('pdfs')
-    pdf_files_valid = [file for file in pdf_files if file.filename.endswith('.pdf')]
-    
-    if not pdf_files_valid:
-        return jsonify({"error": "Nenhum arquivo PDF válido foi encontrado."}), 400
-
-    # Você pode realizar outras operações com os PDFs aqui (ex: extração de texto, análise de conteúdo)
-    nfe_pdfs_list = percorrer_lista_pdfs(pdf_files_valid)
-    informacoes_nfe = create_planilhas_by_danfe(planilha_response["planilha"], nfe_pdfs_list)
-
-    # RESPOSTA CORRIGIDA – TUDO COMO ARRAY JSON
-    response = {
-        "planilha_itens_nfe": (
-            informacoes_nfe["planilha_itens_nfe"].to_dict(orient="records") 
-            if isinstance(informacoes_nfe["planilha_itens_nfe"], pd.DataFrame) 
-            else []
-        ),
-        "planilha_itens_nao_encontrados": (
-            informacoes_nfe["planilha_itens_nao_encontrados"].to_dict(orient="records") 
-            if isinstance(informacoes_nfe["planilha_itens_nao_encontrados"], pd.DataFrame) 
-            else []
-        ),
-        "planilha_total_itens": (
-            informacoes_nfe["planilha_total_itens"].to_dict(orient="records") 
-            if isinstance(informacoes_nfe["planilha_total_itens"], pd.DataFrame) 
-            else []
-        ),
-        "planilha_duplicados": (
-            planilha_duplicados.to_dict(orient="records") 
-            if isinstance(planilha_duplicados, pd.DataFrame) 
-            else []
-        )
-    }
-    
-    return jsonify(response), 200
+    if resultado["codigo"] not in (200, 201):
+        return jsonify({"error": resultado["mensage"]}), resultado["codigo"]
+
+    return jsonify(resultado), resultado["codigo"]
+
+
+@app.route('/catalogos', methods=['GET'])
+def listar_catalogos():
+    """
+    Lista as versões salvas da planilha de custos, da mais recente para a mais antiga
+    """
+    from analise_nfe.catalogo.main import obter_repositorio_catalogos
+
+    return jsonify({"catalogos": obter_repositorio_catalogos().listar()}), 200
+
+
+@app.route('/catalogos/<versao>', methods=['GET'])
+def consultar_catalogo(versao):
+    """
+    Informações de uma versão da planilha de custos ("atual" para a mais recente)
+    """
+    from analise_nfe.catalogo.main import obter_repositorio_catalogos
+
+    erros = []
+    catalogo = obter_repositorio_catalogos().carregar(versao, erros)
+    if catalogo is None:
+        if erros:
+            return jsonify({"error": erros[0]}), 400
+        return jsonify({"error": f"Catálogo '{versao}' não encontrado"}), 404
+
+    return jsonify(catalogo.info), 200
 
 
 @app.route('/emitir_nfe', methods=['POST'])
@@ -174,4 +437,7 @@ def cancelar_nota_fiscal():
 
 
 if __name__ == '__main__':
+    # Com o Gunicorn os jobs são retomados em post_worker_init (gunicorn.conf.py)
+    from analise_nfe.jobs.main import retomar_jobs
+    retomar_jobs()
     app.run(debug=True, port=5000, ssl_context=('cert.pem', 'key.pem'))
@@ -0,0 +1,478 @@
+"""
+Testes do endpoint /processar_arquivos usando o cliente de testes do Flask
+"""
+
+import unittest
+from unittest.mock import patch
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from main import app
+from analise_nfe.cache.respostas import CacheRespostas
+from analise_nfe.catalogo.main import RepositorioCatalogos
+from analise_nfe.jobs.main import GerenciadorJobs
+from analise_nfe.uploads.main import caminho_upload
+from tests.test_nfe_xml import criar_xml_nfe
+
+PASTA_RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CSV_EXEMPLO = os.path.join(PASTA_RAIZ, 'PlanilhaExemplo', 'Planilha G Rollz - Main.csv')
+PDF_2162 = os.path.join(PASTA_RAIZ, 'NFeExemplo', 'NF_2162_Mrceglia_G-Rollz_ACCI_19-12.pdf')
+
+
+def ler_arquivo(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+
+class TestProcessarArquivos(unittest.TestCase):
+    """Testes para o endpoint /processar_arquivos"""
+
+    def setUp(self):
+        self.cliente = app.test_client()
+
+        # Cada teste com um cache de respostas vazio
+        self.cache_respostas = CacheRespostas()
+        self.patch_cache_respostas = patch('analise_nfe.cache.respostas.obter_cache_respostas', return_value=self.cache_respostas)
+        self.patch_cache_respostas.start()
+        self.addCleanup(self.patch_cache_respostas.stop)
+
+    def enviar(self, arquivos, **campos):
+        dados = {'csv': (io.BytesIO(ler_arquivo(CSV_EXEMPLO)), 'planilha.csv')}
+        dados.update(arquivos)
+        dados.update(campos)
+        return self.cliente.post('/processar_arquivos', data=dados, content_type='multipart/form-data')
+
+    def test_sem_arquivos(self):
+        """Sem o csv a requisição é recusada"""
+        resposta = self.cliente.post('/processar_arquivos', data={}, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_motor_invalido(self):
+        """Motores desconhecidos são recusados"""
+        resposta = self.enviar({'pdfs': [(io.BytesIO(ler_arquivo(PDF_2162)), 'nota.pdf')]}, motor='java')
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_xml_e_pdf_na_mesma_requisicao(self):
+        """Notas em XML e PDF são processadas juntas"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.enviar({
+            'pdfs': [(io.BytesIO(ler_arquivo(PDF_2162)), 'nota.pdf')],
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+        }, motor='pypdf')
+
+        self.assertEqual(resposta.status_code, 200)
+        totais = {linha["numeroDaNota"]: linha["total"] for linha in resposta.get_json()["planilha_total_itens"]}
+        self.assertEqual(totais["3000"], "241.00")
+        self.assertIn("2162", totais)
+        self.assertEqual(resposta.get_json()["pdfs_com_erro"], [])
+
+    @patch.dict(os.environ, {"NFE_PLANILHA_BLOCOS_MB": "0.001"})
+    def test_planilha_grande_lida_em_blocos(self):
+        """Csvs maiores que NFE_PLANILHA_BLOCOS_MB são lidos em blocos com o mesmo resultado"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        with patch('analise_nfe.processamento.main.recuperar_planilhas', side_effect=AssertionError("leitura inteira")):
+            resposta = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()["planilha_total_itens"], [{"numeroDaNota": "3000", "total": "241.00"}])
+
+    def test_formato_colunas(self):
+        """Com formato=colunas cada planilha vem com os nomes das colunas uma única vez"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached"), ("SEM-CUSTO", "1.0000", "Outro")])
+
+        resposta = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]}, formato='colunas')
+
+        self.assertEqual(resposta.status_code, 200)
+        itens = resposta.get_json()["planilha_itens_nfe"]
+        self.assertEqual(itens["columns"], ["numeroDaNota", "ITEM", "Cod", "CUSTO", "QTDD", "TOTAL"])
+        self.assertEqual(itens["data"][0][2:], ["GR02A-DIS", 120.5, 2, 241.0])
+        self.assertEqual(resposta.get_json()["planilha_total_itens"]["data"], [["3000", "241.00"]])
+
+        # Os itens não encontrados não têm custo: null no lugar de NaN, então o corpo é JSON válido
+        nao_encontrados = json.loads(resposta.get_data(as_text=True), parse_constant=self.fail)["planilha_itens_nao_encontrados"]
+        self.assertIsNone(nao_encontrados["data"][0][nao_encontrados["columns"].index("CUSTO")])
+
+    def test_formato_invalido(self):
+        """Formatos desconhecidos são recusados"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]}, formato='xml')
+
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_metricas_depois_do_processamento(self):
+        """As notas, os itens e as etapas do processamento aparecem em /metrics"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+        resposta = self.cliente.get('/metrics')
+
+        self.assertEqual(resposta.status_code, 200)
+        texto = resposta.get_data(as_text=True)
+        self.assertRegex(texto, r'nfe_notas_total\{tipo="xml"\} [1-9]')
+        self.assertRegex(texto, r'nfe_itens_total\{tipo="xml"\} [1-9]')
+        for etapa in ("leitura_planilha", "recuperar_planilhas", "juntar_planilha", "resposta_json"):
+            self.assertIn(f'nfe_etapa_segundos_count{{etapa="{etapa}"}}', texto)
+
+    def test_uploads_no_disco_removidos_no_fim(self):
+        """Acima de NFE_UPLOAD_MEMORIA_MB os pdfs são lidos do disco e removidos quando a requisição termina"""
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, True)
+        caminhos = []
+
+        def processar(**parametros):
+            caminhos.extend(caminho_upload(arquivo) for arquivo in parametros["pdfs"])
+            return {"pdfs_com_erro": []}, 200
+
+        with patch.dict(os.environ, {'NFE_UPLOAD_MEMORIA_MB': '0.01', 'NFE_UPLOAD_DIR': pasta}), \
+                patch('analise_nfe.processamento.main.processar_arquivos_nfe', side_effect=processar):
+            resposta = self.enviar({'pdfs': [(io.BytesIO(ler_arquivo(PDF_2162)), 'nota.pdf')]})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(caminhos[0].startswith(pasta))
+        self.assertFalse(os.path.exists(caminhos[0]))
+        self.assertEqual(os.listdir(pasta), [])
+
+    def test_limites_de_upload(self):
+        """Arquivos grandes demais e arquivos demais são recusados com 413"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        with patch.dict(os.environ, {'NFE_UPLOAD_ARQUIVO_MB': '0.05'}):
+            resposta = self.enviar({'pdfs': [(io.BytesIO(ler_arquivo(PDF_2162)), 'nota.pdf')]})
+        self.assertEqual(resposta.status_code, 413)
+        self.assertIn("nota.pdf", resposta.get_json()["error"])
+
+        with patch.dict(os.environ, {'NFE_UPLOAD_MAXIMO_ARQUIVOS': '2'}):
+            resposta = self.enviar({'xmls': [(io.BytesIO(xml), f'{indice}.xml') for indice in range(3)]})
+        self.assertEqual(resposta.status_code, 413)
+
+    def test_resposta_ndjson_por_nota(self):
+        """Com formato=ndjson cada nota é uma linha e a última linha traz o resumo"""
+        xmls = [
+            (io.BytesIO(criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])), 'a.xml'),
+            (io.BytesIO(criar_xml_nfe("3001", [("GR02A-DIS", "1.0000", "G-ROLLZ | Bamboo Unbleached")])), 'b.xml'),
+            (io.BytesIO(b"<quebrado"), 'c.xml'),
+        ]
+
+        resposta = self.enviar({'xmls': xmls}, formato='ndjson')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.mimetype, 'application/x-ndjson')
+        linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+        self.assertEqual([linha["tipo"] for linha in linhas], ["nota", "nota", "erro", "resumo"])
+        self.assertEqual((linhas[0]["numeroDaNota"], linhas[0]["total"]), ("3000", "241.00"))
+        self.assertEqual(linhas[1]["planilha_itens_nfe"][0]["TOTAL"], 120.5)
+        self.assertEqual(linhas[2]["arquivo"], "c.xml")
+        self.assertEqual(
+            linhas[-1]["planilha_total_itens"],
+            [{"numeroDaNota": "3000", "total": "241.00"}, {"numeroDaNota": "3001", "total": "120.50"}],
+        )
+        self.assertEqual([erro["arquivo"] for erro in linhas[-1]["pdfs_com_erro"]], ["c.xml"])
+
+    def test_ndjson_e_sincrono_com_a_mesma_nota_repetida(self):
+        """PDF e XML da mesma nota: o streaming e a resposta inteira usam o XML e têm os mesmos totais"""
+        xmls = [
+            ('a.xml', criar_xml_nfe("2162", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])),
+            ('b.xml', criar_xml_nfe("2162", [("GR02A-DIS", "5.0000", "G-ROLLZ | Bamboo Unbleached")])),
+        ]
+
+        def arquivos():
+            return {
+                'pdfs': [(io.BytesIO(ler_arquivo(PDF_2162)), 'nota.pdf')],
+                'xmls': [(io.BytesIO(conteudo), nome) for nome, conteudo in xmls],
+            }
+
+        sincrono = self.enviar(arquivos(), motor='pypdf')
+        streaming = self.enviar(arquivos(), motor='pypdf', formato='ndjson')
+
+        resumo = json.loads(streaming.get_data(as_text=True).splitlines()[-1])
+        self.assertEqual(sincrono.get_json()["planilha_total_itens"], [{"numeroDaNota": "2162", "total": "241.00"}])
+        self.assertEqual(resumo["planilha_total_itens"], sincrono.get_json()["planilha_total_itens"])
+
+    def test_ndjson_monta_o_indice_da_planilha_uma_vez(self):
+        """No streaming o índice da planilha é montado uma vez para todas as notas"""
+        from analise_nfe.catalogo.main import montar_indice
+
+        xmls = [
+            (io.BytesIO(criar_xml_nfe(numero, [("GR02A-DIS", "1.0000", "G-ROLLZ | Bamboo Unbleached")])), f'{numero}.xml')
+            for numero in ("3000", "3001", "3002")
+        ]
+
+        with patch('analise_nfe.processamento.main.montar_indice', side_effect=montar_indice) as mock_indice:
+            resposta = self.enviar({'xmls': xmls}, formato='ndjson')
+            linhas = resposta.get_data(as_text=True).splitlines()
+
+        self.assertEqual(len(linhas), 4)
+        self.assertEqual(mock_indice.call_count, 1)
+
+    def test_ndjson_planilha_invalida(self):
+        """Uma planilha inválida é recusada antes do streaming começar"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'csv': (io.BytesIO(b"PRODUTOS,Cod\nA,B\n"), 'planilha.csv'),
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+        }, content_type='multipart/form-data', headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(resposta.mimetype, 'application/json')
+
+
+    def test_duplicados_so_com_as_colunas_lidas(self):
+        """Colunas da planilha além de PRODUTOS, Cod e CUSTO não voltam em planilha_duplicados"""
+        csv = b'PRODUTOS,Cod,CUSTO,ESTOQUE\nBamboo,GR02A-DIS,"120,50",3\nBamboo,GR02A-DIS,"121,00",4\n'
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'csv': (io.BytesIO(csv), 'planilha.csv'),
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 200)
+        duplicados = resposta.get_json()["planilha_duplicados"]
+        self.assertEqual(len(duplicados), 2)
+        self.assertEqual([set(linha) for linha in duplicados], [{"PRODUTOS", "Cod", "CUSTO"}] * 2)
+
+    def test_resposta_repetida_vem_do_cache(self):
+        """A mesma planilha com as mesmas notas (em outra ordem) é respondida pelo cache, sem processar de novo"""
+        xmls = {
+            'a.xml': criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")]),
+            'b.xml': criar_xml_nfe("3001", [("GR02A-DIS", "1.0000", "G-ROLLZ | Bamboo Unbleached")]),
+        }
+
+        primeira = self.enviar({'xmls': [(io.BytesIO(xmls[nome]), nome) for nome in ('a.xml', 'b.xml')]})
+        with patch('analise_nfe.processamento.main.processar_arquivos_nfe', side_effect=AssertionError("processou de novo")):
+            segunda = self.enviar({'xmls': [(io.BytesIO(xmls[nome]), nome) for nome in ('b.xml', 'a.xml')]})
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual(primeira.headers["X-Cache"], "MISS")
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.headers["X-Cache"], "HIT")
+        self.assertEqual(segunda.get_data(), primeira.get_data())
+        self.assertEqual(segunda.headers["ETag"], primeira.headers["ETag"])
+
+    def test_cache_separa_notas_e_opcoes_diferentes(self):
+        """Outra nota ou outro formato não usam a resposta guardada"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+        outro_xml = criar_xml_nfe("3000", [("GR02A-DIS", "3.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        primeira = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+        outra_nota = self.enviar({'xmls': [(io.BytesIO(outro_xml), 'nota.xml')]})
+        outro_formato = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]}, formato='colunas')
+
+        self.assertEqual([resposta.headers["X-Cache"] for resposta in (primeira, outra_nota, outro_formato)], ["MISS"] * 3)
+        self.assertEqual(outra_nota.get_json()["planilha_total_itens"], [{"numeroDaNota": "3000", "total": "361.50"}])
+        self.assertEqual(len({resposta.headers["ETag"] for resposta in (primeira, outra_nota, outro_formato)}), 3)
+
+    def test_resposta_com_nota_com_erro_nao_fica_no_cache(self):
+        """Uma resposta com pdfs_com_erro não é guardada e o mesmo envio é processado de novo"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        def enviar_com_erro():
+            return self.enviar({'xmls': [(io.BytesIO(xml), 'a.xml'), (io.BytesIO(b"<quebrado"), 'b.xml')]})
+
+        primeira = enviar_com_erro()
+        segunda = enviar_com_erro()
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertEqual([erro["arquivo"] for erro in primeira.get_json()["pdfs_com_erro"]], ["b.xml"])
+        self.assertEqual(self.cache_respostas.estatisticas()["entradas"], 0)
+        self.assertNotIn("ETag", segunda.headers)
+        self.assertEqual(segunda.get_json(), primeira.get_json())
+
+    def test_if_none_match(self):
+        """Com If-None-Match igual à ETag a resposta é 304 sem corpo"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        primeira = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+        self.cliente.environ_base['HTTP_IF_NONE_MATCH'] = primeira.headers["ETag"]
+        segunda = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.get_data(), b"")
+        self.assertEqual(segunda.headers["ETag"], primeira.headers["ETag"])
+
+    @patch.dict(os.environ, {"NFE_CACHE_RESPOSTAS": "0"})
+    def test_cache_de_respostas_desligado(self):
+        """Com NFE_CACHE_RESPOSTAS=0 toda requisição é processada"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+        resposta = self.enviar({'xmls': [(io.BytesIO(xml), 'nota.xml')]})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn("ETag", resposta.headers)
+        self.assertEqual(self.cache_respostas.estatisticas()["entradas"], 0)
+
+
+class TestCatalogos(unittest.TestCase):
+    """Testes para os endpoints /catalogos e o uso de uma versão salva em /processar_arquivos"""
+
+    def setUp(self):
+        self.cliente = app.test_client()
+        self.pasta = tempfile.mkdtemp()
+        self.patch_repositorio = patch('analise_nfe.catalogo.main.obter_repositorio_catalogos', return_value=RepositorioCatalogos(self.pasta))
+        self.patch_repositorio.start()
+        self.patch_cache_respostas = patch('analise_nfe.cache.respostas.obter_cache_respostas', return_value=CacheRespostas())
+        self.patch_cache_respostas.start()
+        self.addCleanup(self.patch_cache_respostas.stop)
+
+    def tearDown(self):
+        self.patch_repositorio.stop()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def salvar_catalogo(self):
+        return self.cliente.post(
+            '/catalogos',
+            data={'csv': (io.BytesIO(ler_arquivo(CSV_EXEMPLO)), 'planilha.csv')},
+            content_type='multipart/form-data',
+        )
+
+    def test_salvar_e_listar(self):
+        """O csv enviado vira uma versão listada em /catalogos"""
+        resposta = self.salvar_catalogo()
+
+        self.assertEqual(resposta.status_code, 201)
+        versao = resposta.get_json()["versao"]
+        self.assertEqual(self.salvar_catalogo().status_code, 200)
+        self.assertEqual([info["versao"] for info in self.cliente.get('/catalogos').get_json()["catalogos"]], [versao])
+        self.assertEqual(self.cliente.get('/catalogos/atual').get_json()["versao"], versao)
+
+    def test_processar_com_versao_do_catalogo(self):
+        """/processar_arquivos usa a versão salva no lugar do csv"""
+        versao = self.salvar_catalogo().get_json()["versao"]
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+            'catalogo_versao': versao,
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()["planilha_total_itens"], [{"numeroDaNota": "3000", "total": "241.00"}])
+        self.assertEqual(
+            [(item["numeroDaNota"], item["Cod"], item["TOTAL"]) for item in resposta.get_json()["planilha_itens_nfe"]],
+            [("3000", "GR02A-DIS", 241.0)],
+        )
+
+    def test_processar_em_centavos(self):
+        """Com centavos=1 os valores voltam como texto decimal exato"""
+        versao = self.salvar_catalogo().get_json()["versao"]
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+            'catalogo_versao': versao,
+            'centavos': '1',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()["planilha_total_itens"], [{"numeroDaNota": "3000", "total": "241.00"}])
+        item = resposta.get_json()["planilha_itens_nfe"][0]
+        self.assertEqual((item["CUSTO"], item["QTDD"], item["TOTAL"]), ("120.50", 2, "241.00"))
+
+    def test_sugestoes_para_itens_nao_encontrados(self):
+        """Os itens não encontrados recebem sugestões de códigos do catálogo"""
+        versao = self.salvar_catalogo().get_json()["versao"]
+        xml = criar_xml_nfe("3000", [
+            ("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached"),
+            ("gr02a", "1.0000", "G-ROLLZ | Bamboo Unbleached"),
+        ])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+            'catalogo_versao': versao,
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 200)
+        item = resposta.get_json()["planilha_itens_nao_encontrados"][0]
+        self.assertEqual(item["Cod"], "gr02a")
+        self.assertEqual(item["SUGESTOES"][0], "GR02A-DIS")
+
+    def test_versao_inexistente(self):
+        """Uma versão que não existe é recusada"""
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'xmls': [(io.BytesIO(criar_xml_nfe("3000", [("A", "1", "B")])), 'nota.xml')],
+            'catalogo_versao': 'ffffffff',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_versao_curta(self):
+        """Um prefixo curto da versão é recusado com 400 em vez de escolher um catálogo qualquer"""
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'xmls': [(io.BytesIO(criar_xml_nfe("3000", [("A", "1", "B")])), 'nota.xml')],
+            'catalogo_versao': 'f',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 400)
+
+
+class TestJobs(unittest.TestCase):
+    """Testes para o modo assincrono de /processar_arquivos e os endpoints /jobs"""
+
+    def setUp(self):
+        self.cliente = app.test_client()
+        self.pasta = tempfile.mkdtemp()
+        self.gerenciador = GerenciadorJobs(self.pasta)
+        self.patch_gerenciador = patch('analise_nfe.jobs.main.obter_gerenciador_jobs', return_value=self.gerenciador)
+        self.patch_gerenciador.start()
+
+    def tearDown(self):
+        self.patch_gerenciador.stop()
+        self.gerenciador.pool.shutdown(wait=True)
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_job_retorna_id_e_resultado(self):
+        """Com assincrono=1 a resposta é 202 com o job_id e o resultado fica em /jobs/<id>/resultado"""
+        xml = criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "G-ROLLZ | Bamboo Unbleached")])
+
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'csv': (io.BytesIO(ler_arquivo(CSV_EXEMPLO)), 'planilha.csv'),
+            'xmls': [(io.BytesIO(xml), 'nota.xml')],
+            'assincrono': '1',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 202)
+        job_id = resposta.get_json()["job_id"]
+        self.assertEqual(resposta.get_json()["status_url"], f"/jobs/{job_id}")
+
+        self.gerenciador.pool.shutdown(wait=True)
+
+        status = self.cliente.get(f'/jobs/{job_id}').get_json()
+        self.assertEqual((status["estado"], status["notas_lidas"], status["total_notas"]), ("concluido", 1, 1))
+
+        resultado = self.cliente.get(f'/jobs/{job_id}/resultado')
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(resultado.get_json()["planilha_total_itens"], [{"numeroDaNota": "3000", "total": "241.00"}])
+
+    def test_job_inexistente(self):
+        """Jobs desconhecidos retornam 404"""
+        self.assertEqual(self.cliente.get('/jobs/nao-existe').status_code, 404)
+        self.assertEqual(self.cliente.get('/jobs/nao-existe/resultado').status_code, 404)
+
+    def test_validacao_antes_de_criar_o_job(self):
+        """Requisições inválidas são recusadas sem criar o job"""
+        resposta = self.cliente.post('/processar_arquivos', data={
+            'csv': (io.BytesIO(ler_arquivo(CSV_EXEMPLO)), 'planilha.txt'),
+            'xmls': [(io.BytesIO(b"<nfe/>"), 'nota.xml')],
+            'assincrono': '1',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(os.listdir(self.pasta), ['jobs.sqlite3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
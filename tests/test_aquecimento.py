@@ -0,0 +1,40 @@
+"""
+Testes unitários para o aquecimento e a inicialização do servidor (analise_nfe/aquecimento/main.py)
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.aquecimento.main import aquecer
+from analise_nfe.metricas.main import INICIALIZACAO
+
+PASTA_RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestAquecimento(unittest.TestCase):
+    """Testes para as importações sob demanda e o aquecimento"""
+
+    def test_main_nao_importa_a_analise(self):
+        """Importar o main.py não carrega pandas, pypdf nem tabula"""
+        codigo = "import sys, main; print(sorted(m for m in ('pandas', 'pypdf', 'tabula', 'numpy') if m in sys.modules))"
+
+        saida = subprocess.run([sys.executable, "-c", codigo], cwd=PASTA_RAIZ, capture_output=True, text=True, check=True)
+
+        self.assertEqual(saida.stdout.strip(), "[]")
+
+    def test_aquecer_le_o_danfe_de_exemplo(self):
+        """O aquecimento lê o número da nota do primeiro pdf de NFeExemplo e registra o tempo"""
+        medidas = aquecer()
+
+        self.assertEqual(medidas["numero_nota"], "2160")
+        self.assertIn("pandas", sys.modules)
+        self.assertIsNotNone(INICIALIZACAO.valor(fase="aquecimento"))
+
+
+if __name__ == '__main__':
+    unittest.main()
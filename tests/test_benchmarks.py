@@ -0,0 +1,91 @@
+"""
+Testes unitários para o benchmark do pipeline (benchmarks/main.py)
+"""
+
+import unittest
+import contextlib
+import io
+import os
+import sys
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.main import comparar_baseline, carregar_baseline, executar, imprimir, medir, razao_escalonamento
+
+
+class TestBenchmarkPipeline(unittest.TestCase):
+    """Testes para as medidas e a comparação com o baseline"""
+
+    def setUp(self):
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+
+    def test_executar_todas_as_etapas(self):
+        """Todas as etapas são medidas, com pdfs/s nas etapas que leem notas"""
+        lista_medidas = executar(quantidade_pdfs=3, skus=50, motor="pypdf", quantidades_notas=(2, 4))
+        medidas = {medida["etapa"]: medida for medida in lista_medidas}
+
+        self.assertEqual(set(medidas), {
+            "pdfs_exemplo", "pdfs_aumentados", "planilha_exemplo", "leitura_catalogo",
+            "planilha_aumentada", "planilhas_exemplo", "planilhas_aumentadas", "resposta_json",
+            "planilhas_2_notas", "planilhas_4_notas",
+            "inicializacao_importacao", "inicializacao_primeira_requisicao",
+        })
+        self.assertIn("ms_por_nota", medidas["planilhas_4_notas"])
+        self.assertGreater(medidas["pdfs_aumentados"]["pdfs_por_s"], 0)
+        self.assertNotIn("pdfs_por_s", medidas["planilha_aumentada"])
+        self.assertGreater(medidas["inicializacao_importacao"]["rss_pico_mb"], 0)
+
+        # A tabela do terminal mostra todas as etapas
+        saida = io.StringIO()
+        with contextlib.redirect_stdout(saida):
+            imprimir(lista_medidas, [])
+        for etapa in medidas:
+            self.assertIn(etapa, saida.getvalue())
+
+    @unittest.skipUnless(os.path.exists('/proc/self/clear_refs'), "pico de RSS por etapa só no Linux")
+    def test_rss_pico_por_etapa(self):
+        """O pico de RSS de uma etapa não carrega o pico das etapas anteriores"""
+        _, grande = medir("grande", lambda: len(bytearray(200 * 1024 * 1024)))
+        _, pequena = medir("pequena", lambda: None)
+
+        self.assertGreater(grande["rss_pico_mb"], pequena["rss_pico_mb"] + 100)
+        self.assertNotIn("rss_pico_acumulado", pequena)
+
+    def test_regressao_acima_da_tolerancia(self):
+        """Somente etapas mais lentas que baseline + tolerância são regressões"""
+        medidas = [{"etapa": "pdfs", "tempo_s": 1.3}, {"etapa": "planilha", "tempo_s": 1.1}, {"etapa": "nova", "tempo_s": 9}]
+        baseline = {"pdfs": {"tempo_s": 1.0}, "planilha": {"tempo_s": 1.0}}
+
+        regressoes = comparar_baseline(medidas, baseline, tolerancia=0.25)
+
+        self.assertEqual([regressao["etapa"] for regressao in regressoes], ["pdfs"])
+        self.assertEqual(regressoes[0]["variacao"], 0.3)
+
+    def test_baseline_cobre_todas_as_etapas(self):
+        """O baseline salvo tem todas as etapas medidas e a máquina e as opções em que foi gerado"""
+        baseline = carregar_baseline()
+
+        self.assertTrue({
+            "pdfs_exemplo", "pdfs_aumentados", "planilha_exemplo", "leitura_catalogo",
+            "planilha_aumentada", "planilhas_exemplo", "planilhas_aumentadas", "resposta_json",
+            "planilhas_10_notas", "planilhas_100_notas", "planilhas_1000_notas",
+            "inicializacao_importacao", "inicializacao_primeira_requisicao",
+        } <= set(baseline))
+        self.assertTrue({"maquina", "cpus", "python", "pdfs", "skus", "motor"} <= set(baseline["_ambiente"]))
+
+    def test_razao_escalonamento(self):
+        """A razão compara o tempo por nota da maior e da menor quantidade"""
+        linear = [{"etapa": "a", "ms_por_nota": 2.0}, {"etapa": "b", "ms_por_nota": 2.2}]
+        quadratico = [{"etapa": "a", "ms_por_nota": 2.0}, {"etapa": "b", "ms_por_nota": 200.0}]
+
+        self.assertEqual(razao_escalonamento(linear), 1.1)
+        self.assertEqual(razao_escalonamento(quadratico), 100.0)
+        self.assertIsNone(razao_escalonamento([{"etapa": "a", "tempo_s": 1.0}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
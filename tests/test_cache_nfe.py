@@ -0,0 +1,179 @@
+"""
+Testes unitários para o cache dos dados de nfe lidos dos PDFs
+"""
+
+import unittest
+from unittest.mock import patch
+import hashlib
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.cache.main import PASTA_CACHE_PADRAO, CacheNFe, chave_sha256, obter_cache_nfe
+from analise_nfe.pdfs.main import get_dados_nfe_by_pdf
+
+PDF_2160 = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'NFeExemplo', 'NF_2160_Mrceglia_G-Rollz_Wellington_06-12.pdf'
+))
+
+
+def criar_nfe(codigo, quantidade_itens=1):
+    """Cria uma nfe no formato de get_dados_nfe_by_pdf"""
+    itens = pd.DataFrame({
+        "Cod": [f"GR{i}-DIS" for i in range(quantidade_itens)],
+        "QTDD": [1] * quantidade_itens,
+        "ITEM": ["Item"] * quantidade_itens,
+    })
+    return {"itens": itens, "codigo_nfe": codigo}
+
+
+class TestCacheNFe(unittest.TestCase):
+    """Testes para a classe CacheNFe"""
+
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.pasta.cleanup()
+
+    def test_acerto_e_falha(self):
+        """Conta acertos em memória e falhas"""
+        cache = CacheNFe()
+        cache.salvar("a", criar_nfe("2160"))
+
+        self.assertIsNone(cache.recuperar("b"))
+        nfe = cache.recuperar("a")
+
+        self.assertEqual(nfe["codigo_nfe"], "2160")
+        estatisticas = cache.estatisticas()
+        self.assertEqual(estatisticas["acertos_memoria"], 1)
+        self.assertEqual(estatisticas["falhas"], 1)
+
+    def test_recuperar_devolve_copia(self):
+        """Alterar a nfe recuperada não altera o cache"""
+        cache = CacheNFe()
+        cache.salvar("a", criar_nfe("2160"))
+
+        cache.recuperar("a")["itens"]["QTDD"] = 99
+
+        self.assertEqual(cache.recuperar("a")["itens"]["QTDD"].iloc[0], 1)
+
+    def test_remove_usado_ha_mais_tempo_da_memoria(self):
+        """O nivel em memória respeita o limite de bytes removendo o menos usado"""
+        tamanho = int(criar_nfe("1")["itens"].memory_usage(index=True, deep=True).sum()) + 1
+        cache = CacheNFe(max_bytes_memoria=tamanho * 2)
+
+        cache.salvar("a", criar_nfe("1"))
+        cache.salvar("b", criar_nfe("2"))
+        cache.recuperar("a")
+        cache.salvar("c", criar_nfe("3"))
+
+        self.assertEqual(list(cache.memoria.keys()), ["a", "c"])
+
+    def test_disco_sobrevive_a_nova_instancia(self):
+        """O nivel em disco é lido por outra instância (reinicio do servidor)"""
+        CacheNFe(pasta=self.pasta.name).salvar("a", criar_nfe("2160", 3))
+
+        cache = CacheNFe(pasta=self.pasta.name)
+        nfe = cache.recuperar("a")
+
+        self.assertEqual(len(nfe["itens"]), 3)
+        self.assertEqual(cache.estatisticas()["acertos_disco"], 1)
+        self.assertIn("a", cache.memoria)
+
+    def test_limite_do_disco(self):
+        """O nivel em disco remove os arquivos mais antigos acima do limite"""
+        cache = CacheNFe(pasta=self.pasta.name, max_bytes_disco=1)
+
+        cache.salvar("a", criar_nfe("1"))
+
+        self.assertEqual(cache.estatisticas()["bytes_disco"], 0)
+
+    def test_total_do_disco_sem_percorrer_a_pasta(self):
+        """Salvar e as estatisticas usam o total guardado, e a pasta só é percorrida ao criar o cache"""
+        CacheNFe(pasta=self.pasta.name).salvar("a", criar_nfe("1", 3))
+        cache = CacheNFe(pasta=self.pasta.name)
+
+        with patch("analise_nfe.cache.main.os.listdir", side_effect=AssertionError("percorreu a pasta")):
+            cache.salvar("b", criar_nfe("2", 5))
+            cache.salvar("b", criar_nfe("2", 2))
+            bytes_disco = cache.estatisticas()["bytes_disco"]
+
+        arquivos = [os.path.join(self.pasta.name, nome) for nome in os.listdir(self.pasta.name)]
+        self.assertEqual(bytes_disco, sum(os.path.getsize(arquivo) for arquivo in arquivos))
+        self.assertEqual(list(cache.disco), ["a", "b"])
+
+    def test_limite_do_disco_remove_o_usado_ha_mais_tempo(self):
+        """Uma leitura do disco conta como uso, o arquivo removido é o que não foi lido"""
+        cache = CacheNFe(pasta=self.pasta.name, max_bytes_memoria=0)
+        cache.salvar("a", criar_nfe("1"))
+        cache.salvar("b", criar_nfe("2"))
+        cache.recuperar("a")
+        cache.max_bytes_disco = cache.bytes_disco
+
+        cache.salvar("c", criar_nfe("3"))
+
+        self.assertEqual(sorted(os.listdir(self.pasta.name)), ["a.pkl", "c.pkl"])
+        self.assertEqual(list(cache.disco), ["a", "c"])
+
+    def test_pasta_padrao(self):
+        """Sem NFE_CACHE_DIR o nivel em disco fica em PASTA_CACHE_PADRAO, NFE_CACHE_DISCO_MB=0 o desliga"""
+        with patch("analise_nfe.cache.main._cache_nfe", None), patch.dict(os.environ, {"NFE_CACHE_DIR": ""}):
+            self.assertEqual(obter_cache_nfe().pasta, PASTA_CACHE_PADRAO)
+
+        with patch("analise_nfe.cache.main._cache_nfe", None), patch.dict(os.environ, {"NFE_CACHE_DISCO_MB": "0"}):
+            self.assertIsNone(obter_cache_nfe().pasta)
+
+
+class TestCacheGetDadosNfeByPdf(unittest.TestCase):
+    """Testes para o uso do cache em get_dados_nfe_by_pdf"""
+
+    def setUp(self):
+        os.environ['NFE_CACHE_ATIVO'] = '1'
+        obter_cache_nfe().limpar()
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+        obter_cache_nfe().limpar()
+
+    def test_acerto_nao_le_o_pdf(self):
+        """Com o pdf no cache o pypdf e o tabula não são usados"""
+        primeira = get_dados_nfe_by_pdf(PDF_2160, motor="pypdf")
+
+        with patch('analise_nfe.pdfs.documento.pyf.PdfReader') as mock_reader, \
+                patch('analise_nfe.pdfs.main.tabula.read_pdf') as mock_read_pdf:
+            with open(PDF_2160, 'rb') as arquivo:
+                segunda = get_dados_nfe_by_pdf(arquivo, motor="pypdf")
+
+        mock_reader.assert_not_called()
+        mock_read_pdf.assert_not_called()
+        self.assertEqual(segunda["codigo_nfe"], primeira["codigo_nfe"])
+        pd.testing.assert_frame_equal(segunda["itens"], primeira["itens"])
+
+    def test_chave_pelo_conteudo_e_motor(self):
+        """A chave depende dos bytes do pdf e das opções de leitura"""
+        sha256 = hashlib.sha256(b"pdf").hexdigest()
+
+        self.assertEqual(chave_sha256(sha256, "pypdf"), chave_sha256(hashlib.sha256(b"pdf").hexdigest(), "pypdf"))
+        self.assertNotEqual(chave_sha256(sha256, "pypdf"), chave_sha256(hashlib.sha256(b"pdf ").hexdigest(), "pypdf"))
+        self.assertNotEqual(chave_sha256(sha256, "pypdf"), chave_sha256(sha256, "tabula"))
+        self.assertNotEqual(chave_sha256(sha256, "tabula", "documento"), chave_sha256(sha256, "tabula", "pagina"))
+        with patch.dict(os.environ, {"NFE_TABULA_AREA": "0"}):
+            sem_area = chave_sha256(sha256, "tabula")
+        self.assertNotEqual(sem_area, chave_sha256(sha256, "tabula"))
+
+    def test_outro_motor_nao_usa_o_cache(self):
+        """Um pdf lido com o pypdf é lido de novo quando o motor pedido é o tabula"""
+        get_dados_nfe_by_pdf(PDF_2160, motor="pypdf")
+
+        with patch('analise_nfe.pdfs.main.extrair_tabelas_produtos_area', side_effect=AssertionError("tabula")):
+            with self.assertRaisesRegex(AssertionError, "tabula"):
+                get_dados_nfe_by_pdf(PDF_2160, motor="tabula")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Testes unitários para o cache das respostas de /processar_arquivos
+"""
+
+import unittest
+from unittest.mock import patch
+import hashlib
+import io
+import os
+import sys
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.cache.respostas import CacheRespostas, cache_respostas_ativo, chave_resposta
+from analise_nfe.pdfs.documento import DocumentoPDF
+
+
+class Relogio:
+    """Relógio controlado pelo teste"""
+
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def arquivo(conteudo, nome):
+    """Arquivo enviado com o nome, como o FileStorage do Flask"""
+    enviado = io.BytesIO(conteudo)
+    enviado.filename = nome
+    return enviado
+
+
+class TestCacheRespostas(unittest.TestCase):
+    """Testes para a classe CacheRespostas"""
+
+    def test_acerto_e_falha(self):
+        """A entrada guardada volta com o corpo, o código e a ETag"""
+        cache = CacheRespostas()
+        cache.salvar("a", b'{"ok": true}', 203)
+
+        self.assertIsNone(cache.recuperar("b"))
+        entrada = cache.recuperar("a")
+        self.assertEqual((entrada["corpo"], entrada["codigo"], entrada["etag"]), (b'{"ok": true}', 203, "a"))
+        self.assertEqual(cache.estatisticas(), {"entradas": 1, "bytes_memoria": 12, "acertos": 1, "falhas": 1})
+
+    def test_expira_depois_do_ttl(self):
+        """Entradas mais velhas que o ttl são descartadas"""
+        relogio = Relogio()
+        cache = CacheRespostas(ttl=10, relogio=relogio)
+        cache.salvar("a", b"{}", 200)
+
+        relogio.agora = 9.9
+        self.assertIsNotNone(cache.recuperar("a"))
+        relogio.agora = 10.0
+        self.assertIsNone(cache.recuperar("a"))
+        self.assertEqual(cache.estatisticas()["bytes_memoria"], 0)
+
+    def test_limite_de_tamanho_descarta_menos_usada(self):
+        """Acima de max_bytes sai a resposta usada há mais tempo"""
+        cache = CacheRespostas(max_bytes=25)
+        cache.salvar("a", b"a" * 10, 200)
+        cache.salvar("b", b"b" * 10, 200)
+        cache.recuperar("a")
+        cache.salvar("c", b"c" * 10, 200)
+
+        self.assertIsNone(cache.recuperar("b"))
+        self.assertIsNotNone(cache.recuperar("a"))
+        self.assertIsNotNone(cache.recuperar("c"))
+        self.assertEqual(cache.estatisticas()["bytes_memoria"], 20)
+
+    def test_resposta_maior_que_o_limite_nao_e_guardada(self):
+        """Uma resposta maior que max_bytes não esvazia o cache"""
+        cache = CacheRespostas(max_bytes=25)
+        cache.salvar("a", b"a" * 10, 200)
+
+        entrada = cache.salvar("b", b"b" * 30, 200)
+
+        self.assertEqual(entrada["etag"], "b")
+        self.assertIsNone(cache.recuperar("b"))
+        self.assertIsNotNone(cache.recuperar("a"))
+
+    @patch.dict(os.environ, {"NFE_CACHE_ATIVO": "0"})
+    def test_desligado_com_o_cache_de_pdfs(self):
+        """NFE_CACHE_ATIVO=0 também desliga o cache de respostas"""
+        self.assertFalse(cache_respostas_ativo())
+
+
+class TestChaveResposta(unittest.TestCase):
+    """Testes para a impressão digital das requisições"""
+
+    def test_ordem_das_notas_nao_muda_a_chave(self):
+        """As notas são ordenadas pelo SHA-256 antes de entrar na chave"""
+        csv = arquivo(b"Cod,CUSTO\nA,1\n", "planilha.csv")
+        pdfs = [arquivo(b"pdf a", "a.pdf"), arquivo(b"pdf b", "b.pdf")]
+
+        chave = chave_resposta(pdfs, [], csv, motor="pypdf")
+
+        self.assertEqual(chave, chave_resposta(pdfs[::-1], [], csv, motor="pypdf"))
+        self.assertEqual(pdfs[0].tell(), 0)
+
+    def test_bytes_e_opcoes_mudam_a_chave(self):
+        """Outra planilha, outra nota, outro catálogo ou outra opção geram outra chave"""
+        csv = arquivo(b"Cod,CUSTO\nA,1\n", "planilha.csv")
+        pdfs = [arquivo(b"pdf a", "a.pdf")]
+
+        chaves = {
+            chave_resposta(pdfs, [], csv, formato="registros"),
+            chave_resposta(pdfs, [], arquivo(b"Cod,CUSTO\nA,2\n", "planilha.csv"), formato="registros"),
+            chave_resposta([arquivo(b"pdf c", "a.pdf")], [], csv, formato="registros"),
+            chave_resposta(pdfs, [], catalogo_versao="abc", formato="registros"),
+            chave_resposta(pdfs, [], csv, formato="colunas"),
+            chave_resposta([], [arquivo(b"pdf a", "a.pdf")], csv, formato="registros"),
+        }
+
+        self.assertEqual(len(chaves), 6)
+
+    def test_documento_usa_o_sha256_da_chave(self):
+        """O SHA-256 calculado para a chave fica no arquivo e o DocumentoPDF não calcula de novo"""
+        pdf = arquivo(b"pdf a", "a.pdf")
+        chave_resposta([pdf], [], catalogo_versao="abc")
+
+        self.assertEqual(pdf.sha256_nfe, hashlib.sha256(b"pdf a").hexdigest())
+        with patch('analise_nfe.pdfs.documento.hashlib.sha256', side_effect=AssertionError("calculou de novo")):
+            documento = DocumentoPDF(pdf)
+        self.addCleanup(documento.fechar)
+
+        self.assertEqual(documento.sha256, pdf.sha256_nfe)
+        self.assertEqual(documento.arquivo.read(), b"pdf a")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Testes unitários para o repositório de versões da planilha de custos
+"""
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.catalogo.main import TAMANHO_MINIMO_PREFIXO, RepositorioCatalogos
+
+CSV_CUSTOS = "PRODUTOS,Cod,CUSTO\nBamboo,GR02A-DIS,\"120,50\"\nPink,GR06A-UD,\"1.500,00\"\n".encode()
+CSV_DUPLICADOS = CSV_CUSTOS + "Pink 2,GR06A-UD,\"99,00\"\n".encode()
+
+
+class TestRepositorioCatalogos(unittest.TestCase):
+    """Testes para o RepositorioCatalogos"""
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.repositorio = RepositorioCatalogos(self.pasta)
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_salvar_e_carregar(self):
+        """O csv é salvo uma vez e a versão é identificada pelo SHA-256"""
+        resultado = self.repositorio.salvar(CSV_CUSTOS, "custos.csv")
+
+        self.assertEqual(resultado["codigo"], 201)
+        self.assertEqual(resultado["linhas"], 2)
+        self.assertTrue(resultado["sha256"].startswith(resultado["versao"]))
+
+        catalogo = self.repositorio.carregar(resultado["versao"])
+        self.assertEqual(list(catalogo.planilha["CUSTO"]), [120.5, 1500.0])
+        self.assertEqual(catalogo.resposta["codigo"], 200)
+
+    def test_mesmo_csv_nao_cria_nova_versao(self):
+        """Reenviar o mesmo csv devolve a versão existente"""
+        primeiro = self.repositorio.salvar(CSV_CUSTOS)
+        segundo = self.repositorio.salvar(CSV_CUSTOS)
+
+        self.assertEqual(segundo["codigo"], 200)
+        self.assertEqual(segundo["versao"], primeiro["versao"])
+        self.assertEqual(len(self.repositorio.listar()), 1)
+
+    def test_versao_atual_e_a_mais_recente(self):
+        """Sem versão (ou "atual") é usada a última versão enviada"""
+        self.repositorio.salvar(CSV_CUSTOS)
+        duplicados = self.repositorio.salvar(CSV_DUPLICADOS)
+
+        catalogo = self.repositorio.carregar("atual")
+
+        self.assertEqual(catalogo.versao, duplicados["versao"])
+        self.assertEqual(catalogo.resposta["codigo"], 203)
+        self.assertEqual(len(catalogo.indice), len(catalogo.planilha))
+        self.assertEqual(duplicados["duplicados"], 2)
+        self.assertEqual([info["versao"] for info in self.repositorio.listar()][0], duplicados["versao"])
+
+    def test_versoes_sobrevivem_a_reinicio(self):
+        """Um novo repositório na mesma pasta lê as versões já salvas"""
+        versao = self.repositorio.salvar(CSV_CUSTOS)["versao"]
+
+        catalogo = RepositorioCatalogos(self.pasta).carregar(versao)
+
+        self.assertIsNotNone(catalogo)
+        self.assertIsNone(RepositorioCatalogos(self.pasta).carregar("ffffffff"))
+
+    def test_prefixo_curto_e_recusado(self):
+        """Prefixos com menos de TAMANHO_MINIMO_PREFIXO caracteres não escolhem versão"""
+        resultado = self.repositorio.salvar(CSV_CUSTOS)
+        erros = []
+
+        self.assertIsNone(self.repositorio.carregar(resultado["sha256"][:TAMANHO_MINIMO_PREFIXO - 1], erros))
+        self.assertEqual(len(erros), 1)
+        self.assertIsNotNone(self.repositorio.carregar(resultado["sha256"][:TAMANHO_MINIMO_PREFIXO]))
+        self.assertIsNotNone(self.repositorio.carregar(resultado["sha256"]))
+
+    def test_prefixo_ambiguo_e_recusado(self):
+        """Um prefixo de mais de uma versão não escolhe nenhuma, mas a versão completa continua valendo"""
+        primeiro = self.repositorio.salvar(CSV_CUSTOS)
+        segundo = self.repositorio.salvar(CSV_DUPLICADOS)
+        # Força as duas versões a compartilharem o mesmo prefixo
+        versoes = self.repositorio._ler_indice()
+        prefixo = primeiro["sha256"][:TAMANHO_MINIMO_PREFIXO]
+        versoes[1]["sha256"] = prefixo + versoes[1]["sha256"][TAMANHO_MINIMO_PREFIXO:]
+        self.repositorio._gravar_indice(versoes)
+        erros = []
+
+        self.assertIsNone(self.repositorio.carregar(prefixo, erros))
+        self.assertIn(primeiro["versao"], erros[0])
+        self.assertIn(segundo["versao"], erros[0])
+        self.assertEqual(self.repositorio.carregar(segundo["versao"]).versao, segundo["versao"])
+
+    def test_indice_por_codigo(self):
+        """O índice por código é montado quando a versão é carregada"""
+        catalogo = self.repositorio.carregar(self.repositorio.salvar(CSV_CUSTOS)["versao"])
+
+        self.assertEqual(catalogo.indice.loc["GR06A-UD", "CUSTO"], 1500.0)
+
+    def test_colunas_invalidas(self):
+        """Um csv sem as colunas Cod e CUSTO não é salvo"""
+        resultado = self.repositorio.salvar(b"PRODUTOS,PRECO\nA,1\n")
+
+        self.assertEqual(resultado["codigo"], 404)
+        self.assertEqual(self.repositorio.listar(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
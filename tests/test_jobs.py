@@ -0,0 +1,180 @@
+"""
+Testes unitários para os jobs de /processar_arquivos (analise_nfe/jobs)
+"""
+
+import unittest
+from unittest.mock import patch
+import io
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.jobs.main import (
+    CONCLUIDO,
+    ERRO,
+    PENDENTE,
+    PROCESSANDO,
+    GerenciadorJobs,
+    RepositorioJobs,
+    instancia_processo,
+    retomar_jobs,
+)
+from tests.test_nfe_xml import criar_xml_nfe
+
+CSV_CUSTOS = "PRODUTOS,Cod,CUSTO\nBamboo,GR02A-DIS,\"120,50\"\n".encode()
+
+
+def arquivos_job(*xmls):
+    arquivos = [("xmls", f"nota_{posicao}.xml", io.BytesIO(xml)) for posicao, xml in enumerate(xmls)]
+    return arquivos + [("csv", "custos.csv", io.BytesIO(CSV_CUSTOS))]
+
+
+class TestRepositorioJobs(unittest.TestCase):
+    """Testes para o estado dos jobs no SQLite"""
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.repositorio = RepositorioJobs(os.path.join(self.pasta, "jobs.sqlite3"))
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_reservar_uma_unica_vez(self):
+        """Apenas um worker consegue reservar o job pendente"""
+        self.repositorio.criar("a", {"motor": None}, 2)
+
+        self.assertTrue(self.repositorio.reservar("a", 1))
+        self.assertFalse(self.repositorio.reservar("a", 2))
+        self.assertEqual(self.repositorio.consultar("a")["estado"], PROCESSANDO)
+
+    def test_estado_sobrevive_a_outra_conexao(self):
+        """O estado fica no arquivo e é visto por outro repositório (outro worker ou reinicio)"""
+        self.repositorio.criar("a", {"motor": "pypdf"}, 2)
+        self.repositorio.atualizar_progresso("a", 1)
+
+        job = RepositorioJobs(self.repositorio.caminho).consultar("a")
+
+        self.assertEqual((job["lidas"], job["total"], job["parametros"]), (1, 2, {"motor": "pypdf"}))
+
+    def test_retomar_jobs_de_processos_que_terminaram(self):
+        """Jobs processando em um processo que não existe mais voltam para pendente"""
+        for job_id in ("morto", "vivo", "pendente"):
+            self.repositorio.criar(job_id, {}, 1)
+        self.repositorio.reservar("morto", 999999999, "boot:999999999:1")
+        self.repositorio.reservar("vivo", os.getpid(), instancia_processo())
+
+        pendentes = self.repositorio.retomar()
+
+        self.assertEqual(sorted(pendentes), ["morto", "pendente"])
+        self.assertEqual(self.repositorio.consultar("vivo")["estado"], PROCESSANDO)
+
+    def test_pid_reutilizado_nao_prende_o_job(self):
+        """Um processo vivo com o pid de um worker anterior (outra instancia) não deixa o job em processando"""
+        self.repositorio.criar("a", {}, 1)
+        self.repositorio.reservar("a", os.getpid(), "boot-anterior:1:1")
+
+        self.assertEqual(self.repositorio.retomar(), ["a"])
+        self.assertIsNone(self.repositorio.consultar("a")["instancia"])
+
+    def test_instancia_do_processo(self):
+        """A instancia muda entre processos e é None para um processo que não existe"""
+        self.assertEqual(instancia_processo(), instancia_processo(os.getpid()))
+        self.assertNotEqual(instancia_processo(), instancia_processo(os.getppid()))
+        self.assertIsNone(instancia_processo(999999999))
+
+    def test_remover_antigos(self):
+        """Somente jobs terminados antes do limite são removidos"""
+        self.repositorio.criar("a", {}, 1)
+        self.repositorio.criar("b", {}, 1)
+        self.repositorio.concluir("a", 200)
+
+        removidos = self.repositorio.remover_antigos(datetime.now(timezone.utc) + timedelta(hours=1))
+
+        self.assertEqual(removidos, ["a"])
+        self.assertIsNone(self.repositorio.consultar("a"))
+        self.assertEqual(self.repositorio.consultar("b")["estado"], PENDENTE)
+
+
+class TestGerenciadorJobs(unittest.TestCase):
+    """Testes para a execução dos jobs em segundo plano"""
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def test_processar_e_guardar_resultado(self):
+        """O job lê as notas, informa o progresso e guarda a resposta de /processar_arquivos"""
+        gerenciador = GerenciadorJobs(self.pasta)
+        xmls = [
+            criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "Bamboo")]),
+            criar_xml_nfe("3001", [("GR02A-DIS", "1.0000", "Bamboo")]),
+        ]
+
+        job = gerenciador.enviar(arquivos_job(*xmls), {"catalogo_versao": None, "motor": None, "centavos": False})
+        gerenciador.pool.shutdown(wait=True)
+
+        status = gerenciador.consultar(job["job_id"])
+        self.assertEqual((status["estado"], status["codigo"]), (CONCLUIDO, 200))
+        self.assertEqual((status["notas_lidas"], status["total_notas"]), (2, 2))
+        self.assertEqual(
+            gerenciador.resultado(job["job_id"])["planilha_total_itens"],
+            [{"numeroDaNota": "3000", "total": "241.00"}, {"numeroDaNota": "3001", "total": "120.50"}],
+        )
+        # Os arquivos enviados são apagados depois do processamento
+        self.assertFalse(os.path.exists(os.path.join(self.pasta, job["job_id"], "entrada")))
+
+    def test_erro_no_processamento(self):
+        """Uma exceção no processamento deixa o job com erro"""
+        gerenciador = GerenciadorJobs(self.pasta)
+
+        with patch("analise_nfe.jobs.main.processar_arquivos_nfe", side_effect=RuntimeError("falhou")):
+            job = gerenciador.enviar(arquivos_job(b"<nfe/>"), {"motor": None})
+            gerenciador.pool.shutdown(wait=True)
+
+        status = gerenciador.consultar(job["job_id"])
+        self.assertEqual((status["estado"], status["erro"]), (ERRO, "falhou"))
+        self.assertIsNone(gerenciador.resultado(job["job_id"]))
+
+    def test_jobs_pendentes_retomados_ao_reiniciar(self):
+        """Jobs que não terminaram antes do reinicio são processados pelo novo gerenciador"""
+        with patch.object(GerenciadorJobs, "_executar"):
+            job = GerenciadorJobs(self.pasta).enviar(
+                arquivos_job(criar_xml_nfe("3000", [("GR02A-DIS", "2.0000", "Bamboo")])),
+                {"motor": None},
+            )
+
+        gerenciador = GerenciadorJobs(self.pasta)
+        gerenciador.pool.shutdown(wait=True)
+
+        self.assertEqual(gerenciador.consultar(job["job_id"])["estado"], CONCLUIDO)
+
+    def test_retomar_jobs_na_inicializacao_do_worker(self):
+        """O hook post_worker_init do Gunicorn cria o gerenciador (que retoma os jobs) sem esperar uma requisição"""
+        hooks = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+
+        with patch("analise_nfe.jobs.main.obter_gerenciador_jobs") as obter:
+            hooks["post_worker_init"](None)
+            for thread in threading.enumerate():
+                if thread.name == "retomar-jobs":
+                    thread.join(5)
+
+        obter.assert_called_once_with()
+
+    def test_erro_ao_retomar_nao_derruba_o_worker(self):
+        """Um erro ao criar o gerenciador vai para o log"""
+        with patch("analise_nfe.jobs.main.obter_gerenciador_jobs", side_effect=OSError("sem disco")):
+            with self.assertLogs("analise_nfe.jobs.main", level="WARNING"):
+                retomar_jobs()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Testes unitários para as métricas (/metrics) e os logs estruturados (analise_nfe/metricas)
+"""
+
+import unittest
+from unittest.mock import Mock
+import json
+import logging
+import os
+import sys
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.metricas.logs import FormatadorJson
+from analise_nfe.metricas.main import (
+    ERROS,
+    ETAPAS,
+    RegistroMetricas,
+    RESPOSTAS_FOCUSNFE,
+    medir_etapa,
+    requisicao_focusnfe,
+)
+
+
+class TestRegistroMetricas(unittest.TestCase):
+    """Testes para os contadores, histogramas e o texto no formato do Prometheus"""
+
+    def test_histograma_acumula_os_baldes(self):
+        """Cada balde conta os valores até o seu limite, o +Inf conta todos"""
+        registro = RegistroMetricas()
+        histograma = registro.histograma("teste_segundos", "Tempo", ("etapa",), baldes=(0.1, 1))
+
+        for valor in (0.05, 0.1, 0.5, 3):
+            histograma.observar(valor, etapa="a")
+
+        linhas = registro.texto().splitlines()
+        self.assertEqual(linhas[:2], ["# HELP teste_segundos Tempo", "# TYPE teste_segundos histogram"])
+        self.assertEqual(linhas[2:], [
+            'teste_segundos_bucket{etapa="a",le="0.1"} 2',
+            'teste_segundos_bucket{etapa="a",le="1"} 3',
+            'teste_segundos_bucket{etapa="a",le="+Inf"} 4',
+            'teste_segundos_sum{etapa="a"} 3.65',
+            'teste_segundos_count{etapa="a"} 4',
+        ])
+
+    def test_contador_por_rotulos(self):
+        """Cada combinação de rótulos tem o seu valor e os rótulos são escapados"""
+        registro = RegistroMetricas()
+        contador = registro.contador("teste_total", "Itens", ("tipo",))
+
+        contador.incrementar(tipo="pdf")
+        contador.incrementar(3, tipo='x"ml')
+
+        self.assertEqual(contador.valor(tipo="pdf"), 1)
+        self.assertIn('teste_total{tipo="x\\"ml"} 3', registro.texto())
+        with self.assertRaises(ValueError):
+            contador.incrementar(outro="a")
+
+    def test_registrar_de_novo_devolve_a_mesma_metrica(self):
+        registro = RegistroMetricas()
+
+        self.assertIs(registro.contador("teste_total", "a"), registro.contador("teste_total", "a"))
+
+    def test_medir_etapa_conta_erros(self):
+        """Uma exceção na etapa é contada em nfe_erros_total e continua subindo"""
+        antes = (ETAPAS.quantidade(etapa="teste_erro"), ERROS.valor(etapa="teste_erro"))
+
+        with self.assertRaises(RuntimeError):
+            with medir_etapa("teste_erro"):
+                raise RuntimeError("falhou")
+
+        self.assertEqual((ETAPAS.quantidade(etapa="teste_erro"), ERROS.valor(etapa="teste_erro")), (antes[0] + 1, antes[1] + 1))
+
+    def test_requisicao_focusnfe(self):
+        """As respostas da FocusNFe são contadas pelo status HTTP, e as falhas de conexão como "erro" """
+        antes = RESPOSTAS_FOCUSNFE.valor(operacao="consultar", codigo=404)
+        metodo = Mock(return_value=Mock(status_code=404))
+
+        requisicao_focusnfe("consultar", metodo, "https://exemplo/ref", auth=None)
+
+        metodo.assert_called_once_with("https://exemplo/ref", auth=None)
+        self.assertEqual(RESPOSTAS_FOCUSNFE.valor(operacao="consultar", codigo=404), antes + 1)
+
+        erros = RESPOSTAS_FOCUSNFE.valor(operacao="consultar", codigo="erro")
+        with self.assertRaises(ConnectionError):
+            requisicao_focusnfe("consultar", Mock(side_effect=ConnectionError()), "https://exemplo/ref")
+        self.assertEqual(RESPOSTAS_FOCUSNFE.valor(operacao="consultar", codigo="erro"), erros + 1)
+
+
+class TestLogs(unittest.TestCase):
+    """Testes para o log estruturado"""
+
+    def test_formatador_json_com_extra(self):
+        """Os campos do extra entram no JSON de cada log"""
+        registro = logging.LogRecord("analise_nfe.teste", logging.DEBUG, __file__, 1, "Itens sem custo", (), None)
+        registro.nota = "2162"
+
+        linha = json.loads(FormatadorJson().format(registro))
+
+        self.assertEqual(
+            {chave: linha[chave] for chave in ("nivel", "logger", "mensagem", "nota")},
+            {"nivel": "DEBUG", "logger": "analise_nfe.teste", "mensagem": "Itens sem custo", "nota": "2162"},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Testes unitários para a leitura incremental de uma pasta de DANFEs
+Os pdfs de NFeExemplo são lidos com o motor pypdf (sem Java)
+"""
+
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import sys
+import tempfile
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.monitoramento.main import (
+    MonitorPastaNFe,
+    arquivo_estado_pasta,
+    percorrer_lista_pdfs_diretorio_incremental,
+)
+from analise_nfe.pdfs.main import processar_pdfs_por_arquivo
+
+PASTA_EXEMPLOS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'NFeExemplo'))
+PDF_2160 = 'NF_2160_Mrceglia_G-Rollz_Wellington_06-12.pdf'
+PDF_2161 = 'NF_2161_Mrceglia_G-Rollz_Leonora_16-12.pdf'
+PDF_2162 = 'NF_2162_Mrceglia_G-Rollz_ACCI_19-12.pdf'
+
+
+class TestMonitorPastaNFe(unittest.TestCase):
+    """Testes para o MonitorPastaNFe"""
+
+    def setUp(self):
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+        self.pasta = tempfile.mkdtemp()
+        self.arquivo_estado = os.path.join(tempfile.mkdtemp(), 'estado.pkl')
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+        shutil.rmtree(self.pasta, ignore_errors=True)
+        shutil.rmtree(os.path.dirname(self.arquivo_estado), ignore_errors=True)
+
+    def copiar_exemplo(self, nome):
+        shutil.copy(os.path.join(PASTA_EXEMPLOS, nome), os.path.join(self.pasta, nome))
+
+    def criar_monitor(self):
+        return MonitorPastaNFe(self.pasta, self.arquivo_estado, motor="pypdf", workers=1)
+
+    def test_le_apenas_pdfs_novos(self):
+        """Uma segunda atualização só lê o pdf que chegou depois"""
+        self.copiar_exemplo(PDF_2160)
+        monitor = self.criar_monitor()
+
+        self.assertEqual(len(monitor.atualizar()), 1)
+        self.copiar_exemplo(PDF_2161)
+
+        with patch('analise_nfe.monitoramento.main.processar_pdfs_por_arquivo', wraps=processar_pdfs_por_arquivo) as mock_processar:
+            lidos = monitor.atualizar()
+
+        self.assertEqual(lidos, [f"{self.pasta}/{PDF_2161}"])
+        self.assertEqual(len(mock_processar.call_args.args[0]), 1)
+        self.assertEqual(sorted(monitor.resultados()), ["2160", "2161"])
+
+    def test_sem_alteracoes_nao_le_nada(self):
+        """Sem arquivos novos nenhum pdf é lido"""
+        self.copiar_exemplo(PDF_2160)
+        monitor = self.criar_monitor()
+        monitor.atualizar()
+
+        with patch('analise_nfe.monitoramento.main.processar_pdfs_por_arquivo') as mock_processar:
+            self.assertEqual(monitor.atualizar(), [])
+
+        mock_processar.assert_not_called()
+
+    def test_mesmo_conteudo_com_nova_data(self):
+        """Um pdf regravado com o mesmo conteúdo não é lido de novo"""
+        self.copiar_exemplo(PDF_2160)
+        monitor = self.criar_monitor()
+        monitor.atualizar()
+
+        caminho = os.path.join(self.pasta, PDF_2160)
+        os.utime(caminho, (1, 1))
+
+        self.assertEqual(monitor.atualizar(), [])
+
+    def test_pdf_alterado_e_removido(self):
+        """Um pdf substituido é lido de novo e um pdf removido sai do resultado"""
+        self.copiar_exemplo(PDF_2160)
+        self.copiar_exemplo(PDF_2161)
+        monitor = self.criar_monitor()
+        monitor.atualizar()
+
+        shutil.copy(os.path.join(PASTA_EXEMPLOS, PDF_2162), os.path.join(self.pasta, PDF_2160))
+        os.remove(os.path.join(self.pasta, PDF_2161))
+
+        self.assertEqual(monitor.atualizar(), [f"{self.pasta}/{PDF_2160}"])
+        self.assertEqual(sorted(monitor.resultados()), ["2162"])
+
+    def test_estado_recuperado_apos_reinicio(self):
+        """Um novo monitor com o mesmo estado não lê de novo os pdfs já processados"""
+        self.copiar_exemplo(PDF_2160)
+        self.copiar_exemplo(PDF_2162)
+        self.criar_monitor().atualizar()
+
+        monitor = self.criar_monitor()
+
+        self.assertEqual(sorted(monitor.resultados()), ["2160", "2162"])
+        self.assertEqual(monitor.atualizar(), [])
+        self.assertEqual(list(monitor.resultados()["2162"]["QTDD"]), [5, 7, 7, 7])
+
+    def test_pdf_com_erro_nao_e_lido_de_novo(self):
+        """Um pdf inválido vai para a lista de erros uma vez e só é lido de novo se mudar"""
+        with open(os.path.join(self.pasta, 'quebrado.pdf'), 'wb') as arquivo:
+            arquivo.write(b'nao e um pdf')
+        monitor = self.criar_monitor()
+
+        erros = []
+        monitor.atualizar(erros)
+        self.assertEqual(len(erros), 1)
+
+        erros = []
+        self.assertEqual(monitor.atualizar(erros), [])
+        self.assertEqual(erros, [])
+
+
+    def test_estado_de_outro_motor_ignorado(self):
+        """O estado salvo com o pypdf não é usado por um monitor com o tabula"""
+        self.copiar_exemplo(PDF_2160)
+        self.criar_monitor().atualizar()
+
+        monitor = MonitorPastaNFe(self.pasta, self.arquivo_estado, motor="tabula", workers=1)
+
+        self.assertEqual(monitor.resultados(), {})
+
+    def test_um_monitor_por_motor(self):
+        """Chamadas com outro motor não reaproveitam o monitor (nem o estado) da primeira chamada"""
+        self.copiar_exemplo(PDF_2160)
+        pasta_estado = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta_estado, True)
+
+        with patch.dict(os.environ, {'NFE_MONITOR_ESTADO_DIR': pasta_estado}), \
+                patch('analise_nfe.monitoramento.main._monitores', {}) as monitores:
+            percorrer_lista_pdfs_diretorio_incremental(self.pasta, motor="pypdf")
+            with patch('analise_nfe.pdfs.main.extrair_tabelas_produtos_area', side_effect=RuntimeError("tabula")):
+                erros = []
+                percorrer_lista_pdfs_diretorio_incremental(self.pasta, motor="tabula", erros=erros)
+
+        self.assertEqual(len(monitores), 2)
+        self.assertEqual(len(erros), 1)
+        self.assertEqual(len(os.listdir(pasta_estado)), 2)
+
+    @patch.dict(os.environ, {'NFE_MONITOR_ESTADO_DIR': tempfile.gettempdir()})
+    def test_arquivo_estado_unico_por_pasta(self):
+        """Pastas cujos caminhos viram o mesmo nome com "_" têm estados diferentes"""
+        self.assertNotEqual(arquivo_estado_pasta('/a/b_c'), arquivo_estado_pasta('/a_b/c'))
+        self.assertNotEqual(arquivo_estado_pasta('/a/b', 'pypdf'), arquivo_estado_pasta('/a/b', 'tabula'))
+        self.assertEqual(arquivo_estado_pasta('/a/b/'), arquivo_estado_pasta('/a/b'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Testes unitários para a leitura das notas em XML (procNFe)
+"""
+
+import unittest
+import io
+import os
+import sys
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.nfe_xml.main import get_dados_nfe_by_xml, percorrer_lista_xmls
+
+
+def criar_xml_nfe(numero, itens):
+    """Cria um xml procNFe com os itens [(cProd, qCom, xProd)]"""
+    dets = "".join(
+        f'<det nItem="{i}"><prod><cProd>{codigo}</cProd><xProd>{descricao}</xProd>'
+        f'<uCom>UNID</uCom><qCom>{quantidade}</qCom><vUnCom>140.0000000000</vUnCom></prod>'
+        f'<imposto><vTotTrib>0.00</vTotTrib></imposto></det>'
+        for i, (codigo, quantidade, descricao) in enumerate(itens, start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+        '<NFe><infNFe Id="NFe42241208916497000285550010000021601016664015" versao="4.00">'
+        f'<ide><cUF>42</cUF><natOp>Venda</natOp><mod>55</mod><serie>1</serie><nNF>{numero}</nNF></ide>'
+        f'{dets}'
+        '</infNFe></NFe><protNFe versao="4.00"><infProt><nProt>242240282588818</nProt></infProt></protNFe>'
+        '</nfeProc>'
+    ).encode("utf-8")
+
+
+class ArquivoXml(io.BytesIO):
+    """Simula o FileStorage do Flask"""
+
+    def __init__(self, filename, conteudo):
+        super().__init__(conteudo)
+        self.filename = filename
+
+
+class TestGetDadosNfeByXml(unittest.TestCase):
+    """Testes para a função get_dados_nfe_by_xml"""
+
+    def test_itens_e_numero_da_nota(self):
+        """O xml gera o mesmo formato da leitura do pdf"""
+        xml = criar_xml_nfe("2160", [
+            ("GR1521H-DIS", "3.0000", "G-Rollz | 2x Passion Fruit - Pre-Rolled Cones"),
+            ("GR1575A-DIS", "2.0000", "G-ROLLZ Golden Cone Display 6pcs"),
+        ])
+
+        nfe = get_dados_nfe_by_xml(io.BytesIO(xml))
+
+        self.assertEqual(nfe["codigo_nfe"], "2160")
+        self.assertEqual(list(nfe["itens"].columns), ["Cod", "QTDD", "ITEM"])
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1521H-DIS", "GR1575A-DIS"])
+        self.assertEqual(list(nfe["itens"]["QTDD"]), [3, 2])
+        self.assertEqual(str(nfe["itens"]["QTDD"].dtype), "int64")
+        self.assertEqual(list(nfe["itens"]["ITEM"]), ["G-Rollz | 2x Passion Fruit", "G-ROLLZ Golden Cone Display 6pcs"])
+
+    def test_quantidade_fracionada(self):
+        """Quantidades fracionadas continuam decimais"""
+        nfe = get_dados_nfe_by_xml(io.BytesIO(criar_xml_nfe("1", [("A", "1.5000", "Item")])))
+
+        self.assertEqual(nfe["itens"]["QTDD"].iloc[0], 1.5)
+
+    def test_xml_sem_numero(self):
+        """Xml sem nNF é recusado"""
+        with self.assertRaises(ValueError):
+            get_dados_nfe_by_xml(io.BytesIO(b'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"></NFe>'))
+
+    def test_lista_com_erro(self):
+        """Um xml inválido é informado sem interromper os outros"""
+        arquivos = [
+            ArquivoXml("2160.xml", criar_xml_nfe("2160", [("A", "1.0000", "Item")])),
+            ArquivoXml("quebrado.xml", b"<nfeProc>"),
+            ArquivoXml("nota.pdf", b"%PDF"),
+        ]
+        erros = []
+
+        nfes = percorrer_lista_xmls(arquivos, erros=erros)
+
+        self.assertEqual(list(nfes.keys()), ["2160"])
+        self.assertEqual([erro["arquivo"] for erro in erros], ["quebrado.xml"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,435 @@
+"""
+Testes unitários para a extração de dados das DANFEs em PDF
+O tabula (Java) é simulado com mocks, o pypdf lê os PDFs de NFeExemplo
+"""
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import threading
+
+import pandas as pd
+import pypdf as pyf
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.pdfs import areas
+from analise_nfe.pdfs.areas import areas_produtos, cnpj_emitente, detectar_area_produtos
+from analise_nfe.pdfs.documento import DocumentoPDF
+from analise_nfe.pdfs.extrator_pypdf import extrair_linhas_produtos
+from analise_nfe.pdfs.main import (
+    get_dados_nfe_by_pdf,
+    percorrer_lista_pdfs,
+    processar_pdfs,
+    separar_tabelas_por_pagina,
+    tabela_json_para_df,
+)
+from analise_nfe.pdfs.pool import encerrar_pool_pdfs, obter_pool_pdfs
+
+PASTA_EXEMPLOS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'NFeExemplo'))
+PDF_2160 = os.path.join(PASTA_EXEMPLOS, 'NF_2160_Mrceglia_G-Rollz_Wellington_06-12.pdf')
+PDF_2161 = os.path.join(PASTA_EXEMPLOS, 'NF_2161_Mrceglia_G-Rollz_Leonora_16-12.pdf')
+PDF_2162 = os.path.join(PASTA_EXEMPLOS, 'NF_2162_Mrceglia_G-Rollz_ACCI_19-12.pdf')
+
+# Itens esperados de cada DANFE de exemplo (mesma saida do tabula)
+ITENS_ESPERADOS = {
+    PDF_2160: ("2160", [
+        ("GR1521H-DIS", 3, "G-Rollz | 2x Passion Fruit Flavored Pre"),
+        ("PR1521C-DIS", 3, "G-Rollz | 2x Mango Flavored Pre-Rolled"),
+        ("PR1521A-DIS", 6, "G-Rollz | 2x Strawberry Flavored Pre"),
+        ("GR1575A-DIS", 2, "G-ROLLZ Golden Cone Display 6pcs (24k"),
+    ]),
+    PDF_2161: ("2161", [
+        ("PR1516D-DIS", 1, "G-Rollz | 4x Grape Flavored Wraps (15"),
+        ("GR1546F-DIS", 1, "G-ROLLZ | 2X DUTCH BLEND CONES"),
+        ("GR1545A-DIS", 2, "GROLLZ Bloody Orange 2 Blunt Cones"),
+        ("GR06A-UD", 1, "G-ROLLZ | Lightly Dyed Pink"),
+        ("PR30G-DIS", 2, "G-ROLLZ | Pets Rock Rap Unbleached"),
+        ("GR1521H-DIS", 1, "G-Rollz | 2x Passion Fruit Flavored Pre"),
+        ("DK1521J-DIS", 1, "G-Rollz | 2x Honey Flavored Pre-Rolled"),
+        ("PR1521C-DIS", 1, "G-Rollz | 2x Mango Flavored Pre-Rolled"),
+    ]),
+    PDF_2162: ("2162", [
+        ("BG1545A-DIS", 5, "G-ROLLZ | Banksys Graffiti"),
+        ("GR1546F-DIS", 7, "G-ROLLZ | 2X DUTCH BLEND CONES"),
+        ("GR1545A-DIS", 7, "GROLLZ Bloody Orange 2 Blunt Cones"),
+        ("GR1545B-DIS", 7, "G-ROLLZ MANGO PULP 2 BLUNT"),
+    ]),
+}
+
+
+def criar_tabela_json(top, bottom, linhas):
+    """Cria uma tabela no formato json do tabula"""
+    return {
+        "extraction_method": "lattice",
+        "top": top, "left": 30.0, "width": 530.0, "height": bottom - top,
+        "right": 560.0, "bottom": bottom,
+        "data": [[{"text": celula} for celula in linha] for linha in linhas],
+    }
+
+
+def criar_pagina_json(itens):
+    """Cria as tabelas de uma pagina da DANFE: cabeçalho, produtos e dados adicionais"""
+    cabecalho = criar_tabela_json(20.0, 120.0, [["NATUREZA DA OPERAÇÃO"], ["Venda"]])
+    produtos = criar_tabela_json(
+        400.0, 600.0,
+        [["CÓDIGO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "QTD."]] + itens
+    )
+    adicionais = criar_tabela_json(700.0, 780.0, [["INFORMAÇÕES COMPLEMENTARES"], ["Tributos"]])
+    return [cabecalho, produtos, adicionais]
+
+
+class TestSepararTabelasPorPagina(unittest.TestCase):
+    """Testes para a separação da saida do tabula por pagina"""
+
+    def test_separar_tabelas_duas_paginas(self):
+        """Uma tabela acima da anterior inicia uma nova página"""
+        tabelas = criar_pagina_json([["A-1", "Item A", "1"]]) + criar_pagina_json([["B-1", "Item B", "2"]])
+
+        grupos = separar_tabelas_por_pagina(tabelas)
+
+        self.assertEqual(len(grupos), 2)
+        self.assertEqual([len(grupo) for grupo in grupos], [3, 3])
+
+    def test_separar_tabelas_lado_a_lado(self):
+        """Tabelas na mesma altura continuam na mesma página"""
+        esquerda = criar_tabela_json(20.0, 120.0, [["EMITENTE"]])
+        direita = criar_tabela_json(20.0, 120.0, [["DANFE"]])
+
+        self.assertEqual(len(separar_tabelas_por_pagina([esquerda, direita])), 1)
+
+    def test_tabela_json_para_df(self):
+        """A primeira linha vira cabeçalho e colunas numéricas são convertidas"""
+        tabela = criar_tabela_json(0.0, 10.0, [["CÓDIGO", "", "QTD."], ["GR1-\rDIS", "", "3"]])
+
+        df = tabela_json_para_df(tabela)
+
+        self.assertEqual(list(df.columns), ["CÓDIGO", "Unnamed: 0", "QTD."])
+        self.assertEqual(df["QTD."].iloc[0], 3)
+        self.assertTrue(pd.isna(df["Unnamed: 0"].iloc[0]))
+
+    def test_tabela_json_com_cabecalho_repetido(self):
+        """Colunas com o mesmo rótulo recebem o sufixo ".n", como no tabula"""
+        tabela = criar_tabela_json(0.0, 10.0, [
+            ["CÓDIGO", "QTD.", "QTD.", "QTD..1", "QTD."],
+            ["GR1-DIS", "3", "4", "5", "6"],
+        ])
+
+        df = tabela_json_para_df(tabela)
+
+        self.assertEqual(list(df.columns), ["CÓDIGO", "QTD.", "QTD..1", "QTD..1.1", "QTD..2"])
+        self.assertIsInstance(df["QTD."], pd.Series)
+        self.assertEqual(df["QTD."].iloc[0], 3)
+
+
+class TestGetDadosNfeByPdf(unittest.TestCase):
+    """Testes para a função get_dados_nfe_by_pdf"""
+
+    def setUp(self):
+        """Desliga o cache para que cada teste leia o pdf e a leitura por área para testar a escolha por índice"""
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+        os.environ['NFE_TABULA_AREA'] = '0'
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+        os.environ.pop('NFE_TABULA_AREA', None)
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_modo_documento_uma_execucao_do_tabula(self, mock_read_pdf):
+        """No modo documento o tabula é chamado uma única vez"""
+        mock_read_pdf.return_value = criar_pagina_json([
+            ["GR1521H-\rDIS", "G-Rollz | 2x Passion Fruit - Pre-Rolled", "3"],
+            ["GR1575A-\rDIS", "G-ROLLZ Golden Cone\rDisplay", "2"],
+        ])
+
+        nfe = get_dados_nfe_by_pdf(PDF_2160, modo_tabula="documento")
+
+        mock_read_pdf.assert_called_once()
+        self.assertEqual(mock_read_pdf.call_args.kwargs["pages"], "all")
+        self.assertEqual(nfe["codigo_nfe"], "2160")
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1521H-DIS", "GR1575A-DIS"])
+        self.assertEqual(list(nfe["itens"]["QTDD"]), [3, 2])
+        self.assertEqual(list(nfe["itens"]["ITEM"]), ["G-Rollz | 2x Passion Fruit", "G-ROLLZ Golden Cone"])
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_modo_documento_volta_para_pagina(self, mock_read_pdf):
+        """Se a separação por página não bater com o pdf, usa uma execução por página"""
+        pagina = criar_pagina_json([["GR1-DIS", "Item", "1"]])
+        df_pagina = [tabela_json_para_df(tabela) for tabela in pagina]
+        mock_read_pdf.side_effect = [pagina + pagina, df_pagina]
+
+        nfe = get_dados_nfe_by_pdf(PDF_2160, modo_tabula="documento")
+
+        self.assertEqual(mock_read_pdf.call_count, 2)
+        self.assertEqual(mock_read_pdf.call_args.kwargs["pages"], 1)
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1-DIS"])
+
+
+class TestAreaProdutos(unittest.TestCase):
+    """Testes para a leitura do tabula restrita à área da tabela de produtos"""
+
+    def setUp(self):
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+        areas._areas_por_layout.clear()
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+        areas._areas_por_layout.clear()
+
+    def test_detectar_area_pelos_rotulos(self):
+        """A área vai do rótulo dos produtos até o rótulo dos dados adicionais"""
+        documento = DocumentoPDF(PDF_2160)
+
+        topo, esquerda, base, direita = detectar_area_produtos(documento, 0)
+
+        self.assertAlmostEqual(topo, 440.5, places=1)
+        self.assertAlmostEqual(base, 718.11, places=1)
+        self.assertEqual((esquerda, direita), (0.0, 595.0))
+        self.assertEqual(cnpj_emitente(documento), "08916497000285")
+        documento.fechar()
+
+    def test_area_do_modelo_do_emitente(self):
+        """Sem os rótulos na página é usada a área já detectada para o mesmo emitente"""
+        documento = DocumentoPDF(PDF_2161)
+        area = areas_produtos(documento)[0]
+
+        with patch('analise_nfe.pdfs.areas.detectar_area_produtos', return_value=None):
+            self.assertEqual(areas_produtos(DocumentoPDF(PDF_2162)), [area])
+            areas._areas_por_layout.clear()
+            self.assertIsNone(areas_produtos(DocumentoPDF(PDF_2162)))
+        documento.fechar()
+
+    @patch('analise_nfe.pdfs.areas.MAXIMO_LAYOUTS', 2)
+    def test_layouts_lembrados_limitados(self):
+        """Acima de MAXIMO_LAYOUTS sai o layout usado há mais tempo"""
+        areas.lembrar_area(("a", True), [1])
+        areas.lembrar_area(("b", True), [2])
+        areas.area_lembrada(("a", True))
+        areas.lembrar_area(("c", True), [3])
+
+        self.assertEqual(list(areas._areas_por_layout), [("a", True), ("c", True)])
+        self.assertIsNone(areas.area_lembrada(("b", True)))
+
+    def test_layouts_lembrados_por_varias_threads(self):
+        """Várias threads gravando ao mesmo tempo não passam do limite"""
+        def lembrar(inicio):
+            for numero in range(inicio, inicio + 500):
+                areas.lembrar_area((str(numero), True), [numero])
+
+        with patch('analise_nfe.pdfs.areas.MAXIMO_LAYOUTS', 100):
+            threads = [threading.Thread(target=lembrar, args=(inicio,)) for inicio in range(0, 4000, 500)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(areas._areas_por_layout), 100)
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_tabula_recebe_a_area(self, mock_read_pdf):
+        """O tabula lê só a área e a tabela é escolhida pelo cabeçalho, não pela posição"""
+        produtos = criar_tabela_json(440.0, 600.0, [
+            ["CÓDIGO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "QTD."],
+            ["GR1521H-\rDIS", "G-Rollz | 2x Passion Fruit - Pre-Rolled", "3"],
+        ])
+        mock_read_pdf.return_value = [produtos, criar_tabela_json(600.0, 700.0, [["ICMS"], ["0,00"]])]
+
+        nfe = get_dados_nfe_by_pdf(PDF_2160, motor="tabula")
+
+        mock_read_pdf.assert_called_once()
+        self.assertEqual(mock_read_pdf.call_args.kwargs["pages"], [1])
+        self.assertAlmostEqual(mock_read_pdf.call_args.kwargs["area"][0], 440.5, places=1)
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1521H-DIS"])
+        self.assertEqual(list(nfe["itens"]["QTDD"]), [3])
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_sem_tabela_de_produtos_volta_para_indice(self, mock_read_pdf):
+        """Sem a tabela de produtos na área, volta para a leitura do documento inteiro"""
+        mock_read_pdf.side_effect = [[], criar_pagina_json([["GR1-DIS", "Item", "1"]])]
+
+        nfe = get_dados_nfe_by_pdf(PDF_2160, motor="tabula")
+
+        self.assertEqual(mock_read_pdf.call_count, 2)
+        self.assertEqual(mock_read_pdf.call_args.kwargs["pages"], "all")
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1-DIS"])
+
+
+class TestMotorPypdf(unittest.TestCase):
+    """Testes para a extração sem Java usando o texto posicionado do pypdf"""
+
+    def setUp(self):
+        """Desliga o cache para que cada teste leia o pdf"""
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_motor_pypdf_exemplos(self, mock_read_pdf):
+        """O motor pypdf devolve os mesmos itens do tabula para as DANFEs de exemplo"""
+        for pdf, (codigo_esperado, itens_esperados) in ITENS_ESPERADOS.items():
+            nfe = get_dados_nfe_by_pdf(pdf, motor="pypdf")
+
+            self.assertEqual(nfe["codigo_nfe"], codigo_esperado)
+            self.assertEqual(list(nfe["itens"].columns), ["Cod", "QTDD", "ITEM"])
+            self.assertEqual(list(nfe["itens"].itertuples(index=False, name=None)), itens_esperados)
+
+        mock_read_pdf.assert_not_called()
+
+    @patch('analise_nfe.pdfs.main.extrair_tabelas_produtos_pypdf')
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_motor_pypdf_volta_para_tabula(self, mock_read_pdf, mock_pypdf):
+        """Quando o pypdf não reconhece a tabela o tabula é usado"""
+        mock_pypdf.return_value = None
+        mock_read_pdf.return_value = criar_pagina_json([["GR1-DIS", "Item", "4"]])
+
+        nfe = get_dados_nfe_by_pdf(PDF_2160, motor="pypdf")
+
+        mock_read_pdf.assert_called_once()
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["GR1-DIS"])
+
+    def test_linhas_sem_cabecalho(self):
+        """Texto sem a tabela de produtos não é reconhecido"""
+        self.assertIsNone(extrair_linhas_produtos("DANFE\nNATUREZA DA OPERAÇÃO"))
+
+    def test_linhas_com_valores_inconsistentes(self):
+        """Itens em que QTD. x VLR. UNIT. não bate com VLR. TOTAL não são reconhecidos"""
+        texto = (
+            " CÓDIGO   DESCRIÇÃO DO PRODUTO/SERVIÇO   NCM/SH   CST/ CFOP UNID. QTD. VLR. UNIT. VLR. TOTAL\n"
+            "GR1-DIS   Item                          48131000  100  6102 UNID  3    140,00     500,00\n"
+        )
+        self.assertIsNone(extrair_linhas_produtos(texto))
+
+
+class ArquivoEnviado:
+    """Simula o FileStorage do Flask com o nome e o conteúdo de um arquivo"""
+
+    def __init__(self, caminho, filename=None):
+        self.filename = filename or os.path.basename(caminho)
+        self.stream = open(caminho, 'rb')
+
+    def read(self, *args):
+        return self.stream.read(*args)
+
+    def seek(self, *args):
+        return self.stream.seek(*args)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def close(self):
+        self.stream.close()
+
+
+class TestProcessamentoParalelo(unittest.TestCase):
+    """Testes para a leitura dos pdfs em paralelo"""
+
+    def setUp(self):
+        """Desliga o cache para que cada teste leia o pdf"""
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+        encerrar_pool_pdfs()
+
+    def test_paralelo_igual_ao_sequencial(self):
+        """O pool de processos devolve o mesmo dicionario que a leitura sequencial"""
+        tarefas = [(os.path.basename(pdf), pdf) for pdf in ITENS_ESPERADOS]
+
+        sequencial = processar_pdfs(tarefas, motor="pypdf", workers=1)
+        paralelo = processar_pdfs(tarefas, motor="pypdf", workers=2)
+
+        self.assertEqual(list(paralelo.keys()), ["2160", "2161", "2162"])
+        for codigo, itens in sequencial.items():
+            pd.testing.assert_frame_equal(paralelo[codigo], itens)
+
+    def test_pool_compartilhado_entre_chamadas(self):
+        """As leituras em paralelo reaproveitam o mesmo pool até ele ser encerrado"""
+        tarefas = [(os.path.basename(pdf), pdf) for pdf in ITENS_ESPERADOS]
+
+        processar_pdfs(tarefas, motor="pypdf", workers=2)
+        pool = obter_pool_pdfs(2)
+        processar_pdfs(tarefas, motor="pypdf", workers=2)
+
+        self.assertIs(obter_pool_pdfs(2), pool)
+        encerrar_pool_pdfs()
+        self.assertIsNot(obter_pool_pdfs(2), pool)
+
+    def test_paralelo_informa_erros(self):
+        """Um pdf com erro é informado e não interrompe o lote"""
+        arquivos = [ArquivoEnviado(PDF_2160), ArquivoEnviado(__file__, "quebrado.pdf"), ArquivoEnviado(PDF_2162)]
+        erros = []
+
+        try:
+            nfes = percorrer_lista_pdfs(arquivos, motor="pypdf", workers=2, erros=erros)
+        finally:
+            for arquivo in arquivos:
+                arquivo.close()
+
+        self.assertEqual(list(nfes.keys()), ["2160", "2162"])
+        self.assertEqual(len(erros), 1)
+        self.assertEqual(erros[0]["arquivo"], "quebrado.pdf")
+
+    def test_sequencial_sem_lista_de_erros_repassa_excecao(self):
+        """Sem a lista de erros o comportamento original (exceção) é mantido"""
+        with self.assertRaises(Exception):
+            processar_pdfs([("quebrado.pdf", __file__)], motor="pypdf", workers=1)
+
+
+class TestDocumentoPDF(unittest.TestCase):
+    """Testes para o documento que guarda os bytes do pdf uma única vez"""
+
+    def setUp(self):
+        os.environ['NFE_CACHE_ATIVO'] = '0'
+
+    def tearDown(self):
+        os.environ.pop('NFE_CACHE_ATIVO', None)
+
+    @patch('analise_nfe.pdfs.main.tabula.read_pdf')
+    def test_um_unico_reader_por_documento(self, mock_read_pdf):
+        """Contagem de páginas, tabelas e numero da nota usam o mesmo PdfReader e o mesmo arquivo"""
+        mock_read_pdf.return_value = criar_pagina_json([["GR1-DIS", "Item", "1"]])
+        arquivo = ArquivoEnviado(PDF_2160)
+
+        try:
+            with patch('analise_nfe.pdfs.documento.pyf.PdfReader', wraps=pyf.PdfReader) as mock_reader:
+                nfe = get_dados_nfe_by_pdf(arquivo, motor="tabula")
+        finally:
+            arquivo.close()
+
+        mock_reader.assert_called_once()
+        mock_read_pdf.assert_called_once()
+        self.assertEqual(nfe["codigo_nfe"], "2160")
+
+    def test_arquivo_enviado_copiado_uma_vez(self):
+        """O arquivo enviado é copiado para um temporário e o caminho do tabula é criado uma vez"""
+        arquivo = ArquivoEnviado(PDF_2160)
+        documento = DocumentoPDF(arquivo)
+        arquivo.close()
+
+        caminho = documento.caminho()
+
+        self.assertEqual(documento.caminho(), caminho)
+        self.assertEqual(documento.paginas, 1)
+        with open(PDF_2160, 'rb') as original, open(caminho, 'rb') as copia:
+            self.assertEqual(original.read(), copia.read())
+
+        documento.fechar()
+        self.assertFalse(os.path.exists(caminho))
+
+    def test_caminho_nao_e_copiado(self):
+        """Um pdf que já está no disco é passado direto para o tabula"""
+        documento = DocumentoPDF(PDF_2160)
+        with open(PDF_2160, 'rb') as arquivo:
+            em_memoria = DocumentoPDF(arquivo.read())
+
+        self.assertEqual(documento.caminho(), PDF_2160)
+        self.assertEqual(documento.sha256, em_memoria.sha256)
+        documento.fechar()
+        em_memoria.fechar()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+Testes unitários para o cruzamento das notas com a planilha de custos (analise_nfe/planilha)
+"""
+
+import unittest
+import io
+import contextlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.catalogo.main import montar_indice
+from analise_nfe.planilha.centavos import centavos_para_texto, converter_centavos_para_json
+from analise_nfe.planilha.main import create_planilhas_by_danfe, recupera_informacoes_sobre_as_nfe
+
+PLANILHA = pd.DataFrame({
+    "PRODUTOS": ["Bamboo", "Pink", "Pink repetido", "Blue"],
+    "Cod": ["GR02A-DIS", "GR06A-UD", "GR06A-UD", "GR05A-DIS"],
+    "CUSTO": [120.5, 10.0, 12.0, 117.57],
+})
+
+
+def criar_notas():
+    return {
+        "2160": pd.DataFrame({"Cod": ["GR02A-DIS", "NAO-EXISTE"], "QTDD": np.array([2, 1], dtype="int64"), "ITEM": ["Bamboo", "X"]}),
+        "2161": pd.DataFrame({"Cod": ["GR06A-UD", "GR05A-DIS"], "QTDD": ["", 3], "ITEM": ["Pink", "Blue"]}),
+        "2162": pd.DataFrame({"Cod": ["NAO-EXISTE"], "QTDD": [4], "ITEM": ["Y"]}),
+    }
+
+
+def recupera_por_nota(planilha_items, itens_danfe):
+    """Cruzamento original, com um merge por nota, usado como referência"""
+    dict_danfe = {}
+    for codigo, df_itens in itens_danfe.items():
+        df = pd.merge(df_itens, planilha_items, on='Cod', how='left')
+        df['QTDD'] = df['QTDD'].replace("", 0)
+        nao_encontrados = df[df["CUSTO"].isna()]
+        validos = df[df["CUSTO"].notna()]
+        if len(validos) == 0:
+            continue
+        validos["TOTAL"] = validos["QTDD"] * validos["CUSTO"]
+        validos = validos.reindex(columns=["ITEM", "Cod", "CUSTO", "QTDD", "TOTAL"]).reset_index(drop=True)
+        dict_danfe[codigo] = [validos, "{:.2f}".format(validos["TOTAL"].sum()), nao_encontrados]
+    return dict_danfe
+
+
+class TestRecuperaInformacoesSobreAsNfe(unittest.TestCase):
+    """Testes para o merge único de todas as notas"""
+
+    def executar(self, funcao, *args):
+        with contextlib.redirect_stdout(io.StringIO()), pd.option_context("mode.chained_assignment", None):
+            return funcao(*args)
+
+    def test_mesmo_resultado_do_merge_por_nota(self):
+        """O merge único tem o mesmo resultado de um merge por nota"""
+        esperado = self.executar(recupera_por_nota, PLANILHA, criar_notas())
+        resultado = self.executar(recupera_informacoes_sobre_as_nfe, PLANILHA, criar_notas())
+
+        self.assertEqual(list(resultado), list(esperado))
+        for codigo in esperado:
+            pd.testing.assert_frame_equal(resultado[codigo][0], esperado[codigo][0])
+            self.assertEqual(resultado[codigo][1], esperado[codigo][1])
+            pd.testing.assert_frame_equal(resultado[codigo][2], esperado[codigo][2])
+
+    def test_qtdd_object_sai_numerica(self):
+        """QTDD em object (como no pdf) sai em int64 e TOTAL em float64, iguais ao merge por nota das notas numéricas"""
+        notas_object = {codigo: df.astype({"QTDD": object}) for codigo, df in criar_notas().items()}
+        notas_numericas = {codigo: df.assign(QTDD=df["QTDD"].replace("", 0).astype("int64")) for codigo, df in criar_notas().items()}
+
+        esperado = self.executar(recupera_por_nota, PLANILHA, notas_numericas)
+        resultado = self.executar(recupera_informacoes_sobre_as_nfe, PLANILHA, notas_object)
+
+        self.assertEqual(list(resultado), list(esperado))
+        for codigo in esperado:
+            self.assertEqual(resultado[codigo][0]["QTDD"].dtype, np.int64)
+            self.assertEqual(resultado[codigo][0]["TOTAL"].dtype, np.float64)
+            pd.testing.assert_frame_equal(resultado[codigo][0], esperado[codigo][0])
+            self.assertEqual(resultado[codigo][1], esperado[codigo][1])
+            pd.testing.assert_frame_equal(resultado[codigo][2], esperado[codigo][2])
+
+    def test_indice_igual_ao_merge(self):
+        """Com o índice por "Cod" o resultado é o mesmo do merge, inclusive com códigos repetidos"""
+        esperado = self.executar(recupera_informacoes_sobre_as_nfe, PLANILHA, criar_notas())
+        resultado = self.executar(
+            recupera_informacoes_sobre_as_nfe, PLANILHA.iloc[:0], criar_notas(), "", False, montar_indice(PLANILHA)
+        )
+
+        self.assertEqual(list(resultado), list(esperado))
+        for codigo in esperado:
+            pd.testing.assert_frame_equal(resultado[codigo][0], esperado[codigo][0])
+            self.assertEqual(resultado[codigo][1], esperado[codigo][1])
+            pd.testing.assert_frame_equal(resultado[codigo][2], esperado[codigo][2])
+
+    def test_totais_por_nota(self):
+        """Códigos repetidos na planilha repetem o item, como no merge original"""
+        resultado = self.executar(recupera_informacoes_sobre_as_nfe, PLANILHA, criar_notas())
+
+        self.assertEqual(resultado["2160"][1], "241.00")
+        self.assertEqual(resultado["2161"][1], "352.71")
+        self.assertEqual(len(resultado["2161"][0]), 3)
+        self.assertEqual(list(resultado["2160"][2]["Cod"]), ["NAO-EXISTE"])
+        self.assertNotIn("2162", resultado)
+
+    def test_itens_sem_custo_no_log_debug(self):
+        """Os itens sem custo vão para o log em DEBUG (e não mais para o stdout)"""
+        with self.assertLogs("analise_nfe.planilha.main", level="DEBUG") as logs:
+            self.executar(recupera_informacoes_sobre_as_nfe, PLANILHA, criar_notas())
+
+        notas = [registro.nota for registro in logs.records]
+        self.assertEqual(notas, ["2160", "2162"])
+        self.assertEqual([item["Cod"] for item in logs.records[0].itens], ["NAO-EXISTE"])
+
+    def test_sem_notas(self):
+        """Sem notas o resultado é vazio"""
+        resultado = self.executar(create_planilhas_by_danfe, PLANILHA, {})
+
+        self.assertTrue(resultado["planilha_total_itens"].empty)
+        self.assertTrue(resultado["planilha_itens_nfe"].empty)
+
+
+class TestCreatePlanilhasByDanfe(unittest.TestCase):
+    """Testes para a montagem das planilhas de resultado"""
+
+    def test_planilhas_com_numero_da_nota(self):
+        """Itens e não encontrados de todas as notas ficam em um DataFrame cada, com numeroDaNota"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = create_planilhas_by_danfe(PLANILHA, criar_notas())
+
+        self.assertEqual(resultado["planilha_total_itens"].to_dict(orient="records"), [
+            {"numeroDaNota": "2160", "total": "241.00"},
+            {"numeroDaNota": "2161", "total": "352.71"},
+        ])
+
+        itens = resultado["planilha_itens_nfe"]
+        self.assertEqual(list(itens.columns), ["numeroDaNota", "ITEM", "Cod", "CUSTO", "QTDD", "TOTAL"])
+        self.assertEqual(list(itens["numeroDaNota"]), ["2160", "2161", "2161", "2161"])
+
+        nao_encontrados = resultado["planilha_itens_nao_encontrados"]
+        self.assertEqual(nao_encontrados[["numeroDaNota", "Cod"]].to_dict(orient="records"), [
+            {"numeroDaNota": "2160", "Cod": "NAO-EXISTE"},
+        ])
+
+
+class TestModoCentavos(unittest.TestCase):
+    """Testes para o modo com valores em centavos inteiros"""
+
+    def criar_planilhas(self, notas, planilha=PLANILHA):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return create_planilhas_by_danfe(planilha, notas, centavos=True)
+
+    def test_colunas_inteiras_ate_a_resposta(self):
+        """Custos, quantidades e totais ficam em int64 e viram decimal só na conversão para JSON"""
+        resultado = self.criar_planilhas(criar_notas())
+
+        itens = resultado["planilha_itens_nfe"]
+        self.assertEqual(list(itens.columns), ["numeroDaNota", "ITEM", "Cod", "CUSTO_CENTAVOS", "QTDD_ESCALADA", "TOTAL_CENTAVOS"])
+        self.assertTrue(all(itens[coluna].dtype == np.int64 for coluna in ["CUSTO_CENTAVOS", "QTDD_ESCALADA", "TOTAL_CENTAVOS"]))
+        self.assertEqual(list(resultado["planilha_total_itens"]["total_centavos"]), [24100, 35271])
+
+        json_itens = converter_centavos_para_json(itens).to_dict(orient="records")
+        self.assertEqual(json_itens[0], {
+            "numeroDaNota": "2160", "ITEM": "Bamboo", "Cod": "GR02A-DIS", "CUSTO": "120.50", "QTDD": 2, "TOTAL": "241.00",
+        })
+        self.assertEqual(
+            converter_centavos_para_json(resultado["planilha_total_itens"]).to_dict(orient="records"),
+            [{"numeroDaNota": "2160", "total": "241.00"}, {"numeroDaNota": "2161", "total": "352.71"}],
+        )
+
+    def test_total_exato(self):
+        """Meio centavo é arredondado para cima e a soma de muitos itens é exata"""
+        planilha = pd.DataFrame({"Cod": ["A", "B"], "CUSTO": [0.33, 0.1]})
+        notas = {
+            "1": pd.DataFrame({"Cod": ["A"], "QTDD": [1.5], "ITEM": ["a"]}),
+            "2": pd.DataFrame({"Cod": ["B"] * 10000, "QTDD": [3] * 10000, "ITEM": ["b"] * 10000}),
+        }
+
+        totais = self.criar_planilhas(notas, planilha)["planilha_total_itens"]
+
+        self.assertEqual(list(totais["total_centavos"]), [50, 300000])
+
+    def test_centavos_para_texto(self):
+        """A conversão para texto não passa por float"""
+        texto = centavos_para_texto(pd.Series([0, 5, 24100, 123456789012345, -150]))
+
+        self.assertEqual(list(texto), ["0.00", "0.05", "241.00", "1234567890123.45", "-1.50"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+"""
+Testes unitários para a leitura da planilha de custos (analise_nfe/produtos)
+"""
+
+import unittest
+from unittest.mock import patch
+import importlib.util
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.nfe_xml.main import get_dados_nfe_by_xml
+from analise_nfe.pdfs.main import montar_df_tabela
+from analise_nfe.planilha.main import create_planilhas_by_danfe
+from analise_nfe.produtos.blocos import DetectorDuplicados, recuperar_planilhas_em_blocos
+from analise_nfe.produtos.main import (
+    carregar_planilha,
+    formatar_custo,
+    formato_planilha,
+    normalizar_codigos,
+    normalizar_custos,
+    recuperar_planilhas,
+)
+
+from tests.test_nfe_xml import criar_xml_nfe
+
+CSV_CUSTOS = "PRODUTOS,Cod,CUSTO,ESTOQUE\nBamboo,007,\"120,50\",3\nPink,GR06A-UD,\"1.500,00\",\n".encode()
+
+
+class TestNormalizarCustos(unittest.TestCase):
+    """Testes para a normalização vetorizada da coluna CUSTO"""
+
+    def test_mesmo_resultado_de_formatar_custo(self):
+        """A versão vetorizada tem o mesmo resultado da versão por linha"""
+        valores = ["1.500,00", "120,50", "R$ 10", "1500.00", "1500", np.nan, " R$ 1.234,5 ", "abc"]
+
+        custos, _ = normalizar_custos(pd.Series(valores, dtype=object))
+
+        self.assertEqual(list(custos), [formatar_custo(valor) for valor in valores])
+        self.assertEqual(list(custos)[:6], [1500.0, 120.5, 10.0, 1500.0, 1500.0, 0.0])
+
+    def test_ponto_decimal_com_virgula_de_milhar(self):
+        """Com ponto e vírgula o último separador é o decimal ("1,500.00" é 1500.0 e não 1.5)"""
+        valores = ["1,500.00", "1.500,00", "12,345,678.9", "1.234.567,89", "1,5", "1,500"]
+
+        custos, invalidos = normalizar_custos(pd.Series(valores, dtype=object))
+
+        self.assertEqual(list(custos), [1500.0, 1500.0, 12345678.9, 1234567.89, 1.5, 1.5])
+        self.assertEqual(list(custos), [formatar_custo(valor) for valor in valores])
+        self.assertFalse(invalidos.any())
+
+    def test_custos_invalidos(self):
+        """Valores que não são números são informados, vazios não"""
+        _, invalidos = normalizar_custos(pd.Series(["10,00", "abc", np.nan, "1.2.3"], dtype=object))
+
+        self.assertEqual(list(invalidos), [False, True, False, True])
+
+    def test_coluna_numerica(self):
+        """Colunas já numéricas são apenas arredondadas"""
+        custos, invalidos = normalizar_custos(pd.Series([1.005, 2.5, np.nan]))
+
+        self.assertEqual(list(custos), [round(1.005, 2), 2.5, 0.0])
+        self.assertFalse(invalidos.any())
+
+    def test_recuperar_planilhas_informa_custos_invalidos(self):
+        """As linhas com custo inválido voltam com o valor original em custosInvalidos"""
+        planilha = pd.DataFrame({"Cod": ["A", "B", "C"], "CUSTO": ["1.500,00", "sem preço", np.nan]})
+
+        resposta = recuperar_planilhas(planilha)
+
+        self.assertEqual(resposta["codigo"], 200)
+        self.assertEqual(list(resposta["planilha"]["CUSTO"]), [1500.0, 0.0, 0.0])
+        self.assertEqual(resposta["custosInvalidos"].to_dict(orient="records"), [{"Cod": "B", "CUSTO": "sem preço"}])
+
+
+class TestNormalizarCodigos(unittest.TestCase):
+    """Testes para a chave dos códigos, a mesma na planilha e nas notas"""
+
+    def test_codigos_numericos(self):
+        """Códigos só com dígitos perdem os zeros à esquerda e as casas zeradas, os outros só os espaços"""
+        codigos = pd.Series(["0123", " 123 ", 123, 123.0, "000", "GR02A-DIS", "12.50"], dtype=object)
+
+        self.assertEqual(list(normalizar_codigos(codigos)), ["123", "123", "123", "123", "0", "GR02A-DIS", "12.50"])
+
+    def test_codigo_com_zero_a_esquerda_encontra_a_nota(self):
+        """Um "Cod" "0123" da planilha encontra o mesmo código no pdf (lido como número) e no xml"""
+        planilha = recuperar_planilhas(carregar_planilha(io.BytesIO(b'Cod,CUSTO\n0123,"10,00"\n'), "custos.csv"))["planilha"]
+        tabela_pdf = montar_df_tabela([["CÓDIGO", "DESCRIÇÃO DO PRODUTO/SERVIÇO", "QTD."], ["0123", "Item", "2"]])
+        nfe = get_dados_nfe_by_xml(io.BytesIO(criar_xml_nfe("1", [("0123", "2.0000", "Item")])))
+
+        self.assertEqual(list(planilha["Cod"]), ["123"])
+        self.assertEqual(list(normalizar_codigos(tabela_pdf["CÓDIGO"].map(str))), ["123"])
+        self.assertEqual(list(nfe["itens"]["Cod"]), ["123"])
+
+        resposta = create_planilhas_by_danfe(planilha, {"1": nfe["itens"]})
+        self.assertTrue(resposta["planilha_itens_nao_encontrados"].empty)
+        self.assertEqual(resposta["planilha_total_itens"]["total"].tolist(), ["20.00"])
+
+
+class TestCarregarPlanilha(unittest.TestCase):
+    """Testes para a leitura da planilha de custos em csv, parquet e xlsx"""
+
+    def test_csv_apenas_colunas_usadas(self):
+        """Somente PRODUTOS, Cod e CUSTO são lidas, como texto"""
+        planilha = carregar_planilha(io.BytesIO(CSV_CUSTOS), "custos.csv")
+
+        self.assertEqual(list(planilha.columns), ["PRODUTOS", "Cod", "CUSTO"])
+        self.assertEqual(list(planilha["Cod"]), ["007", "GR06A-UD"])
+        self.assertEqual(list(recuperar_planilhas(planilha)["planilha"]["CUSTO"]), [120.5, 1500.0])
+
+    def test_csv_sem_coluna_produtos(self):
+        """A coluna PRODUTOS é opcional"""
+        planilha = carregar_planilha(io.BytesIO(b"Cod,CUSTO\nA,10\n"), "custos.csv")
+
+        self.assertEqual(list(planilha.columns), ["Cod", "CUSTO"])
+
+    @patch.dict(os.environ, {"NFE_CSV_MOTOR": "python"})
+    def test_motor_configurado(self):
+        """NFE_CSV_MOTOR escolhe o motor do pd.read_csv"""
+        with patch("analise_nfe.produtos.main.pd.read_csv", wraps=pd.read_csv) as read_csv:
+            carregar_planilha(io.BytesIO(CSV_CUSTOS), "custos.csv")
+
+        self.assertEqual(read_csv.call_args.kwargs["engine"], "python")
+
+    def test_formatos_suportados(self):
+        """O formato vem da extensão do arquivo"""
+        self.assertEqual(formato_planilha("Custos.CSV"), ".csv")
+        self.assertEqual(formato_planilha("custos.parquet"), ".parquet")
+        self.assertEqual(formato_planilha("custos.xlsx"), ".xlsx")
+        self.assertIsNone(formato_planilha("custos.txt"))
+        self.assertIsNone(formato_planilha(None))
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow não instalado")
+    def test_parquet(self):
+        """Parquet é lido apenas com as colunas usadas"""
+        arquivo = io.BytesIO()
+        pd.read_csv(io.BytesIO(CSV_CUSTOS), dtype=str).to_parquet(arquivo)
+        arquivo.seek(0)
+
+        planilha = carregar_planilha(arquivo, "custos.parquet")
+
+        self.assertEqual(list(planilha.columns), ["PRODUTOS", "Cod", "CUSTO"])
+        self.assertEqual(list(planilha["Cod"]), ["007", "GR06A-UD"])
+
+    @unittest.skipUnless(importlib.util.find_spec("openpyxl"), "openpyxl não instalado")
+    def test_xlsx(self):
+        """Xlsx é lido apenas com as colunas usadas, com "Cod" como texto"""
+        arquivo = io.BytesIO()
+        pd.read_csv(io.BytesIO(CSV_CUSTOS), dtype=str).to_excel(arquivo, index=False)
+        arquivo.seek(0)
+
+        planilha = carregar_planilha(arquivo, "custos.xlsx")
+
+        self.assertEqual(list(planilha.columns), ["PRODUTOS", "Cod", "CUSTO"])
+        self.assertEqual(list(planilha["Cod"]), ["007", "GR06A-UD"])
+
+
+class TestRecuperarPlanilhasEmBlocos(unittest.TestCase):
+    """Testes para a leitura em blocos de planilhas grandes"""
+
+    CSV = (
+        "PRODUTOS,Cod,CUSTO,ESTOQUE\n"
+        "Bamboo,GR02A-DIS,\"120,50\",1\n"
+        "Pink,GR06A-UD,\"1.500,00\",2\n"
+        "Outro,SKU1,sem preço,3\n"
+        "Pink 2,GR06A-UD,\"99,00\",4\n"
+        "Mais um,SKU2,\"5,00\",5\n"
+    ).encode()
+
+    def test_mesmo_resultado_de_recuperar_planilhas(self):
+        """Com blocos pequenos e hashes em disco o resultado é o mesmo, só com os códigos das notas"""
+        codigos = {"GR06A-UD", "SKU2", "NAO-EXISTE"}
+
+        resposta = recuperar_planilhas_em_blocos(io.BytesIO(self.CSV), codigos, linhas_bloco=2, memoria_maxima_mb=1e-6)
+        esperado = recuperar_planilhas(carregar_planilha(io.BytesIO(self.CSV)))
+
+        self.assertEqual(resposta["codigo"], 203)
+        pd.testing.assert_frame_equal(
+            resposta["planilha"],
+            esperado["planilha"][esperado["planilha"]["Cod"].isin(codigos)].reset_index(drop=True),
+        )
+        pd.testing.assert_frame_equal(resposta["planilhaDuplicados"], esperado["planilhaDuplicados"])
+        pd.testing.assert_frame_equal(resposta["custosInvalidos"], esperado["custosInvalidos"].reset_index(drop=True))
+
+    def test_sem_duplicados(self):
+        """Sem "Cod" repetidos a resposta é 200 e o csv é lido uma única vez"""
+        csv = b"Cod,CUSTO\nA,1\nB,2\nC,3\n"
+
+        with patch("analise_nfe.produtos.blocos.recuperar_duplicados") as recuperar_duplicados:
+            resposta = recuperar_planilhas_em_blocos(io.BytesIO(csv), {"B"}, linhas_bloco=1)
+
+        self.assertEqual(resposta["codigo"], 200)
+        self.assertEqual(resposta["planilha"].to_dict(orient="records"), [{"Cod": "B", "CUSTO": 2.0}])
+        recuperar_duplicados.assert_not_called()
+
+    def test_colunas_faltando(self):
+        """Sem a coluna CUSTO a planilha é recusada antes da leitura"""
+        resposta = recuperar_planilhas_em_blocos(io.BytesIO(b"PRODUTOS,Cod\nA,B\n"), {"B"})
+
+        self.assertEqual(resposta["codigo"], 404)
+
+    def test_detector_com_hashes_em_disco(self):
+        """Os repetidos são encontrados mesmo quando os hashes passam do limite de memória"""
+        detector = DetectorDuplicados(memoria_maxima=16)
+        try:
+            detector.adicionar(np.array([1, 2, 2 ** 63 + 5], dtype=np.uint64))
+            detector.adicionar(np.array([3, 2 ** 63 + 5], dtype=np.uint64))
+            detector.adicionar(np.array([1], dtype=np.uint64))
+
+            self.assertIsNotNone(detector.pasta)
+            self.assertEqual(detector.duplicados(), {1, 2 ** 63 + 5})
+        finally:
+            detector.fechar()
+
+        self.assertIsNone(detector.pasta)
+
+
+if __name__ == '__main__':
+    unittest.main()
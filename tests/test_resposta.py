@@ -0,0 +1,103 @@
+"""
+Testes unitários para a codificação JSON das respostas (analise_nfe/resposta/main.py)
+"""
+
+import unittest
+from unittest.mock import patch
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.resposta.main import codificar_resposta, orjson
+
+
+def criar_itens():
+    return pd.DataFrame({
+        "numeroDaNota": ["2162", "2162"],
+        "Cod": ["GR02A-DIS", "GR99"],
+        "CUSTO": [120.5, np.nan],
+        "QTDD": np.array([2, 1], dtype=np.int64),
+        "SUGESTOES": [["GR02A-DIS"], []],
+        "PRODUTOS": ["G-ROLLZ | Bamboo Unbleached", None],
+    })
+
+
+class TestCodificarResposta(unittest.TestCase):
+    """Testes para codificar_resposta com o orjson e com o json da biblioteca padrão"""
+
+    def codificar(self, resposta, formato="registros"):
+        return json.loads(codificar_resposta(resposta, formato))
+
+    def test_registros_iguais_ao_to_dict(self):
+        """Os registros são os mesmos do to_dict, com NaN e None como null"""
+        itens = criar_itens()
+
+        resposta = self.codificar({"planilha_itens_nfe": itens, "pdfs_com_erro": []})
+
+        esperado = itens.astype(object).where(itens.notna(), None).to_dict(orient="records")
+        self.assertEqual(resposta["planilha_itens_nfe"], esperado)
+        self.assertIsNone(resposta["planilha_itens_nfe"][1]["CUSTO"])
+        self.assertEqual(resposta["pdfs_com_erro"], [])
+
+    def test_formato_colunas(self):
+        """No formato "colunas" os nomes aparecem uma vez e cada linha é uma lista"""
+        resposta = self.codificar({"planilha_itens_nfe": criar_itens()}, "colunas")
+
+        self.assertEqual(resposta["planilha_itens_nfe"]["columns"], list(criar_itens().columns))
+        self.assertEqual(
+            resposta["planilha_itens_nfe"]["data"],
+            [
+                ["2162", "GR02A-DIS", 120.5, 2, ["GR02A-DIS"], "G-ROLLZ | Bamboo Unbleached"],
+                ["2162", "GR99", None, 1, [], None],
+            ],
+        )
+
+    def test_quadro_vazio(self):
+        """DataFrames vazios viram [] (registros) ou colunas sem linhas"""
+        vazio = pd.DataFrame(columns=["numeroDaNota"])
+
+        self.assertEqual(self.codificar({"a": vazio})["a"], [])
+        self.assertEqual(self.codificar({"a": vazio}, "colunas")["a"], {"columns": ["numeroDaNota"], "data": []})
+
+    def test_tipos_do_numpy_em_colunas_object(self):
+        """Valores do numpy dentro de colunas object viram números do JSON"""
+        df = pd.DataFrame({"QTDD": pd.Series([np.int64(3), "", np.float64(1.5)], dtype=object)})
+
+        self.assertEqual(self.codificar({"a": df})["a"], [{"QTDD": 3}, {"QTDD": ""}, {"QTDD": 1.5}])
+
+    def test_sem_orjson(self):
+        """Sem o orjson o json da biblioteca padrão gera o mesmo documento"""
+        resposta = {"planilha_itens_nfe": criar_itens(), "pdfs_com_erro": [{"arquivo": "nota.pdf", "erro": "ação"}]}
+
+        with patch("analise_nfe.resposta.main.orjson", None):
+            padrao = self.codificar(resposta)
+            colunas = self.codificar(resposta, "colunas")
+
+        self.assertEqual(padrao, self.codificar(resposta))
+        self.assertEqual(colunas, self.codificar(resposta, "colunas"))
+
+    def test_objeto_desconhecido_gera_erro(self):
+        """Objetos sem conversão para JSON geram TypeError (e não viram texto na resposta)"""
+        resposta = {"planilha_itens_nfe": pd.DataFrame({"Cod": [object()]})}
+
+        with self.assertRaises(TypeError):
+            codificar_resposta(resposta)
+        with patch("analise_nfe.resposta.main.orjson", None), self.assertRaises(TypeError):
+            codificar_resposta(resposta)
+
+    @unittest.skipUnless(orjson, "orjson não instalado")
+    def test_precisao_dos_floats(self):
+        """Os floats mantêm a representação mais curta e exata, como no json padrão"""
+        df = pd.DataFrame({"TOTAL": [0.1 + 0.2, 241.0]})
+
+        self.assertEqual(codificar_resposta({"a": df}), b'{"a":[{"TOTAL":0.30000000000000004},{"TOTAL":241.0}]}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Testes unitários para as sugestões de códigos dos itens não encontrados
+"""
+
+import unittest
+import os
+import sys
+
+import pandas as pd
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.sugestoes.main import (
+    IndiceCodigos,
+    adicionar_sugestoes,
+    chaves_codigo,
+    obter_indice_codigos,
+)
+
+CODIGOS = ["GR02A-DIS", "GR06A-UD", "GR1521H-DIS", "GR1521G-DIS", "GR306A-DIS", "GR 77B"]
+
+
+class TestChavesCodigo(unittest.TestCase):
+    """Testes para a normalização dos códigos"""
+
+    def test_maiusculas_separadores_e_quebra_de_linha(self):
+        """Maiúsculas, traços, espaços e "\\r" não mudam a chave"""
+        self.assertEqual(chaves_codigo("gr06a-ud"), ("GR06AUD", "GR06A"))
+        self.assertEqual(chaves_codigo("GR 06A\rUD"), ("GR06AUD", "GR06A"))
+
+    def test_codigo_so_com_sufixo(self):
+        """Um código que é só o sufixo mantém a chave inteira"""
+        self.assertEqual(chaves_codigo("DIS"), ("DIS", "DIS"))
+
+
+class TestIndiceCodigos(unittest.TestCase):
+    """Testes para o IndiceCodigos"""
+
+    def setUp(self):
+        self.indice = IndiceCodigos(CODIGOS)
+
+    def test_chave_normalizada_igual(self):
+        """Mesma chave normalizada é a primeira sugestão, com semelhança 1.0"""
+        self.assertEqual(self.indice.sugerir("gr06a_ud")[0], ("GR06A-UD", 1.0))
+        self.assertEqual(self.indice.sugerir("gr77b")[0], ("GR 77B", 1.0))
+
+    def test_sufixo_diferente(self):
+        """Sem o sufixo (ou com outro sufixo) o código ainda é encontrado"""
+        self.assertEqual(self.indice.sugerir("GR1521H")[0], ("GR1521H-DIS", 0.95))
+        self.assertEqual(self.indice.sugerir("GR02A-UD")[0], ("GR02A-DIS", 0.95))
+
+    def test_ngramas_ordenados_pela_semelhanca(self):
+        """Códigos parecidos são ordenados pela semelhança dos n-gramas"""
+        sugestoes = self.indice.sugerir("GR1521X-DIS")
+
+        self.assertCountEqual([codigo for codigo, _ in sugestoes[:2]], ["GR1521G-DIS", "GR1521H-DIS"])
+        self.assertGreaterEqual(sugestoes[0][1], sugestoes[-1][1])
+        self.assertLessEqual(len(sugestoes), 3)
+
+    def test_sem_codigos_parecidos(self):
+        """Códigos sem nada em comum não recebem sugestões"""
+        self.assertEqual(self.indice.sugerir("XYZ"), [])
+        self.assertEqual(self.indice.sugerir(""), [])
+        self.assertEqual(IndiceCodigos([]).sugerir("GR02A"), [])
+
+    def test_limite(self):
+        """O limite define a quantidade máxima de sugestões"""
+        self.assertEqual(len(self.indice.sugerir("GR1521X-DIS", limite=1)), 1)
+
+
+class TestAdicionarSugestoes(unittest.TestCase):
+    """Testes para adicionar_sugestoes e obter_indice_codigos"""
+
+    def test_coluna_sugestoes(self):
+        """Cada item não encontrado recebe a lista de códigos sugeridos"""
+        df = pd.DataFrame({"Cod": ["gr02a", "XYZ", "gr02a"], "QTDD": [1, 2, 3]})
+
+        resultado = adicionar_sugestoes(df, IndiceCodigos(CODIGOS), limite=2)
+
+        self.assertEqual(resultado["SUGESTOES"].tolist()[0][0], "GR02A-DIS")
+        self.assertEqual(resultado["SUGESTOES"].tolist()[1], [])
+        self.assertEqual(resultado["SUGESTOES"].tolist()[0], resultado["SUGESTOES"].tolist()[2])
+        self.assertNotIn("SUGESTOES", df.columns)
+
+    def test_sem_itens(self):
+        """Sem itens não encontrados a coluna é criada vazia"""
+        resultado = adicionar_sugestoes(pd.DataFrame(columns=["numeroDaNota"]), IndiceCodigos(CODIGOS))
+
+        self.assertIn("SUGESTOES", resultado.columns)
+        self.assertTrue(resultado.empty)
+
+    def test_indice_reaproveitado(self):
+        """A mesma planilha reaproveita o índice já montado"""
+        planilha = pd.DataFrame({"Cod": CODIGOS, "CUSTO": range(len(CODIGOS))})
+
+        indice = obter_indice_codigos(planilha)
+
+        self.assertIs(obter_indice_codigos(planilha.copy()), indice)
+        self.assertIsNot(obter_indice_codigos(planilha.iloc[1:]), indice)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Testes unitários para o processo auxiliar que mantém o tabula carregado
+"""
+
+import unittest
+from unittest.mock import patch
+import multiprocessing as mp
+import os
+import sys
+import threading
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.pdfs.tabula_worker import WorkerTabula, executar_worker, modo_tabula, worker_tabula_ativo
+
+
+class TestExecutarWorker(unittest.TestCase):
+    """Testes para o laço do processo auxiliar"""
+
+    @patch('tabula.read_pdf')
+    def test_responde_pedidos_ate_fechar(self, mock_read_pdf):
+        """Cada pedido recebe o resultado do tabula, erros voltam como mensagem"""
+        mock_read_pdf.side_effect = [["tabela"], ValueError("pdf vazio")]
+        conexao, conexao_worker = mp.Pipe()
+        thread = threading.Thread(target=executar_worker, args=(conexao_worker,))
+        thread.start()
+
+        conexao.send(("nota.pdf", {"pages": 1}))
+        self.assertEqual(conexao.recv(), (True, ["tabela"]))
+
+        conexao.send(("nota.pdf", {"pages": 2}))
+        sucesso, mensagem = conexao.recv()
+        self.assertFalse(sucesso)
+        self.assertIn("pdf vazio", mensagem)
+
+        conexao.close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        mock_read_pdf.assert_called_with("nota.pdf", pages=2)
+
+    def test_pedido_do_modo(self):
+        """Um pedido sem caminho recebe o modo do tabula no processo"""
+        conexao, conexao_worker = mp.Pipe()
+        thread = threading.Thread(target=executar_worker, args=(conexao_worker,))
+        thread.start()
+
+        with patch('tabula.io._tabula_vm', None):
+            conexao.send((None, {}))
+            self.assertEqual(conexao.recv(), (True, "subprocess"))
+
+        conexao.close()
+        thread.join(5)
+
+    def test_modo_jpype(self):
+        """Com a JVM dentro do processo (TabulaVm) o modo é jpype"""
+        from tabula.backend import SubprocessTabula, TabulaVm
+
+        with patch('tabula.io._tabula_vm', TabulaVm.__new__(TabulaVm)):
+            self.assertEqual(modo_tabula(), "jpype")
+        with patch('tabula.io._tabula_vm', SubprocessTabula.__new__(SubprocessTabula)):
+            self.assertEqual(modo_tabula(), "subprocess")
+
+
+class TestAquecerTabula(unittest.TestCase):
+    """Testes para o aquecimento do processo auxiliar"""
+
+    @patch.object(WorkerTabula, 'modo', return_value="subprocess")
+    @patch.object(WorkerTabula, 'read_pdf')
+    def test_modo_subprocess_e_erro(self, mock_read_pdf, mock_modo):
+        """Sem o jpype o aquecimento acusa erro em vez de aceitar um java novo a cada leitura"""
+        with self.assertRaises(RuntimeError) as contexto:
+            WorkerTabula().aquecer("nota.pdf")
+
+        self.assertIn("jpype1", str(contexto.exception))
+        mock_read_pdf.assert_called_once_with("nota.pdf", pages=1, lattice=True, output_format="json")
+
+    @patch.object(WorkerTabula, 'modo', return_value="jpype")
+    @patch.object(WorkerTabula, 'read_pdf')
+    def test_modo_jpype_aquece(self, mock_read_pdf, mock_modo):
+        """Com a JVM carregada no processo auxiliar o aquecimento termina sem erro"""
+        WorkerTabula().aquecer("nota.pdf")
+
+        mock_modo.assert_called_once_with()
+
+
+class TestWorkerTabula(unittest.TestCase):
+    """Testes para o processo auxiliar real"""
+
+    def setUp(self):
+        self.worker = WorkerTabula(tempo_limite=60)
+
+    def tearDown(self):
+        self.worker.parar()
+
+    def test_erro_e_reinicio(self):
+        """Erros do tabula são repassados e o processo é reiniciado quando morre"""
+        with self.assertRaises(RuntimeError):
+            self.worker.read_pdf("/nao/existe.pdf", pages=1)
+
+        primeiro_processo = self.worker.processo.pid
+        self.worker.processo.kill()
+        self.worker.processo.join()
+
+        with self.assertRaises(RuntimeError) as contexto:
+            self.worker.read_pdf("/nao/existe.pdf", pages=1)
+
+        self.assertIn("FileNotFoundError", str(contexto.exception))
+        self.assertNotEqual(self.worker.processo.pid, primeiro_processo)
+        self.assertEqual(self.worker.reinicios, 1)
+
+    def test_desligado_por_padrao(self):
+        """Sem NFE_TABULA_WORKER=1 o tabula é chamado direto"""
+        os.environ.pop('NFE_TABULA_WORKER', None)
+        self.assertFalse(worker_tabula_ativo())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Testes unitários para os arquivos enviados gravados em memória ou no disco (analise_nfe/uploads/main.py)
+"""
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Adiciona o diretório raiz ao path para importar o módulo
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from analise_nfe.uploads.main import ArquivoUpload, PastaUploads, caminho_upload
+
+
+class TestArquivoUpload(unittest.TestCase):
+    """Testes para o ArquivoUpload e a PastaUploads"""
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.pasta = PastaUploads(memoria_maxima=10, base=self.base)
+
+    def tearDown(self):
+        self.pasta.remover()
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def test_fica_em_memoria_ate_o_limite_da_requisicao(self):
+        """Os arquivos ficam em memória enquanto a soma da requisição couber em memoria_maxima"""
+        primeiro = ArquivoUpload(self.pasta, 100, "a.xml")
+        primeiro.write(b"123456")
+        segundo = ArquivoUpload(self.pasta, 100, "b.xml")
+        segundo.write(b"1234")
+
+        self.assertIsNone(primeiro.caminho)
+        self.assertIsNone(segundo.caminho)
+        self.assertFalse(os.listdir(self.base))
+
+        # Passa da memória da requisição: o segundo arquivo vai para o disco com o que já foi escrito
+        segundo.write(b"5")
+        segundo.seek(0)
+
+        self.assertTrue(os.path.isfile(segundo.caminho))
+        self.assertEqual(segundo.read(), b"12345")
+        self.assertEqual(self.pasta.bytes_memoria, 6)
+
+    def test_close_remove_o_arquivo_e_libera_a_memoria(self):
+        em_memoria = ArquivoUpload(self.pasta, 100, "a.xml")
+        em_memoria.write(b"123")
+        no_disco = ArquivoUpload(self.pasta, 100, "b.pdf")
+        no_disco.write(b"x" * 20)
+        caminho = no_disco.caminho
+
+        em_memoria.close()
+        no_disco.close()
+
+        self.assertEqual(self.pasta.bytes_memoria, 0)
+        self.assertFalse(os.path.exists(caminho))
+
+        self.pasta.remover()
+        self.assertEqual(os.listdir(self.base), [])
+
+    def test_arquivo_maior_que_o_limite(self):
+        """Passar do tamanho máximo interrompe o envio com 413"""
+        arquivo = ArquivoUpload(self.pasta, 8, "grande.pdf")
+        arquivo.write(b"1234")
+
+        with self.assertRaises(RequestEntityTooLarge) as contexto:
+            arquivo.write(b"56789")
+
+        self.assertIn("grande.pdf", contexto.exception.description)
+
+    def test_caminho_upload(self):
+        """caminho_upload aceita o ArquivoUpload ou um FileStorage com ele no stream"""
+        arquivo = ArquivoUpload(self.pasta, 100, "b.pdf")
+        arquivo.write(b"x" * 20)
+
+        class FileStorage:
+            stream = arquivo
+
+        self.assertEqual(caminho_upload(FileStorage()), arquivo.caminho)
+        self.assertIsNone(caminho_upload(open(os.devnull, "rb")))
+
+
+if __name__ == '__main__':
+    unittest.main()